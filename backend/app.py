@@ -1,11 +1,26 @@
-from flask import Flask, request, jsonify, send_from_directory, session
+from flask import Flask, request, jsonify, send_from_directory, send_file, session, Response, stream_with_context
 from flask_cors import CORS
 import os
-from models.inference import detect_referee, detect_signal
+import io
+import json
+import itertools
+import mimetypes
+import shutil
+import tarfile
+import tempfile
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from models.inference import (detect_referee, detect_signal, analyze_image, analyze_images, get_scheduler_stats,
+                              preload_models, models_ready, model_status, stage_metrics, model_fingerprint,
+                              referee_crop, INFERENCE_BATCH_SIZE)
 import cv2
 import numpy as np
 from datetime import datetime
 import hashlib
+from dataset_store import DatasetStore
+from hash_registry import HashRegistry
+from lru_cache import LRUCache
+from result_cache import ResultCache
 
 app = Flask(__name__)
 CORS(app)
@@ -20,8 +35,21 @@ SIGNALS_FOLDER = os.path.join('static', 'signals')
 REFEREE_TRAINING_DATA_FOLDER = os.path.join('data', 'referee_training_data')
 SIGNAL_TRAINING_DATA_FOLDER = os.path.join('data', 'signal_training_data')
 
-# Path for the image hash registry
+# Path for the image hash registry (the text file is the legacy format, migrated on first start)
 IMAGE_HASH_REGISTRY = os.path.join('data', 'image_hashes.txt')
+IMAGE_HASH_DB = os.path.join('data', 'image_hashes.sqlite3')
+
+# Confirmed training samples: 'shards' appends them to tar shards indexed by an SQLite manifest in
+# DATASET_STORE_FOLDER (see dataset_store.py, which also exports them to the YOLO folder layout);
+# 'files' writes one PNG plus one YOLO .txt per sample into the training data folders
+TRAINING_DATA_STORE = os.environ.get('TRAINING_DATA_STORE', 'shards')
+DATASET_STORE_FOLDER = os.path.join('data', 'dataset')
+
+# Model results keyed by image content hash, model weights hash and CONFIDENCE_THRESHOLD, so the
+# same frame uploaded again skips the model (RESULT_CACHE=0 disables it)
+RESULT_CACHE = os.environ.get('RESULT_CACHE', '1') != '0'
+RESULT_CACHE_DB = os.path.join('data', 'inference_cache.sqlite3')
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get('RESULT_CACHE_MAX_ENTRIES', '100000'))
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
@@ -31,26 +59,239 @@ os.makedirs(SIGNALS_FOLDER, exist_ok=True)
 os.makedirs(REFEREE_TRAINING_DATA_FOLDER, exist_ok=True)
 os.makedirs(SIGNAL_TRAINING_DATA_FOLDER, exist_ok=True)
 
-# Ensure the hash registry file exists
-if not os.path.exists(IMAGE_HASH_REGISTRY):
-    with open(IMAGE_HASH_REGISTRY, 'w') as f:
-        pass # Create an empty file if it doesn't exist
+# Load the hash registry once at startup
+hash_registry = HashRegistry(IMAGE_HASH_DB, legacy_path=IMAGE_HASH_REGISTRY)
+
+result_cache = ResultCache(RESULT_CACHE_DB, RESULT_CACHE_MAX_ENTRIES) if RESULT_CACHE else None
+
+# Hash, dimensions and decoded pixels of recent uploads, keyed by upload filename
+HASH_CHUNK_SIZE = 1024 * 1024
+UPLOAD_CACHE_MAX_BYTES = 512 * 1024 * 1024
+upload_cache = LRUCache(UPLOAD_CACHE_MAX_BYTES)
+
+# Resized referee crops keyed by crop filename (temp_crop_*, referee_auto_*, referee_manual_*),
+# so the signal model and the crop image endpoints get the array without a PNG round trip.
+# Crops that aren't saved as training samples are also written behind to CROPS_FOLDER, so a
+# confirm still finds them after eviction or when it lands on another worker process
+CROP_CACHE_MAX_BYTES = 256 * 1024 * 1024
+crop_cache = LRUCache(CROP_CACHE_MAX_BYTES)
+
+# Training samples are written in the background; requests don't wait for PNG encoding
+disk_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='disk-writer')
+
+# A single writer keeps store appends in request order, so a signal sample finds the referee
+# crop it reuses already stored
+dataset_store = DatasetStore(DATASET_STORE_FOLDER) if TRAINING_DATA_STORE == 'shards' else None
+dataset_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='dataset-writer')
+
+# Load and warm up the models in the background so the first request doesn't pay for it
+# (PRELOAD_MODELS=0 defers loading to the first request that needs them)
+PRELOAD_MODELS = os.environ.get('PRELOAD_MODELS', '1') != '0'
+if PRELOAD_MODELS:
+    preload_models()
 
 # Helper functions for hash management
 def calculate_image_hash(image_path):
-    """Calculates the MD5 hash of an image file."""
-    with open(image_path, 'rb') as f:
-        return hashlib.md5(f.read()).hexdigest()
-
-def is_hash_registered(image_hash):
-    """Checks if an image hash is already registered."""
-    with open(IMAGE_HASH_REGISTRY, 'r') as f:
-        return image_hash in f.read()
+    """Calculates the MD5 hash of an image file, reading it in fixed-size chunks."""
+    md5 = hashlib.md5()
+    with stage_metrics.time('disk_io'), open(image_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def _cache_upload(filename, image_hash, image):
+    """Caches what later endpoints need from an upload so they never re-read or re-decode it."""
+    record = {
+        'hash': image_hash,
+        'image': image, # Decoded BGR array (None if the upload isn't a readable image)
+        'height': image.shape[0] if image is not None else None,
+        'width': image.shape[1] if image is not None else None,
+    }
+    upload_cache.put(filename, record, image.nbytes if image is not None else 0)
+    return record
+
+def save_upload(file, upload_path):
+    """Streams an uploaded file to disk, hashing it on the way, and decodes it once."""
+    md5 = hashlib.md5()
+    data = bytearray()
+    with stage_metrics.time('disk_io'), open(upload_path, 'wb') as f:
+        for chunk in iter(lambda: file.stream.read(HASH_CHUNK_SIZE), b''):
+            md5.update(chunk)
+            f.write(chunk)
+            data.extend(chunk)
+    with stage_metrics.time('decode'):
+        image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+    return _cache_upload(os.path.basename(upload_path), md5.hexdigest(), image)
+
+def _write_crop(crop_path, crop):
+    # Written under a temporary name and renamed, so another process never reads half a PNG
+    with stage_metrics.time('encode'):
+        ok, encoded = cv2.imencode(os.path.splitext(crop_path)[1] or '.png', crop)
+    if not ok:
+        raise IOError(f"Could not encode {crop_path}")
+    with stage_metrics.time('disk_io'):
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(crop_path), suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(encoded.tobytes())
+        os.replace(tmp_path, crop_path)
+
+def cache_crop(crop_filename, crop, write_behind=False):
+    """Caches a crop in memory; with write_behind it's also written to CROPS_FOLDER in the background."""
+    crop_cache.put(crop_filename, crop, crop.nbytes)
+    if write_behind:
+        future = disk_writer.submit(_write_crop, os.path.join(CROPS_FOLDER, crop_filename), crop)
+        future.add_done_callback(_log_write_error)
+        return future
+
+def _stored_sample_bytes(filename):
+    """Encoded image of a training sample from the dataset store (None if not stored there)."""
+    if dataset_store is None:
+        return None
+    with stage_metrics.time('disk_io'):
+        return dataset_store.get_bytes(os.path.splitext(filename)[0])
+
+def _crop_path(crop_filename, folder):
+    """Path of a crop in folder, or of its written-behind copy in CROPS_FOLDER if it's not there."""
+    path = os.path.join(folder, crop_filename)
+    if not os.path.exists(path) and os.path.exists(os.path.join(CROPS_FOLDER, crop_filename)):
+        return os.path.join(CROPS_FOLDER, crop_filename)
+    return path
+
+def get_crop_image(crop_filename, folder):
+    """Returns a crop from memory, falling back to decoding it from the dataset store or disk (None if missing)."""
+    crop = crop_cache.get(crop_filename)
+    if crop is None:
+        data = _stored_sample_bytes(crop_filename)
+        with stage_metrics.time('decode'):
+            if data is not None:
+                crop = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+            else:
+                crop = cv2.imread(_crop_path(crop_filename, folder))
+        if crop is not None:
+            cache_crop(crop_filename, crop)
+    return crop
+
+def send_crop(crop_filename, folder):
+    """Serves a crop from memory if cached (it may not be on disk yet), otherwise from the dataset store or folder."""
+    crop = crop_cache.get(crop_filename)
+    if crop is None:
+        data = _stored_sample_bytes(crop_filename)
+        if data is not None: # Already encoded in the shard, served as is
+            return send_file(io.BytesIO(data), mimetype=mimetypes.guess_type(crop_filename)[0] or 'image/png')
+        return send_from_directory(os.path.dirname(_crop_path(crop_filename, folder)), crop_filename)
+    ext = os.path.splitext(crop_filename)[1] or '.png'
+    with stage_metrics.time('encode'):
+        ok, encoded = cv2.imencode(ext, crop)
+    if not ok:
+        return send_from_directory(folder, crop_filename)
+    return send_file(io.BytesIO(encoded.tobytes()), mimetype=mimetypes.guess_type(crop_filename)[0] or 'image/png')
+
+def _write_sample(image_path, image, label_path=None, label_line=None):
+    # Encoded and written separately (instead of cv2.imwrite) so /metrics can tell the two apart
+    with stage_metrics.time('encode'):
+        ok, encoded = cv2.imencode(os.path.splitext(image_path)[1] or '.png', image)
+    if not ok:
+        raise IOError(f"Could not encode {image_path}")
+    with stage_metrics.time('disk_io'):
+        with open(image_path, 'wb') as f:
+            f.write(encoded.tobytes())
+        if label_path is not None:
+            with open(label_path, 'w') as f:
+                f.write(label_line)
+
+def _log_write_error(future):
+    if future.exception() is not None:
+        print(f"[ERROR] Background write failed: {future.exception()}")
+
+def _store_sample(dataset, key, image, label_line, metadata):
+    image_bytes = None
+    if image is not None and not (metadata.get('image_ref') and metadata['image_ref'] in dataset_store):
+        with stage_metrics.time('encode'):
+            ok, encoded = cv2.imencode('.png', image)
+        if not ok:
+            raise IOError(f"Could not encode {key}")
+        image_bytes = encoded.tobytes()
+    with stage_metrics.time('disk_io'):
+        dataset_store.add(dataset, key, image_bytes, label_line, **metadata)
+
+def save_sample_async(image_path, image, label_path=None, label_line=None, dataset=None, **metadata):
+    """
+    Queues an image (and optional YOLO label) to be written in the background: appended to the
+    dataset store as `dataset` ('referee'/'signal') with its metadata, or written to image_path/label_path.
+    """
+    if dataset_store is not None:
+        key = os.path.splitext(os.path.basename(image_path))[0]
+        future = dataset_writer.submit(_store_sample, dataset, key, image, label_line, metadata)
+    else:
+        future = disk_writer.submit(_write_sample, image_path, image, label_path, label_line)
+    future.add_done_callback(_log_write_error)
+    return future
+
+def get_upload_record(filename):
+    """Returns the cached upload record, rebuilding it from disk if it was evicted (or None if missing)."""
+    record = upload_cache.get(filename)
+    if record is None:
+        upload_path = os.path.join(UPLOAD_FOLDER, filename)
+        if not os.path.exists(upload_path):
+            return None
+        record = _cache_upload(filename, calculate_image_hash(upload_path), cv2.imread(upload_path))
+    return record
 
 def register_hash(image_hash):
-    """Registers a new image hash."""
-    with open(IMAGE_HASH_REGISTRY, 'a') as f:
-        f.write(image_hash + '\n')
+    """
+    Claims an image hash before its sample is saved. Returns False if it was already registered,
+    so of two concurrent confirmations of the same image only one saves a sample.
+    """
+    with stage_metrics.time('hash_register'):
+        return hash_registry.add(image_hash)
+
+def release_hash(image_hash):
+    """Gives back a claimed hash whose sample wasn't saved, so the image can be confirmed again."""
+    with stage_metrics.time('hash_register'):
+        hash_registry.discard(image_hash)
+
+def save_claimed_sample_async(image_hash, *args, **kwargs):
+    """save_sample_async for a sample whose hash was claimed with register_hash; releases it if the write fails."""
+    def release_on_error(future):
+        if future.exception() is not None:
+            release_hash(image_hash)
+            print(f"[WARNING] Sample for hash {image_hash} not saved; hash released so it can be confirmed again.")
+    try:
+        future = save_sample_async(*args, image_hash=image_hash, **kwargs)
+    except Exception:
+        release_hash(image_hash)
+        raise
+    future.add_done_callback(release_on_error)
+    return future
+
+def _cached_result(model_name, image_hash, run_model):
+    """Result of `model_name` for the image with `image_hash` from the result cache, or run_model() on a miss."""
+    fingerprint = model_fingerprint(model_name) if result_cache is not None else None
+    if fingerprint is None:
+        return run_model()
+    with stage_metrics.time('result_cache'):
+        result = result_cache.get(model_name, fingerprint, image_hash)
+    if result is None:
+        result = run_model()
+        with stage_metrics.time('result_cache'):
+            result_cache.put(model_name, fingerprint, image_hash, result)
+    return result
+
+def detect_referee_cached(image, image_hash):
+    """detect_referee through the result cache: a hit only cuts the crop from the cached bbox."""
+    if image is None:
+        return detect_referee(image)
+    def run_model():
+        result = detect_referee(image)
+        return {'detected': result['detected'], 'bbox': result.get('bbox')}
+    cached = _cached_result('referee', image_hash, run_model)
+    return referee_crop(image, cached['bbox']) if cached['detected'] else {'detected': False}
+
+def detect_signal_cached(crop):
+    """detect_signal through the result cache, keyed by the hash of the crop pixels."""
+    with stage_metrics.time('result_cache'):
+        crop_hash = hashlib.md5(np.ascontiguousarray(crop).data).hexdigest() + f"_{crop.shape[1]}x{crop.shape[0]}"
+    return _cached_result('signal', crop_hash, lambda: detect_signal(crop))
 
 @app.route('/api/upload', methods=['POST'])
 def upload_image():
@@ -60,12 +301,13 @@ def upload_image():
     file = request.files['image']
     filename = file.filename
     upload_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    file.save(upload_path)
-    # Detectar árbitro y guardar crop temporal
+    # Hash and decode once here; confirm/manual crop endpoints reuse the cached record
+    upload_record = save_upload(file, upload_path)
+    # Detectar árbitro y guardar crop temporal (en memoria, y escrito a disco en segundo plano)
     crop_filename = f"temp_crop_{filename}" # Temporal crop
-    crop_path = os.path.join(CROPS_FOLDER, crop_filename)
-    result = detect_referee(upload_path, crop_save_path=crop_path)
+    result = detect_referee_cached(upload_record['image'], upload_record['hash'])
     if result['detected']:
+        cache_crop(crop_filename, result['crop'], write_behind=True)
         # Store original filename for later use in manual_crop if needed
         session['original_filename'] = filename # Use Flask session to pass original filename
         return jsonify({'filename': filename, 'crop_filename': crop_filename, 'crop_url': f'/api/crop/{crop_filename}', 'bbox': result['bbox']})
@@ -73,10 +315,122 @@ def upload_image():
         session['original_filename'] = filename # Still store for manual crop
         return jsonify({'error': 'No referee detected', 'filename': filename}), 404
 
+@app.route('/api/analyze', methods=['POST'])
+def analyze():
+    """
+    Detecta árbitro y señal en una sola llamada, todo en memoria (sin guardar la imagen).
+    Pensado para asistencia en directo; el flujo de etiquetado sigue usando upload/confirm.
+    """
+    if 'image' not in request.files:
+        return jsonify({'error': 'No image uploaded'}), 400
+    data = request.files['image'].read()
+    img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+    if img is None:
+        return jsonify({'error': 'Could not decode image'}), 400
+    return jsonify(analyze_image(img))
+
+# Extensiones aceptadas dentro de los archivos zip/tar de /api/analyze_batch
+ARCHIVE_IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+def _iter_archive_images(stream):
+    """Yields (filename, bytes) for the images inside a zip or tar(.gz) archive file object."""
+    if zipfile.is_zipfile(stream):
+        stream.seek(0)
+        with zipfile.ZipFile(stream) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and info.filename.lower().endswith(ARCHIVE_IMAGE_EXTENSIONS):
+                    yield info.filename, zf.read(info)
+        return
+    stream.seek(0)
+    with tarfile.open(fileobj=stream, mode='r|*') as tf: # Streaming mode, members are read in order
+        for member in tf:
+            if member.isfile() and member.name.lower().endswith(ARCHIVE_IMAGE_EXTENSIONS):
+                yield member.name, tf.extractfile(member).read()
+
+def _detach_uploads():
+    """
+    Copies the 'images' files and the optional 'archive' into temp files owned by the caller.
+    Werkzeug closes request.files when the view returns, before a streamed response is consumed.
+    """
+    uploads = []
+    for field in ('images', 'archive'):
+        for file in request.files.getlist(field):
+            spooled = tempfile.SpooledTemporaryFile(max_size=HASH_CHUNK_SIZE * 8)
+            shutil.copyfileobj(file.stream, spooled, HASH_CHUNK_SIZE)
+            spooled.seek(0)
+            uploads.append((file.filename, spooled, field == 'archive'))
+    return uploads
+
+def _iter_uploaded_images(uploads):
+    """Yields (filename, bytes) for every uploaded image and every image inside uploaded archives."""
+    for filename, stream, is_archive in uploads:
+        with stream:
+            if is_archive:
+                yield from _iter_archive_images(stream)
+            else:
+                yield filename, stream.read()
+
+@app.route('/api/analyze_batch', methods=['POST'])
+def analyze_batch():
+    """
+    Analiza muchas imágenes (campo 'images' repetido y/o un zip/tar en 'archive') con pasadas
+    por lotes de los modelos. Devuelve un objeto JSON por línea (NDJSON) a medida que cada
+    lote termina, en el orden de entrada.
+    """
+    if 'images' not in request.files and 'archive' not in request.files:
+        return jsonify({'error': 'No images uploaded'}), 400
+
+    uploads = _detach_uploads()
+
+    def generate():
+        uploaded = _iter_uploaded_images(uploads)
+        while True:
+            chunk = list(itertools.islice(uploaded, INFERENCE_BATCH_SIZE))
+            if not chunk:
+                return
+            images = [cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+                      for _, data in chunk]
+            # Skip the models entirely when nothing in the chunk could be decoded
+            results = analyze_images(images) if any(img is not None for img in images) else [None] * len(images)
+            for (filename, _), img, result in zip(chunk, images, results):
+                if img is None:
+                    line = {'filename': filename, 'error': 'Could not decode image'}
+                else:
+                    line = {'filename': filename, **result}
+                yield json.dumps(line) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/health', methods=['GET'])
+def health():
+    """Liveness: the app is serving. Includes the model loading state."""
+    return jsonify({'status': 'ok', 'models': model_status})
+
+@app.route('/api/ready', methods=['GET'])
+def ready():
+    """Readiness: 200 once the models are loaded and warmed up, 503 until then."""
+    return jsonify({'ready': models_ready(), 'models': model_status}), 200 if models_ready() else 503
+
+@app.route('/api/inference_stats', methods=['GET'])
+def inference_stats():
+    """Profundidad de cola y estadísticas de tamaño de lote del planificador de inferencia."""
+    stats = get_scheduler_stats()
+    if result_cache is not None:
+        stats['result_cache'] = result_cache.stats()
+    return jsonify(stats)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Latency histograms and item counters per stage, in Prometheus text format."""
+    text = stage_metrics.prometheus('referee_app')
+    if result_cache is not None:
+        text += result_cache.prometheus('referee_app')
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/crop/<filename>', methods=['GET'])
 def get_crop(filename):
     """Devuelve el crop generado por el modelo de árbitro."""
-    return send_from_directory(CROPS_FOLDER, filename)
+    return send_crop(filename, CROPS_FOLDER)
 
 @app.route('/api/confirm_crop', methods=['POST'])
 def confirm_crop():
@@ -86,51 +440,53 @@ def confirm_crop():
     crop_filename = data.get('crop_filename')
     bbox = data.get('bbox')
 
-    # Calculate hash of the original uploaded image
-    original_img_path = os.path.join(UPLOAD_FOLDER, original_filename)
-    if not os.path.exists(original_img_path):
+    # Hash of the original uploaded image (computed at upload time)
+    upload_record = get_upload_record(original_filename)
+    if upload_record is None:
         return jsonify({'error': 'Original image not found for hashing.'}), 404
 
-    original_image_hash = calculate_image_hash(original_img_path)
+    original_image_hash = upload_record['hash']
+
+    if not (crop_filename and original_filename and bbox):
+        return jsonify({'error': 'crop_filename and bbox are required.'}), 400
 
-    if is_hash_registered(original_image_hash):
+    # Claimed before saving, so a concurrent confirmation of the same image doesn't save it twice
+    if not register_hash(original_image_hash):
         print(f"[INFO] Image with hash {original_image_hash} already processed. Skipping saving.")
         # If the image is already processed, we still want to proceed to signal detection
         # We need to return the filename that would have been created if it wasn't a duplicate
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S_%f") # Generate a temporary timestamp just for filename consistency
         temp_dest_filename = f"referee_auto_{original_filename.rsplit('.', 1)[0]}_{timestamp}.png"
+        # Keep the crop reachable under that name so signal detection still works
+        crop = get_crop_image(crop_filename, CROPS_FOLDER)
+        if crop is not None:
+            cache_crop(temp_dest_filename, crop, write_behind=True) # Never saved as a sample
         return jsonify({'status': 'ok', 'crop_filename_for_signal': temp_dest_filename, 'message': 'Image already processed.'})
 
     # Guardar el crop confirmado en la carpeta de entrenamiento de árbitros
-    if crop_filename and original_filename and bbox:
-        # Move the crop from temp to permanent training folder with a unique timestamp
-        src_path = os.path.join(CROPS_FOLDER, crop_filename)
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S_%f") # Add microseconds for higher uniqueness
-        dest_filename = f"referee_auto_{original_filename.rsplit('.', 1)[0]}_{timestamp}.png"
-        dest_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, dest_filename)
-
-        try:
-            os.rename(src_path, dest_path)
-        except FileExistsError:
-            print(f"[WARNING] confirm_crop: Destination file already exists: {dest_path}. This should be prevented by hashing.")
-            return jsonify({'error': 'File already exists after hashing check. Investigate.'}), 500
-
-        # Save YOLO label for referee (class_id 0 for referee)
-        original_img = cv2.imread(original_img_path)
-        h, w = original_img.shape[:2]
-        x1, y1, x2, y2 = bbox
-        x_center = ((x1 + x2) / 2) / w
-        y_center = ((y1 + y2) / 2) / h
-        bw = (x2 - x1) / w
-        bh = (y2 - y1) / h
-        yolo_line = f"0 {x_center:.6f} {y_center:.6f} {bw:.6f} {bh:.6f}\n" # Class ID 0 for referee
-        label_filename = dest_filename.rsplit('.', 1)[0] + '.txt'
-        label_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, label_filename)
-        with open(label_path, 'w') as f:
-            f.write(yolo_line)
-        
-        # Register the hash after successful saving
-        register_hash(original_image_hash)
+    # Persist the crop to the permanent training folder with a unique timestamp
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S_%f") # Add microseconds for higher uniqueness
+    dest_filename = f"referee_auto_{original_filename.rsplit('.', 1)[0]}_{timestamp}.png"
+    dest_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, dest_filename)
+
+    crop = get_crop_image(crop_filename, CROPS_FOLDER)
+    if crop is None:
+        release_hash(original_image_hash) # Nothing saved, the image can be confirmed again
+        return jsonify({'error': 'Referee crop not found.'}), 404
+    cache_crop(dest_filename, crop)
+
+    # Save YOLO label for referee (class_id 0 for referee)
+    h, w = upload_record['height'], upload_record['width']
+    x1, y1, x2, y2 = bbox
+    x_center = ((x1 + x2) / 2) / w
+    y_center = ((y1 + y2) / 2) / h
+    bw = (x2 - x1) / w
+    bh = (y2 - y1) / h
+    yolo_line = f"0 {x_center:.6f} {y_center:.6f} {bw:.6f} {bh:.6f}\n" # Class ID 0 for referee
+    label_filename = dest_filename.rsplit('.', 1)[0] + '.txt'
+    label_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, label_filename)
+    save_claimed_sample_async(original_image_hash, dest_path, crop, label_path, yolo_line, dataset='referee',
+                              class_id=0, bbox=bbox, source_filename=original_filename)
 
     # Continue to signal detection for this confirmed crop
     return jsonify({'status': 'ok', 'crop_filename_for_signal': dest_filename})
@@ -138,7 +494,7 @@ def confirm_crop():
 @app.route('/api/referee_crop_image/<filename>', methods=['GET'])
 def get_referee_crop_image(filename):
     """Devuelve la imagen del crop del árbitro para visualización."""
-    return send_from_directory(REFEREE_TRAINING_DATA_FOLDER, filename)
+    return send_crop(filename, REFEREE_TRAINING_DATA_FOLDER)
 
 @app.route('/api/process_signal', methods=['POST'])
 def process_signal():
@@ -147,12 +503,13 @@ def process_signal():
     # Now, crop_filename_for_signal refers to the path in REFEREE_TRAINING_DATA_FOLDER
     crop_filename = data.get('crop_filename_for_signal')
     crop_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, crop_filename)
-    
-    # Ensure the image exists before processing
-    if not os.path.exists(crop_path):
+
+    # Use the in-memory crop handed over by confirm_crop/manual_crop when available
+    crop = get_crop_image(crop_filename, REFEREE_TRAINING_DATA_FOLDER)
+    if crop is None:
         return jsonify({'error': f'Image not found: {crop_path}'}), 404
 
-    result = detect_signal(crop_path)
+    result = detect_signal_cached(crop)
     # Ensure bbox_xywhn is included in the response even if not detected
     return jsonify({
         'predicted_class': result.get('predicted_class'),
@@ -174,29 +531,29 @@ def confirm_signal():
     if not original_filename:
         return jsonify({'error': 'Original filename not found in session.'}), 400
 
-    original_img_path = os.path.join(UPLOAD_FOLDER, original_filename)
-    if not os.path.exists(original_img_path):
+    upload_record = get_upload_record(original_filename)
+    if upload_record is None:
         return jsonify({'error': 'Original image not found for hashing in signal confirmation.'}), 404
 
-    original_image_hash = calculate_image_hash(original_img_path)
+    original_image_hash = upload_record['hash']
 
-    if is_hash_registered(original_image_hash):
+    # Claimed before saving, so a concurrent confirmation of the same image doesn't save it twice
+    if not register_hash(original_image_hash):
         print(f"[INFO] Original image (hash: {original_image_hash}) associated with this signal already processed. Skipping saving signal data.")
         return jsonify({'status': 'ok', 'message': 'Image already processed. Signal data not saved to prevent duplication.'})
 
     # Load the referee crop (image that was sent to signal detection)
-    referee_crop_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, crop_filename_for_signal)
-    referee_crop_img = cv2.imread(referee_crop_path)
+    referee_crop_img = get_crop_image(crop_filename_for_signal, REFEREE_TRAINING_DATA_FOLDER)
 
     if referee_crop_img is None:
+        release_hash(original_image_hash) # Nothing saved, the image can be confirmed again
         return jsonify({'error': 'Referee crop image not found for signal confirmation'}), 404
 
     # Save the referee crop image and its signal label in SIGNAL_TRAINING_DATA_FOLDER
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S_%f") # Add microseconds for higher uniqueness
     signal_dest_filename = f"signal_{crop_filename_for_signal.replace('referee_auto_', '').replace('referee_manual_', '').rsplit('.', 1)[0]}_{timestamp}.png"
     signal_dest_path = os.path.join(SIGNAL_TRAINING_DATA_FOLDER, signal_dest_filename)
-
-    cv2.imwrite(signal_dest_path, referee_crop_img) # Save the referee crop
+    signal_label_path, yolo_line = None, None
 
     # Get the class ID for the selected_class from inference.py's SIGNAL_CLASSES
     from models.inference import SIGNAL_CLASSES # Import SIGNAL_CLASSES from inference module
@@ -213,11 +570,13 @@ def confirm_signal():
         yolo_line = f"{class_id_for_yolo} {x_center:.6f} {y_center:.6f} {bw:.6f} {bh:.6f}\n"
         signal_label_filename = signal_dest_filename.rsplit('.', 1)[0] + '.txt'
         signal_label_path = os.path.join(SIGNAL_TRAINING_DATA_FOLDER, signal_label_filename)
-        with open(signal_label_path, 'w') as f:
-            f.write(yolo_line)
-    
-    # Register the hash after successful saving of signal and its label
-    register_hash(original_image_hash)
+
+    # Save the referee crop; the store reuses the stored referee sample instead of a second PNG
+    save_claimed_sample_async(original_image_hash, signal_dest_path, referee_crop_img, signal_label_path, yolo_line,
+                              dataset='signal', class_id=class_id_for_yolo if class_id_for_yolo != -1 else None,
+                              bbox=list(signal_bbox_yolo) if signal_bbox_yolo else None,
+                              source_filename=original_filename,
+                              image_ref=os.path.splitext(crop_filename_for_signal)[0])
 
     return jsonify({'status': 'ok'})
 
@@ -232,23 +591,26 @@ def manual_crop():
     bbox = data.get('bbox', [0, 0, 0, 0])
     class_id = data.get('class_id')
 
-    # Calculate hash of the original uploaded image
-    original_img_path = os.path.join(UPLOAD_FOLDER, original_filename)
-    if not os.path.exists(original_img_path):
+    # Hash of the original uploaded image (computed at upload time)
+    upload_record = get_upload_record(original_filename)
+    if upload_record is None:
         return jsonify({'error': 'Original image not found for hashing.'}), 404
 
-    original_image_hash = calculate_image_hash(original_img_path)
+    original_image_hash = upload_record['hash']
 
-    if is_hash_registered(original_image_hash):
+    # Claimed before saving, so a concurrent confirmation of the same image doesn't save it twice
+    if not register_hash(original_image_hash):
         print(f"[INFO] Image with hash {original_image_hash} already processed via manual crop. Skipping saving.")
         # If the image is already processed, we still want to proceed to signal detection
         timestamp = datetime.now().strftime("%Y%m%d%H%M%S_%f") # Generate a temporary timestamp just for filename consistency
         temp_manual_crop_filename = f"referee_manual_{original_filename.rsplit('.', 1)[0]}_{timestamp}.png"
         return jsonify({'status': 'ok', 'crop_filename_for_signal': temp_manual_crop_filename, 'message': 'Image already processed.'})
 
-    # Read original image
-    img_path = os.path.join(UPLOAD_FOLDER, original_filename)
-    img = cv2.imread(img_path)
+    # Original image, decoded once at upload time
+    img = upload_record['image']
+    if img is None:
+        release_hash(original_image_hash)
+        return jsonify({'error': 'Original image could not be decoded'}), 400
 
     # Crop the image
     x1, y1, x2, y2 = bbox
@@ -259,13 +621,15 @@ def manual_crop():
     if cropped_img.shape[0] > 0 and cropped_img.shape[1] > 0:
         resized_cropped_img = cv2.resize(cropped_img, (MODEL_SIZE, MODEL_SIZE))
     else:
+        release_hash(original_image_hash)
         return jsonify({'error': 'Invalid manual crop dimensions'}), 400
 
     # Generate a unique filename for the manually cropped referee image
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S_%f") # Add microseconds for higher uniqueness
     manual_crop_filename = f"referee_manual_{original_filename.rsplit('.', 1)[0]}_{timestamp}.png"
     manual_crop_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, manual_crop_filename)
-    cv2.imwrite(manual_crop_path, resized_cropped_img) # Save the resized image
+    cache_crop(manual_crop_filename, resized_cropped_img)
+    label_path, yolo_line = None, None
 
     # Save YOLO label for the manually cropped referee
     if class_id != -1: # Only save label if a class was selected (not 'none')
@@ -277,11 +641,10 @@ def manual_crop():
         yolo_line = f"{class_id} {x_center:.6f} {y_center:.6f} {bw:.6f} {bh:.6f}\n"
         label_filename = manual_crop_filename.rsplit('.', 1)[0] + '.txt'
         label_path = os.path.join(REFEREE_TRAINING_DATA_FOLDER, label_filename)
-        with open(label_path, 'w') as f:
-            f.write(yolo_line)
-    
-    # Register the hash after successful saving
-    register_hash(original_image_hash)
+
+    save_claimed_sample_async(original_image_hash, manual_crop_path, resized_cropped_img, label_path, yolo_line, # Save the resized image
+                              dataset='referee', class_id=class_id if class_id != -1 else None, bbox=bbox,
+                              source_filename=original_filename)
 
     # Return the path to the newly created manual crop for signal processing
     return jsonify({'status': 'ok', 'crop_filename_for_signal': manual_crop_filename})
@@ -0,0 +1,214 @@
+"""
+ASGI serving mode for the annotation API, e.g.:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+    hypercorn asgi:app --bind 0.0.0.0:5000
+
+The Flask app is served unchanged (same routes, requests and responses) through a small
+WSGI-to-ASGI bridge: the event loop receives request bodies and sends responses, so slow clients
+don't hold a thread, and each request's handler (file saves, hashing, PNG encoding, registry
+lookups) runs in a pool of ASGI_IO_THREADS threads. Model calls leave those threads too: with
+MICRO_BATCHING they are queued to the per-model inference threads of models/scheduler.py, which
+act as the dedicated model executor, and training samples are written by the background writers.
+"""
+import asyncio
+import concurrent.futures
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+from models import inference
+
+ASGI_IO_THREADS = int(os.environ.get('ASGI_IO_THREADS', '32'))
+# How often a handler thread waiting on a full response queue checks whether the client went away
+DISCONNECT_POLL_SECONDS = 0.1
+if not inference.MICRO_BATCHING:
+    print("[WARNING] MICRO_BATCHING is off: model calls will run on the ASGI I/O threads")
+
+
+class ClientDisconnected(Exception):
+    """Raised in the handler thread when the client disconnected, to stop producing the response"""
+
+
+class WsgiToAsgi:
+    """Runs a WSGI app for ASGI 'http' requests, the handler and the response iteration in `executor`."""
+
+    def __init__(self, wsgi_app, executor):
+        self.wsgi_app = wsgi_app
+        self.executor = executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.extend(message.get('body', b''))
+            if not message.get('more_body', False):
+                break
+
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=8)  # Chunks waiting to be sent; a full queue pauses the handler thread
+        disconnected = threading.Event()  # Tells the handler thread to stop and close the response
+        handler = loop.run_in_executor(self.executor, self._run_wsgi, self._environ(scope, bytes(body)), loop, queue,
+                                       disconnected)
+        watcher = asyncio.ensure_future(self._wait_disconnect(receive, disconnected))
+        started, error = False, None
+        try:
+            while True:
+                getter = asyncio.ensure_future(queue.get())
+                await asyncio.wait({getter, watcher}, return_when=asyncio.FIRST_COMPLETED)
+                if not getter.done():
+                    getter.cancel()
+                    print(f"[INFO] Client disconnected during {scope['method']} {scope['path']}, response stopped")
+                    await handler
+                    return
+                kind, value = getter.result()
+                if kind == 'start':
+                    status, headers = value
+                    await send({'type': 'http.response.start', 'status': int(status.split(' ', 1)[0]),
+                                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+                    started = True
+                elif kind == 'body':
+                    await send({'type': 'http.response.body', 'body': value, 'more_body': True})
+                else:
+                    error = value
+                    break
+        except OSError as e:
+            # Some servers raise on send() once the client is gone instead of reporting http.disconnect
+            disconnected.set()
+            print(f"[INFO] Client disconnected during {scope['method']} {scope['path']}: {e}")
+            await handler
+            return
+        finally:
+            watcher.cancel()
+
+        try:
+            await handler
+            if error is not None:
+                raise error
+        except Exception as e:
+            print(f"[ERROR] ASGI request {scope['method']} {scope['path']} failed: {e}")
+            if started:
+                raise
+            await send({'type': 'http.response.start', 'status': 500,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Internal Server Error', 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    @staticmethod
+    async def _wait_disconnect(receive, disconnected):
+        """Sets `disconnected` once the client goes away (the body was already read, so nothing else is expected)"""
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+
+    def _run_wsgi(self, environ, loop, queue, disconnected):
+        """Handler thread: calls the WSGI app and hands the status, headers and body chunks to the loop"""
+        def put(item):
+            if disconnected.is_set():
+                raise ClientDisconnected()
+            future = asyncio.run_coroutine_threadsafe(queue.put(item), loop)
+            while True:
+                try:
+                    return future.result(timeout=DISCONNECT_POLL_SECONDS)
+                except concurrent.futures.TimeoutError:
+                    # The queue is full; nobody will empty it once the client is gone
+                    if disconnected.is_set():
+                        future.cancel()
+                        raise ClientDisconnected()
+
+        response = []
+        headers_sent = []
+
+        def send_headers():
+            if not headers_sent:
+                put(('start', tuple(response)))
+                headers_sent.append(True)
+
+        def write(data):
+            # Legacy WSGI write() callable: pushed to the same queue as the returned iterable
+            send_headers()
+            if data:
+                put(('body', bytes(data)))
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and headers_sent:
+                raise exc_info[1].with_traceback(exc_info[2])
+            response[:] = [status, headers]
+            return write
+
+        result, error = None, None
+        try:
+            result = self.wsgi_app(environ, start_response)
+            for chunk in result:
+                send_headers()
+                if chunk:
+                    put(('body', bytes(chunk)))
+            send_headers()
+        except ClientDisconnected:
+            pass
+        except Exception as e:
+            error = e
+        finally:
+            try:
+                if hasattr(result, 'close'):
+                    result.close()
+            finally:
+                try:
+                    put(('end', error))  # Always sent, so _http never waits on the queue forever
+                except ClientDisconnected:
+                    pass  # _http already stopped reading
+
+    @staticmethod
+    def _environ(scope, body):
+        server_name, server_port = scope.get('server') or ('localhost', 80)
+        client = scope.get('client') or ('', 0)
+        environ = {
+            'REQUEST_METHOD': scope['method'],
+            'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+            'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+            'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+            'SERVER_NAME': server_name,
+            'SERVER_PORT': str(server_port),
+            'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+            'REMOTE_ADDR': client[0],
+            'REMOTE_PORT': str(client[1]),
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': scope.get('scheme', 'http'),
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in scope.get('headers', []):
+            name = name.decode('latin-1').upper().replace('-', '_')
+            value = value.decode('latin-1')
+            if name == 'CONTENT_LENGTH':
+                continue  # Set from the body actually received
+            key = name if name == 'CONTENT_TYPE' else f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+        return environ
+
+
+app = WsgiToAsgi(flask_app, ThreadPoolExecutor(max_workers=ASGI_IO_THREADS, thread_name_prefix='asgi-io'))
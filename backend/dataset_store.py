@@ -0,0 +1,299 @@
+"""
+Compact training-sample store: samples are appended to size-capped tar shards and indexed by an
+SQLite manifest, instead of one PNG plus one .txt file per sample.
+
+Shards follow the WebDataset layout ({key}.png, {key}.txt, {key}.json per sample, one shard
+series per dataset: referee-000000.tar, signal-000000.tar, ...). Referee shards can be streamed by
+training loaders as they are. Signal samples usually reuse the referee crop they were confirmed
+on, so their shards only hold the .txt and .json members (the .json names the referee sample in
+`image_ref`): export them (export_yolo, or the export command below) to get self-contained
+image/label pairs. The manifest records where each image lives, in its own shard or in the
+referee shard, so single samples are read with one seek either way.
+
+Usage (from backend/):
+    python dataset_store.py export --dataset referee --output exports/referee
+    python dataset_store.py export --dataset signal --output data/signal_training_data --layout flat
+    python dataset_store.py import --dataset referee --input data/referee_training_data
+"""
+import argparse
+import io
+import json
+import os
+import sqlite3
+import tarfile
+import threading
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+SHARD_MAX_BYTES = 1024 * 1024 * 1024  # Start a new shard once the current one reaches 1 GB
+CALIBRATION_FOLDER = 'calibration'  # Inside the store: flat exports used for INT8 calibration
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+
+
+class DatasetStore:
+    """
+    Append-only sample store with one manifest (manifest.sqlite3) and tar shards under `root`.
+
+    add() encodes the image once (or reuses the stored image of another sample through
+    `image_ref`, e.g. a signal sample on an already stored referee crop), appends it to the
+    dataset's current shard and then commits the manifest row, so the manifest never points at
+    bytes that weren't written. Writes are serialized; reads can happen from any thread.
+    """
+
+    def __init__(self, root, shard_max_bytes=SHARD_MAX_BYTES):
+        self.root = root
+        self.shard_max_bytes = shard_max_bytes
+        self.manifest_path = os.path.join(root, 'manifest.sqlite3')
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._shards = {}  # dataset -> open TarFile being appended to
+        os.makedirs(root, exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS samples (
+                key TEXT PRIMARY KEY,
+                dataset TEXT NOT NULL,
+                shard TEXT NOT NULL,
+                offset INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                ext TEXT NOT NULL,
+                label TEXT,
+                class_id INTEGER,
+                bbox TEXT,
+                image_hash TEXT,
+                source_filename TEXT,
+                image_ref TEXT,
+                created TEXT)''')
+            conn.execute('CREATE INDEX IF NOT EXISTS samples_dataset ON samples (dataset)')
+            conn.execute('CREATE INDEX IF NOT EXISTS samples_hash ON samples (image_hash)')
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.manifest_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _shard(self, dataset):
+        """The open shard to append `dataset` samples to, rolling over to a new one when full"""
+        shard = self._shards.get(dataset)
+        if shard is not None and shard.offset < self.shard_max_bytes:
+            return shard
+        if shard is not None:
+            shard.close()
+        existing = sorted(f for f in os.listdir(self.root) if f.startswith(f"{dataset}-") and f.endswith('.tar'))
+        index = int(existing[-1][len(dataset) + 1:-4]) if existing else 0
+        path = os.path.join(self.root, f"{dataset}-{index:06d}.tar")
+        shard = None
+        if os.path.exists(path) and os.path.getsize(path) < self.shard_max_bytes:
+            try:
+                shard = tarfile.open(path, 'a')
+            except tarfile.ReadError as e:  # Cut short by a crash: leave it as it is, start a new one
+                print(f"[WARNING] Shard {path} is damaged ({e}), starting a new shard")
+        if shard is None:
+            if os.path.exists(path):
+                index += 1
+                path = os.path.join(self.root, f"{dataset}-{index:06d}.tar")
+            shard = tarfile.open(path, 'w')
+        self._shards[dataset] = shard
+        return shard
+
+    @staticmethod
+    def _append(shard, name, data):
+        """Appends one member and returns the offset of its data in the shard"""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = time.time()
+        header_size = len(info.tobuf(shard.format, shard.encoding, shard.errors))
+        offset = shard.offset + header_size
+        shard.addfile(info, io.BytesIO(data))
+        return offset
+
+    def add(self, dataset, key, image=None, label=None, class_id=None, bbox=None, image_hash=None,
+            source_filename=None, image_ref=None, ext='.png'):
+        """
+        Stores one sample: its image as `image_ref` (key of a stored sample whose image is reused)
+        or, when that isn't stored, `image` (BGR array or encoded bytes), plus its YOLO label line
+        and metadata.
+        """
+        ref = self._row(image_ref) if image_ref is not None else None
+        if ref is None and image is None:
+            raise KeyError(f"Sample {key} has no image and image_ref {image_ref} isn't stored")
+        if ref is None:
+            image_ref = None  # Not stored (yet): keep a copy of the image instead
+        if ref is None and isinstance(image, np.ndarray):
+            ok, encoded = cv2.imencode(ext, image)
+            if not ok:
+                raise IOError(f"Could not encode sample {key}")
+            image = encoded.tobytes()
+        metadata = {'key': key, 'dataset': dataset, 'class_id': class_id, 'bbox': bbox, 'image_hash': image_hash,
+                    'source_filename': source_filename, 'image_ref': image_ref}
+
+        with self._write_lock:
+            shard = self._shard(dataset)
+            if ref is None:
+                shard_name, offset, size = os.path.basename(shard.name), self._append(shard, key + ext, image), len(image)
+            else:
+                shard_name, offset, size, ext = ref['shard'], ref['offset'], ref['size'], ref['ext']
+            if label:
+                self._append(shard, key + '.txt', label.encode())
+            self._append(shard, key + '.json', json.dumps(metadata).encode())
+            shard.fileobj.flush()
+            conn = self._connection()
+            with conn:
+                conn.execute('INSERT OR REPLACE INTO samples VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                             (key, dataset, shard_name, offset, size, ext, label, class_id,
+                              json.dumps(bbox) if bbox is not None else None, image_hash, source_filename,
+                              image_ref, datetime.now().isoformat()))
+        return key
+
+    def _row(self, key):
+        return self._connection().execute('SELECT * FROM samples WHERE key = ?', (key,)).fetchone()
+
+    def __contains__(self, key):
+        return self._row(key) is not None
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM samples').fetchone()[0]
+
+    def count(self, dataset):
+        return self._connection().execute('SELECT COUNT(*) FROM samples WHERE dataset = ?', (dataset,)).fetchone()[0]
+
+    def get_bytes(self, key):
+        """Encoded image of a sample, read straight from its shard (None if unknown)"""
+        row = self._row(key)
+        if row is None:
+            return None
+        with open(os.path.join(self.root, row['shard']), 'rb') as f:
+            f.seek(row['offset'])
+            return f.read(row['size'])
+
+    def get_image(self, key):
+        """Decoded BGR image of a sample, or None"""
+        data = self.get_bytes(key)
+        return cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR) if data else None
+
+    def samples(self, dataset=None):
+        """Manifest rows (as dicts) in insertion order, optionally for one dataset"""
+        conn = self._connection()
+        query, args = 'SELECT * FROM samples', ()
+        if dataset is not None:
+            query, args = query + ' WHERE dataset = ?', (dataset,)
+        return [dict(row) for row in conn.execute(query + ' ORDER BY rowid', args)]
+
+    def export_yolo(self, dataset, output_dir, layout='yolo', max_images=None):
+        """
+        Writes a dataset (its first `max_images` samples when given) as plain files: layout='yolo'
+        gives images/ and labels/ folders (the standard YOLO layout), layout='flat' puts each image
+        next to its .txt like the old training data folders. Images are copied as stored, without
+        re-encoding, including the referee crops that signal samples reuse.
+        """
+        image_dir = os.path.join(output_dir, 'images') if layout == 'yolo' else output_dir
+        label_dir = os.path.join(output_dir, 'labels') if layout == 'yolo' else output_dir
+        os.makedirs(image_dir, exist_ok=True)
+        os.makedirs(label_dir, exist_ok=True)
+        handles = {}
+        try:
+            rows = self.samples(dataset)[:max_images]
+            for row in rows:
+                shard = handles.get(row['shard'])
+                if shard is None:
+                    shard = handles[row['shard']] = open(os.path.join(self.root, row['shard']), 'rb')
+                shard.seek(row['offset'])
+                with open(os.path.join(image_dir, row['key'] + row['ext']), 'wb') as f:
+                    f.write(shard.read(row['size']))
+                if row['label']:
+                    with open(os.path.join(label_dir, row['key'] + '.txt'), 'w') as f:
+                        f.write(row['label'])
+        finally:
+            for shard in handles.values():
+                shard.close()
+        return len(rows)
+
+    def import_folder(self, dataset, folder):
+        """Packs an existing folder of images with .txt labels next to them; returns the samples added"""
+        added = 0
+        for name in sorted(os.listdir(folder)):
+            key, ext = os.path.splitext(name)
+            if ext.lower() not in IMAGE_EXTENSIONS or key in self:
+                continue
+            with open(os.path.join(folder, name), 'rb') as f:
+                image = f.read()
+            label_path = os.path.join(folder, key + '.txt')
+            label = None
+            if os.path.exists(label_path):
+                with open(label_path) as f:
+                    label = f.read()
+            class_id = int(label.split()[0]) if label and label.split() else None
+            self.add(dataset, key, image, label, class_id=class_id, source_filename=name, ext=ext.lower())
+            added += 1
+        return added
+
+    def close(self):
+        with self._write_lock:
+            for shard in self._shards.values():
+                shard.close()
+            self._shards = {}
+
+
+def calibration_folder(folder, store_root, dataset, max_images=None):
+    """
+    Folder of labelled `dataset` images for INT8 calibration and the quantization report:
+    `folder` itself when it holds images (TRAINING_DATA_STORE=files), otherwise a flat export of
+    the first `max_images` samples of the store at `store_root`, re-exported when the store grew.
+    Without either, `folder` is returned as is (quantization then falls back to dynamic).
+    """
+    if os.path.isdir(folder) and any(name.lower().endswith(IMAGE_EXTENSIONS) for name in os.listdir(folder)):
+        return folder
+    if not os.path.exists(os.path.join(store_root, 'manifest.sqlite3')):
+        return folder
+    store = DatasetStore(store_root)
+    try:
+        wanted = min(store.count(dataset), max_images) if max_images is not None else store.count(dataset)
+        if not wanted:
+            return folder
+        export_dir = os.path.join(store_root, CALIBRATION_FOLDER, dataset)
+        exported = os.listdir(export_dir) if os.path.isdir(export_dir) else []
+        if sum(name.lower().endswith(IMAGE_EXTENSIONS) for name in exported) != wanted:
+            for name in exported:
+                os.remove(os.path.join(export_dir, name))
+            store.export_yolo(dataset, export_dir, layout='flat', max_images=wanted)
+            print(f"[INFO] Exported {wanted} {dataset} samples from {store_root} to {export_dir} for calibration")
+        return export_dir
+    finally:
+        store.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('command', choices=['export', 'import', 'stats'])
+    parser.add_argument('--store', default=os.path.join('data', 'dataset'), help='Store directory')
+    parser.add_argument('--dataset', default='referee', help="'referee' or 'signal'")
+    parser.add_argument('--output', help='Export directory')
+    parser.add_argument('--input', help='Folder of images + .txt labels to import')
+    parser.add_argument('--layout', choices=['yolo', 'flat'], default='yolo')
+    args = parser.parse_args()
+
+    store = DatasetStore(args.store)
+    try:
+        if args.command == 'export':
+            print(f"Exported {store.export_yolo(args.dataset, args.output, args.layout)} samples to {args.output}")
+        elif args.command == 'import':
+            print(f"Imported {store.import_folder(args.dataset, args.input)} samples from {args.input}")
+        else:
+            for dataset in ('referee', 'signal'):
+                print(f"{dataset}: {store.count(dataset)} samples")
+    finally:
+        store.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+import os
+import sqlite3
+import threading
+
+
+class HashRegistry:
+    """
+    Persistent set of image hashes backed by SQLite.
+
+    Lookups hit the primary-key index instead of scanning a text file, and inserts are
+    atomic (INSERT OR IGNORE), so concurrent requests and worker processes can claim a
+    hash with add() and only the one that gets True saves the sample. A claim is only
+    released (discard) when saving that sample failed. Known hashes are also cached in memory.
+    A legacy one-hash-per-line text registry is imported the first time the database is
+    created.
+    """
+
+    def __init__(self, db_path, legacy_path=None):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._known = set()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS image_hashes (hash TEXT PRIMARY KEY)')
+            conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        if legacy_path:
+            self._migrate_text_registry(legacy_path)
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')  # Readers don't block the writer
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _migrate_text_registry(self, legacy_path):
+        """Imports hashes from the old image_hashes.txt once"""
+        conn = self._connection()
+        with conn:
+            done = conn.execute("SELECT value FROM meta WHERE key = 'migrated_from'").fetchone()
+            if done or not os.path.exists(legacy_path):
+                return
+            with open(legacy_path, 'r') as f:
+                hashes = [(line.strip(),) for line in f if line.strip()]
+            conn.executemany('INSERT OR IGNORE INTO image_hashes (hash) VALUES (?)', hashes)
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated_from', ?)", (legacy_path,))
+        print(f"[INFO] Migrated {len(hashes)} hashes from {legacy_path} to {self.db_path}")
+
+    def __contains__(self, image_hash):
+        if image_hash in self._known:
+            return True
+        row = self._connection().execute('SELECT 1 FROM image_hashes WHERE hash = ?', (image_hash,)).fetchone()
+        if row is not None:
+            with self._lock:
+                self._known.add(image_hash)
+        return row is not None
+
+    def add(self, image_hash):
+        """Registers a hash. Returns True if it was new, False if it was already registered."""
+        conn = self._connection()
+        with conn:
+            inserted = conn.execute('INSERT OR IGNORE INTO image_hashes (hash) VALUES (?)', (image_hash,)).rowcount
+        with self._lock:
+            self._known.add(image_hash)
+        return inserted == 1
+
+    def discard(self, image_hash):
+        """Removes a hash, so an image whose sample couldn't be saved can be confirmed again."""
+        conn = self._connection()
+        with conn:
+            conn.execute('DELETE FROM image_hashes WHERE hash = ?', (image_hash,))
+        with self._lock:
+            self._known.discard(image_hash)
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM image_hashes').fetchone()[0]
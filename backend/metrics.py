@@ -0,0 +1,135 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class StageMetrics:
+    """
+    Thread-safe latency histograms and throughput counters per processing stage (decode,
+    inference, encode, ...). Each observation is one call of a stage that took `seconds` and
+    handled `items` frames or images. Percentiles are estimated from the histogram buckets.
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._stages = {}
+
+    def observe(self, stage, seconds, items=1):
+        with self._lock:
+            s = self._stages.get(stage)
+            if s is None:
+                s = self._stages[stage] = self._empty()
+            s['calls'] += 1
+            s['items'] += items
+            s['seconds'] += seconds
+            s['max'] = max(s['max'], seconds)
+            s['buckets'][bisect.bisect_left(self.buckets, seconds)] += 1
+
+    @contextmanager
+    def time(self, stage, items=1):
+        """Times the body of a with block as one call of `stage`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, items)
+
+    def timed(self, stage, iterable):
+        """Yields from `iterable`, timing each item it produces (e.g. decoding a frame) as one call"""
+        iterator = iter(iterable)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            self.observe(stage, time.perf_counter() - start)
+            yield item
+
+    def _empty(self):
+        return {'calls': 0, 'items': 0, 'seconds': 0.0, 'max': 0.0, 'buckets': [0] * (len(self.buckets) + 1)}
+
+    def snapshot(self):
+        """Copy of the raw counters, e.g. to send them from a worker process and merge() them"""
+        with self._lock:
+            return {stage: {**s, 'buckets': list(s['buckets'])} for stage, s in self._stages.items()}
+
+    def merge(self, snapshot):
+        with self._lock:
+            for stage, other in snapshot.items():
+                s = self._stages.setdefault(stage, self._empty())
+                for key in ('calls', 'items', 'seconds'):
+                    s[key] += other[key]
+                s['max'] = max(s['max'], other['max'])
+                s['buckets'] = [a + b for a, b in zip(s['buckets'], other['buckets'])]
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+
+    def _quantile(self, s, q):
+        """Estimates a latency quantile, interpolating inside the bucket that holds it"""
+        target = q * s['calls']
+        seen = 0
+        for i, count in enumerate(s['buckets']):
+            if count and seen + count >= target:
+                if i == len(self.buckets):
+                    return s['max']
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = min(self.buckets[i], s['max'])
+                return lower + (max(upper, lower) - lower) * (target - seen) / count
+            seen += count
+        return 0.0
+
+    def summary(self):
+        """Per stage: calls, items, busy seconds, mean/p50/p95/p99/max ms per call and items per busy second"""
+        summary = {}
+        for stage, s in self.snapshot().items():
+            summary[stage] = {
+                'calls': s['calls'],
+                'items': s['items'],
+                'total_seconds': round(s['seconds'], 4),
+                'mean_ms': round(s['seconds'] * 1000 / s['calls'], 3) if s['calls'] else 0.0,
+                'p50_ms': round(self._quantile(s, 0.5) * 1000, 3),
+                'p95_ms': round(self._quantile(s, 0.95) * 1000, 3),
+                'p99_ms': round(self._quantile(s, 0.99) * 1000, 3),
+                'max_ms': round(s['max'] * 1000, 3),
+                'items_per_second': round(s['items'] / s['seconds'], 1) if s['seconds'] > 0 else None,
+            }
+        return summary
+
+    def report(self, wall_seconds=None):
+        """Human-readable table of summary(); `wall_seconds` adds each stage's share of the run"""
+        lines = [f"{'stage':<20} {'calls':>7} {'items':>7} {'busy s':>8} {'mean ms':>8} {'p95 ms':>8} "
+                 f"{'max ms':>8} {'items/s':>8}" + (f" {'busy %':>6}" if wall_seconds else '')]
+        for stage, s in sorted(self.summary().items(), key=lambda kv: -kv[1]['total_seconds']):
+            line = (f"{stage:<20} {s['calls']:>7} {s['items']:>7} {s['total_seconds']:>8.2f} {s['mean_ms']:>8.2f} "
+                    f"{s['p95_ms']:>8.2f} {s['max_ms']:>8.2f} {s['items_per_second'] or 0:>8.1f}")
+            if wall_seconds:
+                line += f" {100 * s['total_seconds'] / wall_seconds:>6.1f}"
+            lines.append(line)
+        return '\n'.join(lines)
+
+    def prometheus(self, prefix):
+        """Prometheus text exposition format: one latency histogram and one items counter per stage"""
+        name = f"{prefix}_stage_latency_seconds"
+        lines = [f"# HELP {name} Latency of one call of each processing stage",
+                 f"# TYPE {name} histogram"]
+        snapshot = self.snapshot()
+        for stage, s in sorted(snapshot.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), s['buckets']):
+                cumulative += count
+                lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_sum{{stage="{stage}"}} {s["seconds"]:.6f}')
+            lines.append(f'{name}_count{{stage="{stage}"}} {s["calls"]}')
+        items = f"{prefix}_stage_items_total"
+        lines += [f"# HELP {items} Frames or images handled by each processing stage",
+                  f"# TYPE {items} counter"]
+        lines += [f'{items}{{stage="{stage}"}} {s["items"]}' for stage, s in sorted(snapshot.items())]
+        return '\n'.join(lines) + '\n'
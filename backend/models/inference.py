@@ -1,86 +1,301 @@
+import hashlib
 import os
+import threading
+import time
 import cv2
-import torch
-from ultralytics import YOLO
+import numpy as np
+
+from dataset_store import calibration_folder
+from metrics import StageMetrics
+from models.onnx_backend import CALIBRATION_MAX_IMAGES, load_onnx_model, set_onnx_threads
+from models.scheduler import MicroBatcher
+
+# torch y ultralytics se importan al cargar los modelos (tardan segundos y no todos los endpoints los necesitan)
 
 # Cargar modelos solo una vez (singleton)
 referee_model = None
 signal_model = None
-DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+DEVICE = None  # None = 'cuda' si está disponible, si no 'cpu' (se decide al cargar los modelos)
 MODEL_SIZE = 640
 CONFIDENCE_THRESHOLD = 0.7
 
 REFEREE_MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'bestRefereeDetection.pt')
 SIGNAL_MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', '..', 'models', 'bestSignalsDetection.pt')
+REFEREE_CALIBRATION_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'referee_training_data')
+SIGNAL_CALIBRATION_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'signal_training_data')
+# Con TRAINING_DATA_STORE=shards las muestras están aquí y no en las carpetas (ver calibration_folder)
+DATASET_STORE_DIR = os.path.join(os.path.dirname(__file__), '..', 'data', 'dataset')
+
+# 'torch' = modelos .pt con PyTorch; 'onnx' = export ONNX cacheado junto al .pt, con onnxruntime en CPU;
+# 'onnx_int8' = variante INT8 de ese export, calibrada con las carpetas de training data
+INFERENCE_BACKEND = os.environ.get('INFERENCE_BACKEND', 'torch')
+ONNX_THREADS = int(os.environ.get('ONNX_THREADS', '0'))  # Hilos intra-op de onnxruntime (0 = por defecto)
+
+# Máximo de imágenes por pasada del modelo en las funciones *_batch
+INFERENCE_BATCH_SIZE = 16
+
+# Micro-batching: las peticiones concurrentes se agrupan en un solo hilo de inferencia por modelo
+MICRO_BATCHING = True
+MICRO_BATCH_MAX_WAIT_MS = 5  # Espera máxima para completar un lote antes de lanzarlo
+referee_batcher = None
+signal_batcher = None
+_batchers_lock = threading.Lock()
 
 # Clases de señales (ajusta según tu modelo)
 SIGNAL_CLASSES = ['armLeft', 'armRight', 'hits', 'leftServe', 'net', 'outside', 'rightServe', 'touched']
 
+# Nivel de los mensajes por llamada: con LOG_LEVEL=DEBUG se imprimen las trazas [DEBUG] de cada detección
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+DEBUG = LOG_LEVEL == 'DEBUG'
+
+# Latencias por etapa (decode, preprocess, inference, postprocess, crop/resize...) de toda la app, ver /metrics
+stage_metrics = StageMetrics()
+
+_models_lock = threading.Lock()
+model_status = {'state': 'not_loaded', 'error': None, 'load_seconds': None}
+
+# MD5 de los pesos: (tamaño, mtime, md5) por ruta, para no releer el .pt si no ha cambiado,
+# y el de los pesos que están cargados en memoria (ver model_fingerprint)
+_weights_md5 = {}
+loaded_weights_md5 = {}
+
+
 def load_models():
-    global referee_model, signal_model
-    if referee_model is None:
-        referee_model = YOLO(REFEREE_MODEL_PATH).to(DEVICE)
-        referee_model.fuse()
-    if signal_model is None:
-        signal_model = YOLO(SIGNAL_MODEL_PATH).to(DEVICE)
-        signal_model.fuse()
+    """Carga y calienta ambos modelos una sola vez; las llamadas concurrentes esperan a la primera."""
+    global referee_model, signal_model, DEVICE
+    if signal_model is not None:
+        return
+    with _models_lock:
+        if signal_model is not None:
+            return
+        model_status['state'] = 'loading'
+        start = time.perf_counter()
+        try:
+            import torch
+            from ultralytics import YOLO
+            if DEVICE is None:
+                DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+            use_onnx = INFERENCE_BACKEND in ('onnx', 'onnx_int8')
+            if use_onnx:
+                DEVICE = 'cpu'
+                int8 = INFERENCE_BACKEND == 'onnx_int8'
+                referee_calibration, signal_calibration = None, None
+                if int8:
+                    referee_calibration = calibration_folder(REFEREE_CALIBRATION_DIR, DATASET_STORE_DIR, 'referee',
+                                                             CALIBRATION_MAX_IMAGES)
+                    signal_calibration = calibration_folder(SIGNAL_CALIBRATION_DIR, DATASET_STORE_DIR, 'signal',
+                                                            CALIBRATION_MAX_IMAGES)
+                referee = load_onnx_model(REFEREE_MODEL_PATH, MODEL_SIZE, int8, referee_calibration)
+                signal = load_onnx_model(SIGNAL_MODEL_PATH, MODEL_SIZE, int8, signal_calibration)
+            else:
+                referee = YOLO(REFEREE_MODEL_PATH).to(DEVICE)
+                referee.fuse()
+                signal = YOLO(SIGNAL_MODEL_PATH).to(DEVICE)
+                signal.fuse()
+            # Una pasada en vacío a MODEL_SIZE: inicializa el predictor y los kernels antes de la primera petición
+            blank = np.zeros((MODEL_SIZE, MODEL_SIZE, 3), dtype=np.uint8)
+            referee(blank, conf=CONFIDENCE_THRESHOLD, verbose=False)
+            signal(blank, conf=CONFIDENCE_THRESHOLD, verbose=False)
+            if use_onnx:
+                set_onnx_threads(referee, ONNX_THREADS)
+                set_onnx_threads(signal, ONNX_THREADS)
+        except Exception as e:
+            model_status.update(state='error', error=str(e))
+            raise
+        loaded_weights_md5.update(referee=_file_md5(REFEREE_MODEL_PATH), signal=_file_md5(SIGNAL_MODEL_PATH))
+        referee_model, signal_model = referee, signal
+        model_status.update(state='ready', error=None, load_seconds=round(time.perf_counter() - start, 3))
+        print(f"[INFO] Models loaded ({INFERENCE_BACKEND}) on {DEVICE} in {model_status['load_seconds']}s")
+
+
+def preload_models():
+    """Carga los modelos en un hilo en segundo plano para que el arranque de la app no espere."""
+    def _load():
+        try:
+            load_models()
+        except Exception as e:
+            print(f"[ERROR] Background model loading failed: {e}")
+
+    thread = threading.Thread(target=_load, name='model-loader', daemon=True)
+    thread.start()
+    return thread
+
+
+def models_ready():
+    return model_status['state'] == 'ready'
+
 
+def _file_md5(path):
+    """MD5 de un fichero de pesos, recalculado solo si cambian su tamaño o su fecha de modificación."""
+    st = os.stat(path)
+    cached = _weights_md5.get(path)
+    if cached is not None and cached[:2] == (st.st_size, st.st_mtime_ns):
+        return cached[2]
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    _weights_md5[path] = (st.st_size, st.st_mtime_ns, md5.hexdigest())
+    return md5.hexdigest()
 
-def detect_referee(image_path, crop_save_path=None):
+
+def model_fingerprint(model_name):
+    """
+    Identifica los resultados de un modelo ('referee' o 'signal'): MD5 de sus pesos, backend y
+    CONFIDENCE_THRESHOLD. Usa los pesos cargados en memoria si ya lo están y, si no, el .pt actual
+    (None si no existe). Sirve de clave para la caché de resultados de app.py.
+    """
+    md5 = loaded_weights_md5.get(model_name)
+    if md5 is None:
+        try:
+            md5 = _file_md5(REFEREE_MODEL_PATH if model_name == 'referee' else SIGNAL_MODEL_PATH)
+        except OSError:
+            return None
+    return f"{md5}:{INFERENCE_BACKEND}:{CONFIDENCE_THRESHOLD}"
+
+
+def get_batchers():
+    """Crea (una sola vez) los micro-batchers de ambos modelos."""
+    global referee_batcher, signal_batcher
+    with _batchers_lock:
+        if referee_batcher is None:
+            referee_batcher = MicroBatcher(_run_referee_batch, INFERENCE_BATCH_SIZE, MICRO_BATCH_MAX_WAIT_MS,
+                                           name='referee-batcher')
+            signal_batcher = MicroBatcher(_run_signal_batch, INFERENCE_BATCH_SIZE, MICRO_BATCH_MAX_WAIT_MS,
+                                          name='signal-batcher')
+    return referee_batcher, signal_batcher
+
+
+def get_scheduler_stats():
+    """Profundidad de cola y tamaños de lote de cada micro-batcher (vacío si no se han usado)."""
+    if referee_batcher is None:
+        return {}
+    return {'referee': referee_batcher.stats(), 'signal': signal_batcher.stats()}
+
+
+def detect_referee(image, crop_save_path=None):
     """
     Detecta al árbitro en la imagen y devuelve el bounding box y el crop.
+    `image` puede ser una ruta o una imagen BGR ya decodificada (evita volver a leerla).
     Si crop_save_path se especifica, guarda el crop en esa ruta.
     """
-    load_models()
-    img = cv2.imread(image_path)
+    if isinstance(image, str):
+        with stage_metrics.time('decode'):
+            img = cv2.imread(image)
+    else:
+        img = image
+    image_path = image if isinstance(image, str) else '<in-memory image>'
     if img is None:
         print(f"[ERROR] detect_referee: Failed to load image from {image_path}")
         return {'detected': False}
 
-    results = referee_model(img, conf=CONFIDENCE_THRESHOLD)[0]
+    result = detect_referee_batch([img])[0]
+    if result['detected'] and crop_save_path is not None:
+        cv2.imwrite(crop_save_path, result['crop'])
+        result['crop_path'] = crop_save_path
+    return result
+
+
+def _referee_result(img, results, image_path):
+    """Convierte el resultado del modelo de árbitro en bbox + crop redimensionado."""
     if results.boxes is not None and results.boxes.xyxy.shape[0] > 0:
         # Tomar la primera detección
-        x1, y1, x2, y2 = map(int, results.boxes.xyxy[0].cpu().numpy())
-        crop = img[y1:y2, x1:x2]
-        
-        # Resize the cropped image to MODEL_SIZE for consistency with signal model input
-        if crop.shape[0] > 0 and crop.shape[1] > 0: # Ensure valid crop dimensions
-            resized_crop = cv2.resize(crop, (MODEL_SIZE, MODEL_SIZE))
-        else:
-            print(f"[WARNING] detect_referee: Invalid crop dimensions for {image_path}")
-            return {'detected': False}
-
-        if crop_save_path is not None:
-            cv2.imwrite(crop_save_path, resized_crop)
-            
-        return {
-            'bbox': [x1, y1, x2, y2],
-            'crop_path': crop_save_path,
-            'detected': True
-        }
+        return referee_crop(img, list(map(int, results.boxes.xyxy[0].cpu().numpy())), image_path)
     return {'detected': False}
 
 
-def detect_signal(crop_path):
+def referee_crop(img, bbox, image_path='<in-memory image>'):
+    """Recorta el bbox [x1, y1, x2, y2] del árbitro y lo redimensiona, igual que detect_referee."""
+    x1, y1, x2, y2 = bbox
+    crop = img[y1:y2, x1:x2]
+
+    # Resize the cropped image to MODEL_SIZE for consistency with signal model input
+    if crop.shape[0] > 0 and crop.shape[1] > 0: # Ensure valid crop dimensions
+        resized_crop = cv2.resize(crop, (MODEL_SIZE, MODEL_SIZE))
+    else:
+        print(f"[WARNING] detect_referee: Invalid crop dimensions for {image_path}")
+        return {'detected': False}
+
+    return {
+        'bbox': [x1, y1, x2, y2],
+        'crop': resized_crop, # MODEL_SIZE x MODEL_SIZE BGR crop, can be passed straight to detect_signal
+        'crop_path': None,
+        'detected': True
+    }
+
+
+def detect_referee_batch(images):
     """
-    Detecta la señal en el crop del árbitro y devuelve la clase y confianza.
+    Versión por lotes de detect_referee: una pasada del modelo por cada INFERENCE_BATCH_SIZE imágenes.
+    Devuelve un resultado por imagen, en el mismo orden (las imágenes None cuentan como no detectadas).
+    Con MICRO_BATCHING las imágenes pueden compartir pasada con las de otras peticiones.
     """
+    outputs = [{'detected': False} for _ in images]
+    valid = [i for i, img in enumerate(images) if img is not None]
+    valid_images = [images[i] for i in valid]
+    results = get_batchers()[0].map(valid_images) if MICRO_BATCHING else _run_referee_batch(valid_images)
+    for i, result in zip(valid, results):
+        outputs[i] = result
+    return outputs
+
+
+def _run_referee_batch(images):
+    """Ejecuta el modelo de árbitro sobre una lista de imágenes, INFERENCE_BATCH_SIZE por pasada."""
     load_models()
-    
-    print(f"[DEBUG] detect_signal: Receiving crop_path: {crop_path}")
-    img = cv2.imread(crop_path)
+    outputs = []
+    for start in range(0, len(images), INFERENCE_BATCH_SIZE):
+        chunk = images[start:start + INFERENCE_BATCH_SIZE]
+        batch_results = referee_model(chunk, conf=CONFIDENCE_THRESHOLD, verbose=False)
+        _observe_model_speed('referee', batch_results)
+        with stage_metrics.time('referee_crop_resize', len(chunk)):
+            outputs.extend(_referee_result(img, results, '<batch image>') for img, results in zip(chunk, batch_results))
+    return outputs
+
+
+def _observe_model_speed(model_name, batch_results):
+    """Registra preprocess/inference/postprocess de una pasada a partir de los tiempos que mide ultralytics."""
+    if not batch_results:
+        return
+    n = len(batch_results)
+    for stage, ms in batch_results[0].speed.items():  # ms por imagen: tiempo del lote / n
+        if ms is not None:
+            stage_metrics.observe(f"{model_name}_{stage}", ms * n / 1000, n)
+
+
+def detect_signal(crop):
+    """
+    Detecta la señal en el crop del árbitro y devuelve la clase y confianza.
+    `crop` puede ser la ruta del crop o el array BGR en memoria (sin pasar por disco).
+    """
+    crop_path = crop if isinstance(crop, str) else '<in-memory crop>'
+    if DEBUG:
+        print(f"[DEBUG] detect_signal: Receiving crop_path: {crop_path}")
+    if isinstance(crop, str):
+        with stage_metrics.time('decode'):
+            img = cv2.imread(crop)
+    else:
+        img = crop
     
     if img is None:
-        print(f"[DEBUG] detect_signal: Failed to load image from {crop_path}")
+        print(f"[ERROR] detect_signal: Failed to load image from {crop_path}")
         return {'predicted_class': None, 'confidence': 0.0, 'bbox_xywhn': None}
 
     # The image should already be MODEL_SIZE x MODEL_SIZE from detect_referee / manual_crop
-    print(f"[DEBUG] detect_signal: Image loaded. Shape: {img.shape}")
-    
-    results = signal_model(img, conf=CONFIDENCE_THRESHOLD)[0]
+    if DEBUG:
+        print(f"[DEBUG] detect_signal: Image loaded. Shape: {img.shape}")
     
-    print(f"[DEBUG] detect_signal: Raw model results: {results}")
+    result = detect_signal_batch([img])[0]
+    if not DEBUG:
+        return result
+    if result['predicted_class'] is not None:
+        print(f"[DEBUG] detect_signal: Detected class: {result['predicted_class']}, Confidence: {result['confidence']}, Bbox (xywhn): {result['bbox_xywhn']}")
+    else:
+        print(f"[DEBUG] detect_signal: No signal detected with confidence > {CONFIDENCE_THRESHOLD}")
+    return result
 
+
+def _signal_result(results):
+    """Convierte el resultado del modelo de señales en clase, confianza y bbox normalizado."""
     if results.boxes is not None and results.boxes.cls.shape[0] > 0:
         # Tomar la predicción con mayor confianza
         idx = int(results.boxes.cls[0].cpu().numpy())
@@ -90,11 +305,57 @@ def detect_signal(crop_path):
         # Obtener el bounding box en formato normalizado (xywhn)
         bbox_xywhn = results.boxes.xywhn[0].cpu().numpy().tolist() # Normalized x_center, y_center, width, height
 
-        print(f"[DEBUG] detect_signal: Detected class: {class_name}, Confidence: {conf}, Bbox (xywhn): {bbox_xywhn}")
         return {
             'predicted_class': class_name,
             'confidence': conf,
             'bbox_xywhn': bbox_xywhn # Add the normalized bounding box
         }
-    print(f"[DEBUG] detect_signal: No signal detected with confidence > {CONFIDENCE_THRESHOLD}")
-    return {'predicted_class': None, 'confidence': 0.0, 'bbox_xywhn': None} # Also return None for bbox 
\ No newline at end of file
+    return {'predicted_class': None, 'confidence': 0.0, 'bbox_xywhn': None} # Also return None for bbox 
+
+
+def detect_signal_batch(crops):
+    """Versión por lotes de detect_signal, un resultado por crop en el mismo orden."""
+    if MICRO_BATCHING:
+        return get_batchers()[1].map(crops)
+    return _run_signal_batch(crops)
+
+
+def _run_signal_batch(crops):
+    """Ejecuta el modelo de señales sobre una lista de crops, INFERENCE_BATCH_SIZE por pasada."""
+    load_models()
+    outputs = []
+    for start in range(0, len(crops), INFERENCE_BATCH_SIZE):
+        batch_results = signal_model(crops[start:start + INFERENCE_BATCH_SIZE], conf=CONFIDENCE_THRESHOLD, verbose=False)
+        _observe_model_speed('signal', batch_results)
+        outputs.extend(_signal_result(results) for results in batch_results)
+    return outputs
+
+
+def analyze_image(img):
+    """
+    Detecta árbitro y señal en una sola pasada, sin escribir ni releer nada de disco.
+    Devuelve el bbox del árbitro y la predicción de señal sobre su crop.
+    """
+    return analyze_images([img])[0]
+
+
+def analyze_images(images):
+    """
+    Versión por lotes de analyze_image: detección de árbitro por lotes y, sobre los crops
+    detectados, detección de señal por lotes. Un resultado por imagen, en el mismo orden.
+    """
+    referees = detect_referee_batch(images)
+    detected = [i for i, referee in enumerate(referees) if referee['detected']]
+    signals = detect_signal_batch([referees[i]['crop'] for i in detected]) if detected else []
+
+    outputs = [{'detected': False, 'bbox': None, 'predicted_class': None, 'confidence': 0.0, 'bbox_xywhn': None}
+               for _ in images]
+    for i, signal in zip(detected, signals):
+        outputs[i] = {
+            'detected': True,
+            'bbox': referees[i]['bbox'],
+            'predicted_class': signal.get('predicted_class'),
+            'confidence': signal.get('confidence'),
+            'bbox_xywhn': signal.get('bbox_xywhn')
+        }
+    return outputs
@@ -0,0 +1,129 @@
+import os
+import tempfile
+
+import cv2
+import numpy as np
+
+# Ejecución de los detectores con onnxruntime en CPU. ultralytics sigue haciendo el pre/postproceso
+# (y el tracking), así que los resultados tienen el mismo formato que con PyTorch.
+
+
+CALIBRATION_MAX_IMAGES = 200  # Imágenes de calibración usadas como máximo en la cuantización estática
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def onnx_path_for(model_path):
+    """Ruta del export ONNX cacheado junto al .pt"""
+    return os.path.splitext(model_path)[0] + '.onnx'
+
+
+def export_onnx(model_path, imgsz):
+    """
+    Exporta el .pt a ONNX la primera vez (o si el .pt es más reciente que el export) y devuelve su ruta.
+    El eje de batch es dinámico para que sirva también para las funciones *_batch.
+    """
+    onnx_path = onnx_path_for(model_path)
+    if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(model_path):
+        return onnx_path
+
+    from ultralytics import YOLO
+    # simplify=False: onnxslim no es una dependencia del proyecto
+    exported = YOLO(model_path).export(format='onnx', imgsz=imgsz, dynamic=True, simplify=False, verbose=False)
+    if os.path.abspath(exported) != os.path.abspath(onnx_path):
+        os.replace(exported, onnx_path)
+    print(f"[INFO] Exported {model_path} to {onnx_path}")
+    return onnx_path
+
+
+def int8_path_for(model_path):
+    """Ruta de la variante INT8 cacheada junto al .pt"""
+    return os.path.splitext(model_path)[0] + '.int8.onnx'
+
+
+def list_images(folder):
+    """Imágenes de una carpeta (p. ej. data/referee_training_data), ordenadas por nombre"""
+    if not folder or not os.path.isdir(folder):
+        return []
+    return [os.path.join(folder, name) for name in sorted(os.listdir(folder))
+            if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+
+def quantize_onnx(model_path, imgsz, calibration_dir=None, max_images=CALIBRATION_MAX_IMAGES):
+    """
+    Cuantiza a INT8 el export ONNX de `model_path` y devuelve la ruta (cacheada como el export).
+    Con imágenes en `calibration_dir` la cuantización es estática (pesos y activaciones de las Conv en INT8,
+    calibradas con esas imágenes); sin ellas es dinámica (solo pesos).
+    """
+    int8_path = int8_path_for(model_path)
+    onnx_path = export_onnx(model_path, imgsz)
+    if os.path.exists(int8_path) and os.path.getmtime(int8_path) >= os.path.getmtime(onnx_path):
+        return int8_path
+
+    import onnx
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_dynamic, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    class _CalibrationReader(CalibrationDataReader):
+        def __init__(self, batches):
+            self.batches = batches
+
+        def get_next(self):
+            return next(self.batches, None)
+
+    images = list_images(calibration_dir)[:max_images]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Pliega constantes (los bias de la cabeza) para que se puedan cuantizar
+        prepared_path = os.path.join(tmp_dir, 'prepared.onnx')
+        quant_pre_process(onnx_path, prepared_path, skip_symbolic_shape=True)
+        if images:
+            input_name = onnx.load(prepared_path).graph.input[0].name
+            reader = _CalibrationReader(_calibration_batches(images, imgsz, input_name))
+            # Solo las Conv: la salida concatena cajas en píxeles y scores 0-1, que en INT8 perderían precisión
+            quantize_static(prepared_path, int8_path, reader, quant_format=QuantFormat.QDQ, per_channel=True,
+                            weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8,
+                            op_types_to_quantize=['Conv'])
+        else:
+            quantize_dynamic(prepared_path, int8_path, weight_type=QuantType.QUInt8)
+    print(f"[INFO] Quantized {onnx_path} to {int8_path} "
+          f"({'static, ' + str(len(images)) + ' calibration images' if images else 'dynamic'})")
+    return int8_path
+
+
+def _calibration_batches(images, imgsz, input_name):
+    """Preprocesa las imágenes igual que el predictor de ultralytics (letterbox, RGB, CHW, 0-1)"""
+    from ultralytics.data.augment import LetterBox
+    letterbox = LetterBox((imgsz, imgsz), auto=False)
+    for path in images:
+        img = cv2.imread(path)
+        if img is None:
+            continue
+        img = letterbox(image=img)[..., ::-1].transpose(2, 0, 1)[None]
+        yield {input_name: np.ascontiguousarray(img, dtype=np.float32) / 255.0}
+
+
+def load_onnx_model(model_path, imgsz, int8=False, calibration_dir=None):
+    """
+    Carga el export ONNX de `model_path` como modelo YOLO que corre sobre onnxruntime.
+    Con int8=True carga la variante cuantizada (creándola con `calibration_dir` si no existe).
+    """
+    from ultralytics import YOLO
+    path = quantize_onnx(model_path, imgsz, calibration_dir) if int8 else export_onnx(model_path, imgsz)
+    return YOLO(path, task='detect')
+
+
+def set_onnx_threads(model, threads):
+    """
+    Recrea la sesión de onnxruntime de un modelo ya llamado (el predictor existe tras el warmup)
+    con `threads` hilos intra-op. 0 deja el valor por defecto de onnxruntime (un hilo por núcleo físico).
+    """
+    if not threads:
+        return
+    import onnxruntime
+    backend = getattr(getattr(model.predictor, 'model', None), 'backend', None)
+    if getattr(backend, 'session', None) is None:
+        print("[WARNING] set_onnx_threads: no onnxruntime session found, keeping default threads")
+        return
+    options = onnxruntime.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    backend.session = onnxruntime.InferenceSession(model.ckpt_path, options, providers=['CPUExecutionProvider'])
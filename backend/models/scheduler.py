@@ -0,0 +1,91 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item requests into batched calls of `batch_fn`.
+
+    Callers enqueue items and wait on a Future. A single worker thread takes the first
+    waiting item, keeps collecting until `max_batch_size` items are queued or `max_wait_ms`
+    has passed, runs `batch_fn(items)` once and fans the results back out in order. All
+    model calls therefore happen on one thread, so concurrent requests neither race on the
+    model nor need their own copy of it.
+    """
+
+    def __init__(self, batch_fn, max_batch_size=16, max_wait_ms=5.0, name='micro-batcher'):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max_wait_ms / 1000.0
+        self.name = name
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batch_sizes = {}  # batch size -> number of batches
+        self._items = 0
+        self._batches = 0
+        self._busy_seconds = 0.0
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, item):
+        """Queues one item and returns a Future for its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+
+    def __call__(self, item):
+        """Runs one item through the next micro-batch and blocks for its result"""
+        return self.submit(item).result()
+
+    def map(self, items):
+        """Queues several items at once (they may share a batch with other requests)"""
+        futures = [self.submit(item) for item in items]
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        batch = [self._queue.get()]  # Block until there is work
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            items = [item for item, _ in batch]
+            start = time.perf_counter()
+            try:
+                results = self.batch_fn(items)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            self._record(len(batch), time.perf_counter() - start)
+
+    def _record(self, batch_size, seconds):
+        with self._stats_lock:
+            self._batches += 1
+            self._items += batch_size
+            self._busy_seconds += seconds
+            self._batch_sizes[batch_size] = self._batch_sizes.get(batch_size, 0) + 1
+
+    def stats(self):
+        """Queue depth and batch-size statistics since start"""
+        with self._stats_lock:
+            return {
+                'queue_depth': self._queue.qsize(),
+                'batches': self._batches,
+                'items': self._items,
+                'mean_batch_size': self._items / self._batches if self._batches else 0.0,
+                'max_batch_size': max(self._batch_sizes, default=0),
+                'batch_size_histogram': dict(sorted(self._batch_sizes.items())),
+                'busy_seconds': self._busy_seconds,
+            }
@@ -0,0 +1,164 @@
+"""
+Compara la variante INT8 de cada detector con el modelo FP32 (ambos con onnxruntime en CPU).
+
+Para cada modelo usa las imágenes etiquetadas (imagen + .txt YOLO al lado) de su carpeta de training data:
+- mAP@0.5 de FP32 e INT8 contra las etiquetas
+- acuerdo: % de imágenes donde la detección principal (>= CONFIDENCE_THRESHOLD) coincide en clase e IoU >= 0.5
+- latencia media por imagen
+
+Las mismas carpetas se usan para calibrar, así que el mAP es optimista; lo que interesa es la diferencia FP32/INT8.
+Si las muestras están en el dataset store (TRAINING_DATA_STORE=shards), se exportan antes las --max-images primeras
+(todas si no se indica) a data/dataset/calibration/ (ver calibration_folder en dataset_store.py).
+
+Uso (desde backend/):
+    python quantization_report.py --output data/quantization_report.json
+"""
+import argparse
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from dataset_store import calibration_folder
+from models.inference import (CONFIDENCE_THRESHOLD, DATASET_STORE_DIR, MODEL_SIZE, REFEREE_CALIBRATION_DIR,
+                              REFEREE_MODEL_PATH, SIGNAL_CALIBRATION_DIR, SIGNAL_MODEL_PATH)
+from models.onnx_backend import list_images, load_onnx_model, set_onnx_threads
+
+EVAL_CONFIDENCE = 0.001  # Umbral bajo para el mAP, como hace la validación de ultralytics
+IOU_MATCH = 0.5
+
+
+def load_labelled_images(folder, max_images=None):
+    """Devuelve [(ruta, [(clase, x1, y1, x2, y2) normalizados])] de las imágenes con .txt"""
+    samples = []
+    for path in list_images(folder):
+        label_path = os.path.splitext(path)[0] + '.txt'
+        if not os.path.exists(label_path):
+            continue
+        boxes = []
+        with open(label_path) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 5:
+                    cls, x, y, w, h = int(parts[0]), *map(float, parts[1:5])
+                    boxes.append((cls, x - w / 2, y - h / 2, x + w / 2, y + h / 2))
+        samples.append((path, boxes))
+    return samples[:max_images]
+
+
+def box_iou(a, b):
+    ix = max(0.0, min(a[2], b[2]) - max(a[0], b[0]))
+    iy = max(0.0, min(a[3], b[3]) - max(a[1], b[1]))
+    inter = ix * iy
+    union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - inter
+    return inter / union if union > 0 else 0.0
+
+
+def average_precision_50(predictions, labels):
+    """
+    mAP@0.5 (interpolación en todos los puntos) sobre las clases presentes en las etiquetas.
+    predictions/labels: por imagen, listas de (clase, conf, caja) / (clase, caja) con cajas xyxy normalizadas.
+    """
+    aps = []
+    for cls in sorted({c for image_labels in labels for c, _ in image_labels}):
+        truths = [[box for c, box in image_labels if c == cls] for image_labels in labels]
+        matched = [[False] * len(boxes) for boxes in truths]
+        detections = sorted(((conf, i, box) for i, preds in enumerate(predictions)
+                             for c, conf, box in preds if c == cls), key=lambda d: -d[0])
+        hits = []
+        for _, i, box in detections:
+            ious = [box_iou(box, truth) for truth in truths[i]]
+            best = int(np.argmax(ious)) if ious else -1
+            hit = best >= 0 and ious[best] >= IOU_MATCH and not matched[i][best]
+            if hit:
+                matched[i][best] = True
+            hits.append(hit)
+        total = sum(len(boxes) for boxes in truths)
+        tp = np.cumsum(hits)
+        recall = np.concatenate(([0.0], tp / total, [1.0]))
+        precision = np.concatenate(([1.0], tp / np.arange(1, len(hits) + 1), [0.0]))
+        precision = np.maximum.accumulate(precision[::-1])[::-1]  # Envolvente decreciente
+        aps.append(float(np.sum(np.diff(recall) * precision[1:])))
+    return float(np.mean(aps)) if aps else 0.0
+
+
+def _detections(results):
+    boxes = results.boxes
+    return [(int(c), float(conf), tuple(box)) for c, conf, box in
+            zip(boxes.cls.tolist(), boxes.conf.tolist(), boxes.xyxyn.tolist())]
+
+
+def _top_detection(detections):
+    confident = [d for d in detections if d[1] >= CONFIDENCE_THRESHOLD]
+    return max(confident, key=lambda d: d[1]) if confident else None
+
+
+def _agree(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return a[0] == b[0] and box_iou(a[2], b[2]) >= IOU_MATCH
+
+
+def evaluate(model, images):
+    """Devuelve (detecciones por imagen, ms por imagen)"""
+    model(images[0], conf=EVAL_CONFIDENCE, verbose=False)  # Warmup
+    detections = []
+    start = time.perf_counter()
+    for img in images:
+        detections.append(_detections(model(img, conf=EVAL_CONFIDENCE, verbose=False)[0]))
+    return detections, (time.perf_counter() - start) * 1000 / len(images)
+
+
+def compare(model_path, data_dir, threads=0, max_images=None):
+    samples = load_labelled_images(data_dir, max_images)
+    if not samples:
+        return {'model': model_path, 'error': f'no labelled images in {data_dir}'}
+    images = [cv2.imread(path) for path, _ in samples]
+    labels = [[(c, box) for c, *box in boxes] for _, boxes in samples]
+
+    report = {'model': os.path.basename(model_path), 'images': len(samples)}
+    predictions = {}
+    for name, int8 in (('fp32', False), ('int8', True)):
+        model = load_onnx_model(model_path, MODEL_SIZE, int8=int8, calibration_dir=data_dir)
+        model(images[0], verbose=False)  # Crea el predictor para poder fijar los hilos
+        set_onnx_threads(model, threads)
+        predictions[name], ms = evaluate(model, images)
+        report[name] = {'map50': round(average_precision_50(predictions[name], labels), 4),
+                        'ms_per_image': round(ms, 2)}
+    agreement = [_agree(_top_detection(a), _top_detection(b)) for a, b in zip(predictions['fp32'], predictions['int8'])]
+    report['agreement'] = round(sum(agreement) / len(agreement), 4)
+    report['speedup'] = round(report['fp32']['ms_per_image'] / report['int8']['ms_per_image'], 2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--threads', type=int, default=0, help='onnxruntime intra-op threads (0 = default)')
+    parser.add_argument('--max-images', type=int, default=None)
+    parser.add_argument('--output', default=None, help='JSON report path')
+    args = parser.parse_args()
+
+    reports = []
+    for model_path, folder, dataset in ((REFEREE_MODEL_PATH, REFEREE_CALIBRATION_DIR, 'referee'),
+                                        (SIGNAL_MODEL_PATH, SIGNAL_CALIBRATION_DIR, 'signal')):
+        data_dir = calibration_folder(folder, DATASET_STORE_DIR, dataset, args.max_images)
+        reports.append(compare(model_path, data_dir, args.threads, args.max_images))
+
+    print(f"{'model':<28} {'images':>6} {'mAP50 fp32':>10} {'mAP50 int8':>10} {'agree':>6} "
+          f"{'ms fp32':>8} {'ms int8':>8} {'speedup':>7}")
+    for r in reports:
+        if 'error' in r:
+            print(f"{os.path.basename(r['model']):<28} {r['error']}")
+            continue
+        print(f"{r['model']:<28} {r['images']:>6} {r['fp32']['map50']:>10.3f} {r['int8']['map50']:>10.3f} "
+              f"{r['agreement']:>6.1%} {r['fp32']['ms_per_image']:>8.1f} {r['int8']['ms_per_image']:>8.1f} "
+              f"{r['speedup']:>6.2f}x")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+RESULT_CACHE_MAX_ENTRIES = 100000
+
+
+class ResultCache:
+    """
+    Persistent, size-bounded cache of model results backed by SQLite.
+
+    Entries are keyed by model name, the model's fingerprint (hash of its weights plus anything
+    else that changes its output, such as the confidence threshold) and the image content hash,
+    and hold the JSON-serializable result. The first time a model shows up with a new
+    fingerprint, its entries for older fingerprints are deleted. Once there are more than
+    `max_entries` entries, the least recently used ones are evicted.
+    """
+
+    def __init__(self, db_path, max_entries=RESULT_CACHE_MAX_ENTRIES):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._fingerprints = {}  # model -> fingerprint its older entries were already purged for
+        self._counters = {}  # model -> [hits, misses]
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            conn.execute('''CREATE TABLE IF NOT EXISTS results (
+                model TEXT NOT NULL,
+                fingerprint TEXT NOT NULL,
+                image_hash TEXT NOT NULL,
+                result TEXT NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, fingerprint, image_hash))''')
+            conn.execute('CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)')
+        self._count = len(self)
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so each thread opens its own
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _check_fingerprint(self, model, fingerprint):
+        """Drops the entries of older weights/settings of `model` the first time a fingerprint is seen"""
+        if self._fingerprints.get(model) == fingerprint:
+            return
+        conn = self._connection()
+        with conn:
+            purged = conn.execute('DELETE FROM results WHERE model = ? AND fingerprint != ?',
+                                  (model, fingerprint)).rowcount
+        with self._lock:
+            self._fingerprints[model] = fingerprint
+            self._count -= purged
+        if purged:
+            print(f"[INFO] Result cache: {model} model changed, dropped {purged} cached results")
+
+    def _record(self, model, hit):
+        with self._lock:
+            counters = self._counters.setdefault(model, [0, 0])
+            counters[0 if hit else 1] += 1
+
+    def get(self, model, fingerprint, image_hash):
+        """The cached result of `model` for an image, or None"""
+        self._check_fingerprint(model, fingerprint)
+        conn = self._connection()
+        key = (model, fingerprint, image_hash)
+        row = conn.execute('SELECT result FROM results WHERE model = ? AND fingerprint = ? AND image_hash = ?',
+                           key).fetchone()
+        self._record(model, row is not None)
+        if row is None:
+            return None
+        with conn:
+            conn.execute('UPDATE results SET last_used = ? WHERE model = ? AND fingerprint = ? AND image_hash = ?',
+                         (time.time(), *key))
+        return json.loads(row[0])
+
+    def put(self, model, fingerprint, image_hash, result):
+        self._check_fingerprint(model, fingerprint)
+        conn = self._connection()
+        with conn:
+            inserted = conn.execute('INSERT OR IGNORE INTO results VALUES (?, ?, ?, ?, ?)',
+                                    (model, fingerprint, image_hash, json.dumps(result), time.time())).rowcount
+        if not inserted:
+            return
+        with self._lock:
+            self._count += 1
+            excess = self._count - self.max_entries
+        if excess > 0:
+            with conn:
+                evicted = conn.execute('DELETE FROM results WHERE rowid IN '
+                                       '(SELECT rowid FROM results ORDER BY last_used LIMIT ?)', (excess,)).rowcount
+            with self._lock:
+                self._count -= evicted
+
+    def stats(self):
+        """Entries plus hits, misses and hit rate per model since startup"""
+        with self._lock:
+            stats = {'entries': self._count, 'max_entries': self.max_entries}
+            for model, (hits, misses) in sorted(self._counters.items()):
+                stats[model] = {'hits': hits, 'misses': misses,
+                                'hit_rate': round(hits / (hits + misses), 4) if hits + misses else 0.0}
+        return stats
+
+    def prometheus(self, prefix):
+        """Hit/miss counters and entry count in Prometheus text exposition format"""
+        name = f"{prefix}_result_cache_requests_total"
+        lines = [f"# HELP {name} Result cache lookups by model and outcome", f"# TYPE {name} counter"]
+        with self._lock:
+            for model, (hits, misses) in sorted(self._counters.items()):
+                lines.append(f'{name}{{model="{model}",result="hit"}} {hits}')
+                lines.append(f'{name}{{model="{model}",result="miss"}} {misses}')
+            lines += [f"# HELP {prefix}_result_cache_entries Cached model results",
+                      f"# TYPE {prefix}_result_cache_entries gauge",
+                      f"{prefix}_result_cache_entries {self._count}"]
+        return '\n'.join(lines) + '\n'
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
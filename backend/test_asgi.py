@@ -0,0 +1,120 @@
+import asyncio
+import io
+import itertools
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app as flask_app
+from asgi import WsgiToAsgi, app
+
+
+def _request(method, path, body=b'', headers=(), chunk_size=None, asgi_app=app, disconnect_after=None):
+    """
+    Runs one request through the ASGI app; returns (status, headers dict, body, number of body messages).
+    Like a server, receive() only reports http.disconnect once the response is complete, or after
+    `disconnect_after` body messages when the client goes away mid-response (then the sent messages are returned).
+    """
+    chunks = [body[i:i + chunk_size] for i in range(0, len(body), chunk_size)] if chunk_size and body else [body]
+    incoming = [{'type': 'http.request', 'body': c, 'more_body': i < len(chunks) - 1} for i, c in enumerate(chunks)]
+    sent = []
+
+    async def run():
+        gone = asyncio.Event()
+
+        async def receive():
+            if incoming:
+                return incoming.pop(0)
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            if not message.get('more_body', True) or len(sent) - 1 == disconnect_after:
+                gone.set()
+
+        await asgi_app(scope, receive, send)
+
+    path, _, query = path.partition('?')
+    scope = {'type': 'http', 'http_version': '1.1', 'method': method, 'scheme': 'http', 'path': path,
+             'root_path': '', 'query_string': query.encode(), 'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+             'client': ('127.0.0.1', 5555), 'server': ('127.0.0.1', 5000)}
+    asyncio.run(asyncio.wait_for(run(), timeout=10))
+    if disconnect_after is not None:
+        return sent
+    start, bodies = sent[0], sent[1:]
+    assert start['type'] == 'http.response.start' and not bodies[-1]['more_body']
+    return start['status'], {k.decode(): v.decode() for k, v in start['headers']}, b''.join(m['body'] for m in bodies), len(bodies)
+
+
+def _multipart(files):
+    boundary = 'asgitestboundary'
+    body = b''
+    for field, filename, data in files:
+        body += (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+                 f'Content-Type: application/octet-stream\r\n\r\n').encode() + data + b'\r\n'
+    return body + f'--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+def test_same_responses_as_wsgi():
+    status, headers, body, _ = _request('GET', '/api/health')
+    assert status == 200 and headers['content-type'] == 'application/json'
+    assert json.loads(body) == flask_app.test_client().get('/api/health').get_json()
+
+    status, _, body, _ = _request('POST', '/api/analyze', b'', [('content-type', 'multipart/form-data; boundary=x')])
+    assert status == 400 and json.loads(body) == {'error': 'No image uploaded'}
+
+    assert _request('GET', '/api/crop/does_not_exist.jpg')[0] == 404
+
+
+def test_upload_body_in_chunks():
+    body, content_type = _multipart([('image', 'fake.jpg', b'fake image data' * 1000)])
+    status, _, response, _ = _request('POST', '/api/analyze', body, [('content-type', content_type)], chunk_size=1000)
+    assert status == 400 and b'Could not decode image' in response
+
+
+def test_streamed_batch_response():
+    body, content_type = _multipart([('images', f'{i}.jpg', b'not an image') for i in range(3)])
+    status, headers, response, messages = _request('POST', '/api/analyze_batch', body, [('content-type', content_type)])
+    assert status == 200 and headers['content-type'] == 'application/x-ndjson'
+    lines = [json.loads(line) for line in io.BytesIO(response)]
+    assert [line['filename'] for line in lines] == ['0.jpg', '1.jpg', '2.jpg']
+    assert messages > 1  # Sent as produced, not buffered into one body
+
+
+def test_app_exception_returns_500():
+    def failing_app(environ, start_response):
+        raise RuntimeError('handler failed')  # e.g. Flask with PROPAGATE_EXCEPTIONS
+
+    status, _, body, _ = _request('GET', '/api/health', asgi_app=WsgiToAsgi(failing_app, ThreadPoolExecutor(1)))
+    assert status == 500 and body == b'Internal Server Error'
+
+
+def test_client_disconnect_stops_streamed_response():
+    closed = threading.Event()
+
+    def endless_app(environ, start_response):
+        start_response('200 OK', [('Content-Type', 'application/x-ndjson')])
+        try:
+            for i in itertools.count():
+                yield f'{{"line": {i}}}\n'.encode()
+        finally:
+            closed.set()  # Runs when the bridge closes the iterable
+
+    executor = ThreadPoolExecutor(1)
+    sent = _request('POST', '/api/analyze_batch', asgi_app=WsgiToAsgi(endless_app, executor), disconnect_after=3)
+    assert sent[0]['status'] == 200 and 3 <= len(sent) - 1 < 20  # Stopped soon after the disconnect
+    assert closed.wait(5)
+    # The handler thread was released: the executor's only thread takes the next request
+    assert executor.submit(lambda: 'free').result(timeout=5) == 'free'
+
+
+def test_legacy_write_callable():
+    def writing_app(environ, start_response):
+        write = start_response('200 OK', [('Content-Type', 'text/plain')])
+        write(b'written ')
+        return [b'and returned']
+
+    status, headers, body, _ = _request('GET', '/', asgi_app=WsgiToAsgi(writing_app, ThreadPoolExecutor(1)))
+    assert status == 200 and headers['content-type'] == 'text/plain'
+    assert body == b'written and returned'
@@ -0,0 +1,104 @@
+import os
+import tarfile
+
+import cv2
+import numpy as np
+import pytest
+
+from dataset_store import DatasetStore, calibration_folder
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = DatasetStore(str(tmp_path / 'dataset'))
+    yield store
+    store.close()
+
+
+def _image(value):
+    return np.full((32, 48, 3), value, dtype=np.uint8)
+
+
+def test_add_and_read_back(store):
+    store.add('referee', 'referee_auto_a', _image(10), '0 0.5 0.5 0.2 0.4\n', class_id=0, bbox=[1, 2, 3, 4],
+              image_hash='abc', source_filename='a.jpg')
+    assert 'referee_auto_a' in store and len(store) == 1
+    assert np.array_equal(store.get_image('referee_auto_a'), _image(10))
+    row = store.samples('referee')[0]
+    assert (row['class_id'], row['image_hash'], row['source_filename']) == (0, 'abc', 'a.jpg')
+    assert store.get_image('missing') is None
+
+    # The shard is a plain tar in WebDataset layout
+    with tarfile.open(os.path.join(store.root, 'referee-000000.tar')) as tar:
+        assert tar.getnames() == ['referee_auto_a.png', 'referee_auto_a.txt', 'referee_auto_a.json']
+
+
+def test_signal_sample_reuses_referee_image(store):
+    store.add('referee', 'referee_auto_a', _image(10), '0 0.5 0.5 0.2 0.4\n')
+    store.add('signal', 'signal_a', None, '4 0.5 0.5 1.0 1.0\n', class_id=4, image_ref='referee_auto_a')
+    with tarfile.open(os.path.join(store.root, 'signal-000000.tar')) as tar:
+        assert tar.getnames() == ['signal_a.txt', 'signal_a.json']  # No second PNG
+    assert np.array_equal(store.get_image('signal_a'), _image(10))
+    # A reference that isn't stored falls back to the image itself
+    store.add('signal', 'signal_b', _image(20), None, image_ref='referee_auto_missing')
+    assert np.array_equal(store.get_image('signal_b'), _image(20))
+
+
+def test_shard_rollover_and_reopen(tmp_path):
+    root = str(tmp_path / 'dataset')
+    store = DatasetStore(root, shard_max_bytes=1)  # Every sample fills a shard
+    for i in range(3):
+        store.add('referee', f'k{i}', _image(i), f'0 0.5 0.5 0.{i + 1} 0.5\n')
+    store.close()
+    assert sorted(f for f in os.listdir(root) if f.endswith('.tar')) == [
+        'referee-000000.tar', 'referee-000001.tar', 'referee-000002.tar']
+
+    reopened = DatasetStore(root)
+    reopened.add('referee', 'k3', _image(3))  # Appended to the last shard
+    reopened.close()
+    reopened = DatasetStore(root)
+    assert len(reopened) == 4
+    assert all(np.array_equal(reopened.get_image(f'k{i}'), _image(i)) for i in range(4))
+    reopened.close()
+
+
+def test_export_and_import(store, tmp_path):
+    store.add('referee', 'r1', _image(10), '0 0.5 0.5 0.2 0.4\n')
+    store.add('referee', 'r2', _image(20), None)
+    store.add('signal', 's1', None, '2 0.5 0.5 1.0 1.0\n', image_ref='r1')
+
+    out = tmp_path / 'yolo'
+    assert store.export_yolo('referee', str(out)) == 2
+    assert sorted(os.listdir(out / 'images')) == ['r1.png', 'r2.png']
+    assert os.listdir(out / 'labels') == ['r1.txt']
+    assert np.array_equal(cv2.imread(str(out / 'images' / 'r1.png')), _image(10))
+
+    flat = tmp_path / 'flat'
+    assert store.export_yolo('signal', str(flat), layout='flat') == 1
+    assert sorted(os.listdir(flat)) == ['s1.png', 's1.txt']
+
+    other = DatasetStore(str(tmp_path / 'other'))
+    assert other.import_folder('signal', str(flat)) == 1
+    assert other.samples('signal')[0]['class_id'] == 2
+    assert other.import_folder('signal', str(flat)) == 0  # Already stored
+    other.close()
+
+
+def test_calibration_folder(store, tmp_path):
+    empty = tmp_path / 'signal_training_data'
+    empty.mkdir()
+    assert calibration_folder(str(empty), store.root, 'signal') == str(empty)  # Nothing stored either
+
+    store.add('referee', 'r1', _image(10), '0 0.5 0.5 0.2 0.4\n')
+    store.add('signal', 's1', None, '2 0.5 0.5 1.0 1.0\n', image_ref='r1')
+    folder = calibration_folder(str(empty), store.root, 'signal', max_images=200)
+    assert folder != str(empty) and sorted(os.listdir(folder)) == ['s1.png', 's1.txt']
+    assert np.array_equal(cv2.imread(os.path.join(folder, 's1.png')), _image(10))  # The reused referee crop
+
+    store.add('signal', 's2', _image(30), '3 0.5 0.5 1.0 1.0\n')
+    assert sorted(os.listdir(calibration_folder(str(empty), store.root, 'signal'))) == ['s1.png', 's1.txt', 's2.png', 's2.txt']
+    assert sorted(os.listdir(calibration_folder(str(empty), store.root, 'signal', max_images=1))) == ['s1.png', 's1.txt']
+
+    # Images in the training data folder (TRAINING_DATA_STORE=files) are used as they are
+    cv2.imwrite(str(empty / 'manual.png'), _image(40))
+    assert calibration_folder(str(empty), store.root, 'signal') == str(empty)
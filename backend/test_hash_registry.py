@@ -0,0 +1,38 @@
+import threading
+from hash_registry import HashRegistry
+
+def test_register_and_lookup(tmp_path):
+    registry = HashRegistry(str(tmp_path / 'hashes.sqlite3'))
+    assert 'abc123' not in registry
+    assert registry.add('abc123') is True
+    assert registry.add('abc123') is False # Second registration is a no-op
+    assert 'abc123' in registry
+    # Exact match only: the old substring test reported prefixes as registered
+    assert 'abc' not in registry
+    # A released claim can be made again
+    registry.discard('abc123')
+    assert 'abc123' not in registry
+    assert registry.add('abc123') is True
+
+def test_migrates_legacy_text_registry_once(tmp_path):
+    legacy = tmp_path / 'image_hashes.txt'
+    legacy.write_text('aaa\nbbb\n\n')
+    db_path = str(tmp_path / 'hashes.sqlite3')
+    registry = HashRegistry(db_path, legacy_path=str(legacy))
+    assert 'aaa' in registry and 'bbb' in registry
+    assert len(registry) == 2
+
+    # Hashes appended to the old file after migration are not imported again
+    legacy.write_text('aaa\nbbb\nccc\n')
+    assert 'ccc' not in HashRegistry(db_path, legacy_path=str(legacy))
+
+def test_concurrent_registration_is_atomic(tmp_path):
+    registry = HashRegistry(str(tmp_path / 'hashes.sqlite3'))
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(registry.add('same_hash'))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results.count(True) == 1
+    assert len(registry) == 1
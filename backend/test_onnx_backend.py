@@ -0,0 +1,81 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip('onnxruntime')
+from models.onnx_backend import export_onnx, load_onnx_model, onnx_path_for, set_onnx_threads
+
+MODEL_SIZE = 640
+
+
+@pytest.fixture(scope='module')
+def checkpoint(tmp_path_factory):
+    from ultralytics import YOLO
+    # Randomly initialised YOLOv8n built from its yaml: same architecture family, no download needed
+    path = str(tmp_path_factory.mktemp('models') / 'detector.pt')
+    YOLO('yolov8n.yaml').save(path)
+    return path
+
+
+@pytest.fixture(scope='module')
+def images():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, (MODEL_SIZE, MODEL_SIZE, 3), dtype=np.uint8) for _ in range(4)]
+
+
+def test_export_is_cached_next_to_checkpoint(checkpoint):
+    onnx_path = export_onnx(checkpoint, MODEL_SIZE)
+    assert onnx_path == onnx_path_for(checkpoint) and os.path.exists(onnx_path)
+    mtime = os.path.getmtime(onnx_path)
+    assert export_onnx(checkpoint, MODEL_SIZE) == onnx_path
+    assert os.path.getmtime(onnx_path) == mtime  # Not exported again
+
+
+def test_onnx_matches_pytorch(checkpoint):
+    import onnxruntime
+    import torch
+    from ultralytics import YOLO
+
+    batch = np.random.default_rng(1).random((2, 3, MODEL_SIZE, MODEL_SIZE), dtype=np.float32)
+    torch_model = YOLO(checkpoint).model.float().eval()
+    with torch.no_grad():
+        expected = torch_model(torch.from_numpy(batch))[0].numpy()
+    session = onnxruntime.InferenceSession(export_onnx(checkpoint, MODEL_SIZE), providers=['CPUExecutionProvider'])
+    actual = session.run(None, {session.get_inputs()[0].name: batch})[0]
+
+    assert actual.shape == expected.shape
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-2)
+
+
+def test_onnx_threads_and_latency(checkpoint, images):
+    import torch
+    from ultralytics import YOLO
+
+    torch_model = YOLO(checkpoint)
+    onnx_model = load_onnx_model(checkpoint, MODEL_SIZE)
+    for model in (torch_model, onnx_model):
+        model(images, conf=0.25, verbose=False)  # Warmup / predictor setup
+
+    threads = os.cpu_count() or 1
+    set_onnx_threads(onnx_model, threads)
+    session = onnx_model.predictor.model.backend.session
+    assert session.get_session_options().intra_op_num_threads == threads
+
+    # The recreated session still gives the PyTorch outputs (raw tensors: detections of a random
+    # model near the confidence threshold would flip between the two)
+    batch = np.random.default_rng(2).random((2, 3, MODEL_SIZE, MODEL_SIZE), dtype=np.float32)
+    with torch.no_grad():
+        expected = torch_model.model.float().eval()(torch.from_numpy(batch))[0].numpy()
+    actual = session.run(None, {session.get_inputs()[0].name: batch})[0]
+    np.testing.assert_allclose(actual, expected, rtol=1e-3, atol=1e-2)
+
+    def latency(model):
+        start = time.perf_counter()
+        for _ in range(3):
+            model(images, conf=0.25, verbose=False)
+        return (time.perf_counter() - start) * 1000 / (3 * len(images))
+
+    # Reported only: timings on shared machines are too noisy to assert on
+    print(f"\nper image: torch {latency(torch_model):.1f} ms, onnxruntime ({threads} threads) {latency(onnx_model):.1f} ms")
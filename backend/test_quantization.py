@@ -0,0 +1,61 @@
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip('onnxruntime')
+from models.onnx_backend import int8_path_for, load_onnx_model, quantize_onnx
+from quantization_report import average_precision_50, compare, load_labelled_images
+
+MODEL_SIZE = 640
+
+
+@pytest.fixture(scope='module')
+def checkpoint(tmp_path_factory):
+    from ultralytics import YOLO
+    path = str(tmp_path_factory.mktemp('models') / 'detector.pt')
+    YOLO('yolov8n.yaml').save(path)
+    return path
+
+
+@pytest.fixture(scope='module')
+def training_data(tmp_path_factory):
+    folder = tmp_path_factory.mktemp('training_data')
+    rng = np.random.default_rng(0)
+    for i in range(3):
+        cv2.imwrite(str(folder / f'sample_{i}.png'), rng.integers(0, 256, (360, 480, 3), dtype=np.uint8))
+        (folder / f'sample_{i}.txt').write_text('0 0.5 0.5 0.25 0.5\n')
+    return str(folder)
+
+
+def test_static_quantization_is_cached_and_loadable(checkpoint, training_data):
+    int8_path = quantize_onnx(checkpoint, MODEL_SIZE, training_data)
+    assert int8_path == int8_path_for(checkpoint) and os.path.exists(int8_path)
+    mtime = os.path.getmtime(int8_path)
+    assert quantize_onnx(checkpoint, MODEL_SIZE, training_data) == int8_path
+    assert os.path.getmtime(int8_path) == mtime
+
+    model = load_onnx_model(checkpoint, MODEL_SIZE, int8=True)
+    results = model(np.zeros((MODEL_SIZE, MODEL_SIZE, 3), dtype=np.uint8), verbose=False)
+    assert len(results) == 1
+
+
+def test_report_compares_fp32_and_int8(checkpoint, training_data):
+    assert len(load_labelled_images(training_data)) == 3
+    report = compare(checkpoint, training_data)
+    assert report['images'] == 3
+    assert 0.0 <= report['agreement'] <= 1.0
+    for name in ('fp32', 'int8'):
+        assert 0.0 <= report[name]['map50'] <= 1.0
+        assert report[name]['ms_per_image'] > 0
+
+
+def test_average_precision_50():
+    box = (0.1, 0.1, 0.5, 0.5)
+    labels = [[(0, box)], [(0, box)]]
+    assert average_precision_50([[(0, 0.9, box)], [(0, 0.8, box)]], labels) == pytest.approx(1.0)
+    # One image found, the other missed: precision 1 up to recall 0.5
+    assert average_precision_50([[(0, 0.9, box)], []], labels) == pytest.approx(0.5)
+    # Wrong class or a box that doesn't overlap count for nothing
+    assert average_precision_50([[(1, 0.9, box)], [(0, 0.9, (0.6, 0.6, 0.9, 0.9))]], labels) == 0.0
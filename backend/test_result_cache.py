@@ -0,0 +1,31 @@
+from result_cache import ResultCache
+
+def test_get_put_and_hit_rate(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite3'))
+    assert cache.get('referee', 'w1', 'abc') is None
+    cache.put('referee', 'w1', 'abc', {'detected': True, 'bbox': [1, 2, 3, 4]})
+    assert cache.get('referee', 'w1', 'abc') == {'detected': True, 'bbox': [1, 2, 3, 4]}
+    assert cache.get('signal', 'w1', 'abc') is None # Results are per model
+    assert cache.stats()['referee'] == {'hits': 1, 'misses': 1, 'hit_rate': 0.5}
+    assert 'referee_app_result_cache_requests_total{model="referee",result="hit"} 1' in cache.prometheus('referee_app')
+
+def test_new_weights_invalidate_old_results(tmp_path):
+    db_path = str(tmp_path / 'cache.sqlite3')
+    cache = ResultCache(db_path)
+    cache.put('referee', 'w1', 'abc', {'detected': False, 'bbox': None})
+    cache.put('signal', 's1', 'abc', {'predicted_class': 'net'})
+    # Restarted with retrained referee weights: its old entries are dropped, the signal ones kept
+    cache = ResultCache(db_path)
+    assert cache.get('referee', 'w2', 'abc') is None
+    assert len(cache) == 1 and cache.stats()['entries'] == 1
+    assert cache.get('signal', 's1', 'abc') == {'predicted_class': 'net'}
+
+def test_least_recently_used_are_evicted(tmp_path):
+    cache = ResultCache(str(tmp_path / 'cache.sqlite3'), max_entries=2)
+    cache.put('referee', 'w1', 'a', {'n': 1})
+    cache.put('referee', 'w1', 'b', {'n': 2})
+    assert cache.get('referee', 'w1', 'a') == {'n': 1} # 'b' is now the least recently used
+    cache.put('referee', 'w1', 'c', {'n': 3})
+    assert len(cache) == 2
+    assert cache.get('referee', 'w1', 'b') is None
+    assert cache.get('referee', 'w1', 'a') is not None and cache.get('referee', 'w1', 'c') is not None
@@ -0,0 +1,63 @@
+import threading
+import time
+
+import pytest
+
+from models.scheduler import MicroBatcher
+
+
+def test_concurrent_requests_share_a_batch():
+    calls = []
+
+    def batch_fn(items):
+        calls.append(list(items))
+        time.sleep(0.01)
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=8, max_wait_ms=50)
+    results = {}
+    barrier = threading.Barrier(8)
+
+    def request(i):
+        barrier.wait()
+        results[i] = batcher(i)
+
+    threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results == {i: i * 2 for i in range(8)}
+    assert len(calls) < 8  # At least some requests were coalesced
+    stats = batcher.stats()
+    assert stats['items'] == 8
+    assert stats['batches'] == len(calls)
+    assert stats['max_batch_size'] <= 8
+
+
+def test_map_keeps_order_and_respects_max_batch_size():
+    sizes = []
+
+    def batch_fn(items):
+        sizes.append(len(items))
+        return [str(item) for item in items]
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=20)
+    assert batcher.map(range(10)) == [str(i) for i in range(10)]
+    assert max(sizes) <= 4
+    assert sum(sizes) == 10
+
+
+def test_batch_errors_reach_every_caller():
+    def batch_fn(items):
+        raise RuntimeError('model failed')
+
+    batcher = MicroBatcher(batch_fn, max_batch_size=4, max_wait_ms=20)
+    futures = [batcher.submit(i) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match='model failed'):
+            future.result(timeout=5)
+    # The worker keeps serving after a failed batch
+    batcher.batch_fn = lambda items: items
+    assert batcher(7) == 7
@@ -0,0 +1,154 @@
+"""
+Load test: concurrent image uploads against a running backend, reporting requests/second and
+p50/p95/p99 latency per concurrency level. Start the server first (from backend/), e.g.
+    python app.py                                      # Flask development server (WSGI)
+    uvicorn asgi:app --port 5000 --log-level warning   # ASGI serving mode
+
+Usage (from the repository root):
+    python benchmarks/bench_api_load.py --url http://127.0.0.1:5000 --concurrency 1 8 32
+    python benchmarks/bench_api_load.py --endpoint /api/analyze --image frame.jpg --json load.json
+
+/api/upload saves every upload (as load_<n>.jpg) in backend/static/uploads; /api/analyze doesn't.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+
+def make_image(width=1280, height=720):
+    """A match-like JPEG: pitch-coloured noise with a dark figure"""
+    rng = np.random.default_rng(0)
+    img = np.full((height, width, 3), (60, 140, 70), dtype=np.uint8)
+    cv2.rectangle(img, (width // 2, height // 4), (width // 2 + width // 12, height - height // 6), (20, 20, 20), -1)
+    img = cv2.add(img, rng.integers(0, 30, img.shape, dtype=np.uint8))
+    return cv2.imencode('.jpg', img)[1].tobytes()
+
+
+def multipart(field, filename, data):
+    boundary = uuid.uuid4().hex
+    body = (f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'
+            f'Content-Type: image/jpeg\r\n\r\n').encode() + data + f'\r\n--{boundary}--\r\n'.encode()
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+class Client:
+    """One keep-alive connection per thread, reopened after errors"""
+
+    def __init__(self, url, timeout):
+        self.url = urlsplit(url)
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def post(self, path, body, content_type):
+        conn = getattr(self.local, 'conn', None)
+        if conn is None:
+            conn = self.local.conn = http.client.HTTPConnection(self.url.hostname, self.url.port or 80,
+                                                                timeout=self.timeout)
+        try:
+            conn.request('POST', path, body, {'Content-Type': content_type})
+            response = conn.getresponse()
+            response.read()
+            return response.status
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            self.local.conn = None
+            raise
+
+
+def run_level(client, endpoint, image, requests, concurrency, counter):
+    """Sends `requests` uploads from `concurrency` threads; returns the stats of this level"""
+    latencies, statuses, errors = [], {}, 0
+    lock = threading.Lock()
+
+    def one(_):
+        nonlocal errors
+        with lock:
+            counter[0] += 1
+            n = counter[0]
+        body, content_type = multipart('image', f'load_{n}.jpg', image)
+        start = time.perf_counter()
+        try:
+            status = client.post(endpoint, body, content_type)
+        except (OSError, http.client.HTTPException):
+            with lock:
+                errors += 1
+            return
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'concurrency': concurrency,
+        'requests': requests,
+        'seconds': round(wall, 3),
+        'requests_per_second': round(len(latencies) / wall, 2) if wall > 0 else 0.0,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 1),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+        'max_ms': round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        'statuses': {str(k): v for k, v in sorted(statuses.items())},
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    parser.add_argument('--endpoint', default='/api/upload')
+    parser.add_argument('--image', help='JPEG to upload (default: a synthetic 1280x720 frame)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--requests', type=int, default=100, help='Requests per concurrency level')
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--json', help='Also write the results to this JSON file')
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, 'rb') as f:
+            image = f.read()
+    else:
+        image = make_image()
+    client = Client(args.url, args.timeout)
+    counter = [int(time.time())]  # Upload names stay unique across runs
+    if args.warmup:
+        run_level(client, args.endpoint, image, args.warmup, 1, counter)
+
+    results = []
+    print(f"{args.requests} x POST {args.url}{args.endpoint} ({len(image) / 1024:.0f} KB image)")
+    print(f"{'conc':>5} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+    for concurrency in args.concurrency:
+        r = run_level(client, args.endpoint, image, args.requests, concurrency, counter)
+        results.append(r)
+        statuses = ' '.join(f"{k}:{v}" for k, v in r['statuses'].items()) + (f" errors:{r['errors']}" if r['errors'] else '')
+        print(f"{concurrency:>5} {r['requests_per_second']:>8.2f} {r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f} "
+              f"{r['p99_ms']:>8.1f} {r['max_ms']:>8.1f}  {statuses}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'url': args.url, 'endpoint': args.endpoint, 'image_bytes': len(image), 'levels': results}, f,
+                      indent=2)
+        print(f"Results written to {args.json}")
+
+
+if __name__ == '__main__':
+    main()
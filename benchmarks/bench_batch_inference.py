@@ -0,0 +1,74 @@
+"""
+Benchmark: frames/sec of RefereeProcessor vs. batch size on a synthetic video.
+
+Usage (from the repository root):
+    python benchmarks/bench_batch_inference.py --frames 240 --batch-sizes 1 2 4 8 16
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from main import RefereeProcessor, REFEREE_MODEL_PATH  # noqa: E402
+
+
+def make_synthetic_video(path, num_frames, width=1280, height=720, fps=30):
+    """Writes a video of a figure-like rectangle drifting across a court-coloured background"""
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    rng = np.random.default_rng(0)
+    background = np.full((height, width, 3), (60, 120, 200), dtype=np.uint8)
+    for i in range(num_frames):
+        frame = background.copy()
+        x = int((width - 120) * (0.5 + 0.4 * np.sin(i / 30)))
+        cv2.rectangle(frame, (x, height // 3), (x + 120, height // 3 + 300), (20, 20, 20), -1)
+        frame = cv2.add(frame, rng.integers(0, 20, frame.shape, dtype=np.uint8))  # sensor-like noise
+        writer.write(frame)
+    writer.release()
+
+
+def run(batch_size, video_path, num_frames, model_path):
+    """Processes a copy of the synthetic video and returns frames/sec"""
+    processor = RefereeProcessor(batch_size=batch_size, model_path=model_path)
+    work_dir = tempfile.mkdtemp(prefix='bench_batch_')
+    try:
+        input_copy = os.path.join(work_dir, os.path.basename(video_path))
+        shutil.copy(video_path, input_copy)
+        start = time.perf_counter()
+        processor._process_single_video(input_copy, os.path.join(work_dir, 'out'), os.path.join(work_dir, 'used'))
+        elapsed = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return num_frames / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=240, help='Number of synthetic frames')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 2, 4, 8, 16])
+    parser.add_argument('--model', default=REFEREE_MODEL_PATH, help='Referee detection weights')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='bench_video_')
+    try:
+        video_path = os.path.join(tmp_dir, 'synthetic.mp4')
+        make_synthetic_video(video_path, args.frames)
+        run(1, video_path, args.frames, args.model)  # Warmup (model load, allocator, tracker init)
+
+        print(f"{'batch':>6} {'frames/sec':>12} {'speedup':>8}")
+        baseline = None
+        for batch_size in args.batch_sizes:
+            fps = run(batch_size, video_path, args.frames, args.model)
+            baseline = baseline or fps
+            print(f"{batch_size:>6} {fps:>12.2f} {fps / baseline:>7.2f}x")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
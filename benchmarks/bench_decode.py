@@ -0,0 +1,63 @@
+"""
+Benchmark: decode throughput of the OpenCV and ffmpeg decoders (full resolution, decoder-side
+scaling to MODEL_SIZE, frame stride and a seek into the second half of the video).
+
+Usage (from the repository root):
+    python benchmarks/bench_decode.py --frames 600 --width 1920 --height 1080
+    python benchmarks/bench_decode.py --video path/to/match.mp4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from main import MODEL_SIZE  # noqa: E402
+from utils.decoder import open_decoder  # noqa: E402
+from bench_batch_inference import make_synthetic_video  # noqa: E402
+
+
+def run(backend, video_path, **kwargs):
+    """Returns (decoded frames, seconds)"""
+    decoder = open_decoder(backend, video_path, **kwargs)
+    start = time.perf_counter()
+    try:
+        count = sum(1 for _ in decoder.frames())
+    finally:
+        decoder.close()
+    return count, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--video', default=None, help='Video to decode (default: a synthetic one)')
+    parser.add_argument('--frames', type=int, default=600)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    parser.add_argument('--threads', type=int, default=0)
+    parser.add_argument('--stride', type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        video_path = args.video
+        if video_path is None:
+            video_path = os.path.join(work_dir, 'synthetic.mp4')
+            make_synthetic_video(video_path, args.frames, args.width, args.height)
+        half = open_decoder('opencv', video_path).total_frames // 2
+
+        cases = {
+            'full resolution': {},
+            f'scaled to {MODEL_SIZE}': {'size': (MODEL_SIZE, MODEL_SIZE)},
+            f'stride {args.stride}': {'stride': args.stride},
+            'seek to second half': {'start_frame': half},
+        }
+        print(f"{'case':<22} {'decoder':<8} {'frames':>7} {'seconds':>8} {'fps':>8}")
+        for name, kwargs in cases.items():
+            for backend in ('opencv', 'ffmpeg'):
+                count, seconds = run(backend, video_path, threads=args.threads, **kwargs)
+                print(f"{name:<22} {backend:<8} {count:>7} {seconds:>8.2f} {count / seconds:>8.1f}")
+
+
+if __name__ == '__main__':
+    main()
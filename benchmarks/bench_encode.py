@@ -0,0 +1,77 @@
+"""
+Benchmark: encode speed and output size of the segment encoders (cv2 mp4v, ffmpeg with a few
+codec/preset/CRF settings and the JPEG/PNG frame dump) on synthetic MODEL_SIZE referee crops.
+
+Usage (from the repository root):
+    python benchmarks/bench_encode.py --frames 600
+    python benchmarks/bench_encode.py --codec libx265 --presets ultrafast medium --crfs 23 28
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from main import MODEL_SIZE  # noqa: E402
+from utils.encoder import open_encoder  # noqa: E402
+
+
+def make_crops(num_frames, size=MODEL_SIZE):
+    """A figure-like shape moving slightly inside a noisy crop, as the referee crops do"""
+    rng = np.random.default_rng(0)
+    background = np.full((size, size, 3), (60, 120, 200), dtype=np.uint8)
+    crops = []
+    for i in range(num_frames):
+        crop = background.copy()
+        x = int(size * (0.3 + 0.05 * np.sin(i / 10)))
+        cv2.rectangle(crop, (x, size // 8), (x + size // 3, size - size // 8), (20, 20, 20), -1)
+        crops.append(cv2.add(crop, rng.integers(0, 20, crop.shape, dtype=np.uint8)))
+    return crops
+
+
+def output_bytes(path):
+    if os.path.isdir(path):
+        return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+    return os.path.getsize(path)
+
+
+def run(backend, crops, output_path, **options):
+    """Returns (seconds, output bytes); the time includes waiting for threaded encoders to finish"""
+    start = time.perf_counter()
+    encoder = open_encoder(backend, output_path, 30, (MODEL_SIZE, MODEL_SIZE), **options)
+    for frame_index, crop in enumerate(crops):
+        encoder.write(crop, frame_index)
+    encoder.close()
+    return time.perf_counter() - start, output_bytes(output_path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--frames', type=int, default=300)
+    parser.add_argument('--codec', default='libx264')
+    parser.add_argument('--presets', nargs='+', default=['ultrafast', 'veryfast'])
+    parser.add_argument('--crfs', type=int, nargs='+', default=[23, 28])
+    args = parser.parse_args()
+
+    crops = make_crops(args.frames)
+    cases = [('opencv mp4v', 'opencv', '.mp4', {})]
+    for preset in args.presets:
+        for crf in args.crfs:
+            cases.append((f"ffmpeg {args.codec} {preset} crf{crf}", 'ffmpeg', '.mp4',
+                          {'codec': args.codec, 'preset': preset, 'crf': crf}))
+    cases += [('frames jpg', 'frames', '', {'image_format': 'jpg'}),
+              ('frames png', 'frames', '', {'image_format': 'png'})]
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        print(f"{'encoder':<34} {'fps':>8} {'MB':>8} {'KB/frame':>9}")
+        for i, (name, backend, extension, options) in enumerate(cases):
+            seconds, size = run(backend, crops, os.path.join(work_dir, f"case{i}{extension}"), **options)
+            print(f"{name:<34} {len(crops) / seconds:>8.1f} {size / 1e6:>8.2f} {size / 1e3 / len(crops):>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
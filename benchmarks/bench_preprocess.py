@@ -0,0 +1,79 @@
+"""
+Microbenchmark: per-frame latency and allocations of the legacy _prepare_frame_tensor path
+vs. the buffered FramePreprocessor (stretch and letterbox).
+
+Usage (from the repository root):
+    python benchmarks/bench_preprocess.py --iterations 200 --batch-size 4
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import torch
+from torch.profiler import ProfilerActivity, profile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src'))
+from main import DEVICE, MODEL_SIZE, RefereeProcessor  # noqa: E402
+from utils.preprocess import FramePreprocessor  # noqa: E402
+
+
+def legacy_preprocess(frames):
+    """The original per-frame path, batched the way _track_frames did before FramePreprocessor"""
+    return torch.cat([RefereeProcessor._prepare_frame_tensor(frame) for frame in frames])
+
+
+def measure(fn, frames, iterations):
+    """Returns (ms per frame, numpy/cv2 peak bytes per call, torch bytes allocated per frame)"""
+    fn(frames)  # Warmup, lets the buffered path allocate its buffers once
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn(frames)
+    ms_per_frame = (time.perf_counter() - start) * 1000 / (iterations * len(frames))
+
+    # Host arrays created by OpenCV/numpy are visible to tracemalloc
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    fn(frames)
+    _, numpy_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    # Tensor allocations are only visible to the torch profiler
+    with profile(activities=[ProfilerActivity.CPU], profile_memory=True) as prof:
+        fn(frames)
+    torch_bytes = sum(evt.self_cpu_memory_usage for evt in prof.key_averages() if evt.self_cpu_memory_usage > 0)
+    return ms_per_frame, numpy_peak, torch_bytes / len(frames)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--width', type=int, default=1920)
+    parser.add_argument('--height', type=int, default=1080)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    frames = [rng.integers(0, 256, (args.height, args.width, 3), dtype=np.uint8) for _ in range(args.batch_size)]
+    half = DEVICE == 'cuda'
+    variants = {
+        'legacy (_prepare_frame_tensor)': legacy_preprocess,
+        'buffered stretch': FramePreprocessor(MODEL_SIZE, DEVICE, half=half, max_batch=args.batch_size),
+        'buffered letterbox': FramePreprocessor(MODEL_SIZE, DEVICE, half=half, letterbox=True,
+                                                max_batch=args.batch_size),
+    }
+
+    print(f"{args.width}x{args.height} -> {MODEL_SIZE}x{MODEL_SIZE}, batch {args.batch_size}, device {DEVICE}, "
+          f"{cv2.getNumThreads()} OpenCV threads")
+    print(f"{'variant':<32} {'ms/frame':>9} {'numpy peak KiB':>15} {'torch KiB/frame':>16}")
+    for name, fn in variants.items():
+        ms, numpy_peak, torch_bytes = measure(fn, frames, args.iterations)
+        print(f"{name:<32} {ms:>9.3f} {numpy_peak / 1024:>15.1f} {torch_bytes / 1024:>16.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+Benchmark suite: a reproducible CPU-only run of
+  inference      detect_referee / detect_signal latency and batched throughput (backend/models/inference.py)
+  pipeline       RefereeProcessor frames/sec and per-stage latencies on a synthetic video (src/main.py)
+  endpoints      Flask endpoint requests/sec and latency through the test client (backend/app.py)
+  hash_registry  lookup/insert cost of HashRegistry as the registry grows (backend/hash_registry.py)
+on synthetic images and videos, without network access. Results are written as JSON; --compare
+prints the change against an earlier run and exits with 1 if anything regressed by more than
+--tolerance.
+
+--stub-models replaces both detectors with model-free stubs (benchmarks/stub_models.py), which
+isolates the I/O and pipeline overhead; otherwise the .pt weights in models/ are used.
+
+Usage (from the repository root):
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --stub-models --sections pipeline endpoints --output stub.json
+    python benchmarks/run_benchmarks.py --output new.json --compare bench.json
+"""
+import argparse
+import hashlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+# CPU only, no downloads or update checks: set before torch/ultralytics are imported
+os.environ['CUDA_VISIBLE_DEVICES'] = ''
+os.environ.setdefault('YOLO_OFFLINE', '1')
+os.environ['PRELOAD_MODELS'] = '0'
+os.environ['RESULT_CACHE'] = '0'  # Repeated images must reach the model
+
+import cv2  # noqa: E402
+import numpy as np  # noqa: E402
+import torch  # noqa: E402
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, os.path.join(ROOT, 'backend'))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+from bench_batch_inference import make_synthetic_video  # noqa: E402
+from stub_models import SIGNAL_NAMES, StubDetector  # noqa: E402
+
+SECTIONS = ('inference', 'pipeline', 'endpoints', 'hash_registry')
+
+
+def make_frame(width=1280, height=720, seed=0):
+    """A court-coloured frame with a figure-like rectangle and sensor-like noise"""
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), (60, 120, 200), dtype=np.uint8)
+    cv2.rectangle(frame, (width // 2 - 60, height // 3), (width // 2 + 60, height // 3 + 300), (20, 20, 20), -1)
+    return cv2.add(frame, rng.integers(0, 20, frame.shape, dtype=np.uint8))
+
+
+def measure(fn, iterations, warmup=3):
+    """Calls fn() warmup + iterations times; latency stats (ms) of the measured calls"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - start) * 1000)
+    times.sort()
+    return {
+        'iterations': iterations,
+        'mean_ms': round(sum(times) / len(times), 3),
+        'p50_ms': round(times[len(times) // 2], 3),
+        'p95_ms': round(times[min(len(times) - 1, int(0.95 * len(times)))], 3),
+        'min_ms': round(times[0], 3),
+        'per_second': round(1000 * len(times) / sum(times), 2) if sum(times) > 0 else None,
+    }
+
+
+def setup_backend_models(args):
+    """Loads the backend detectors once (real weights, or stubs with --stub-models)"""
+    from models import inference
+    if args.stub_models:
+        inference.referee_model = StubDetector()
+        inference.signal_model = StubDetector(SIGNAL_NAMES, box=(0.3, 0.1, 0.7, 0.6), class_id=4)
+        inference.model_status.update(state='ready', error=None, load_seconds=0.0)
+    else:
+        inference.REFEREE_MODEL_PATH, inference.SIGNAL_MODEL_PATH = args.referee_model, args.signal_model
+        inference.load_models()
+    return inference
+
+
+def bench_inference(args):
+    inference = setup_backend_models(args)
+    micro_batching = inference.MICRO_BATCHING
+    inference.MICRO_BATCHING = False  # Model latency on its own, without the batching window
+    try:
+        frame = make_frame()
+        crop = cv2.resize(frame[240:540, 580:700], (inference.MODEL_SIZE, inference.MODEL_SIZE))
+        inference.stage_metrics.reset()
+        results = {
+            'detect_referee': measure(lambda: inference.detect_referee(frame), args.iterations),
+            'detect_signal': measure(lambda: inference.detect_signal(crop), args.iterations),
+        }
+        batch = [make_frame(seed=i) for i in range(args.batch_size)]
+        batch_stats = measure(lambda: inference.detect_referee_batch(batch), max(1, args.iterations // 4))
+        batch_stats['images_per_second'] = round(batch_stats['per_second'] * len(batch), 2)
+        results[f'detect_referee_batch_{len(batch)}'] = batch_stats
+        results['stages'] = inference.stage_metrics.summary()
+    finally:
+        inference.MICRO_BATCHING = micro_batching
+    return results
+
+
+def bench_pipeline(args, work_dir):
+    import main
+    main.PROFILE_REPORT = False
+    input_dir = os.path.join(work_dir, 'videos')
+    os.makedirs(input_dir, exist_ok=True)
+    video_path = os.path.join(input_dir, 'synthetic.mp4')
+    make_synthetic_video(video_path, args.frames)
+    with open(video_path, 'rb') as f:
+        video = f.read()
+
+    processor = main.RefereeProcessor(batch_size=args.batch_size, model_path=args.referee_model,
+                                      signal_model_path=args.signal_model, cascade=args.cascade,
+                                      preload_model=False)
+    if args.stub_models:
+        processor._model = StubDetector()
+        processor._signal_model = StubDetector(SIGNAL_NAMES, box=(0.3, 0.1, 0.7, 0.6), class_id=4)
+
+    runs = []
+    for run in range(args.pipeline_runs + 1):  # The first run is a warmup (model load, tracker init)
+        with open(video_path, 'wb') as f:  # Processed videos are moved to used_dir
+            f.write(video)
+        processor.process_videos(input_dir, os.path.join(work_dir, f'out{run}'), os.path.join(work_dir, 'used'),
+                                 workers=1)
+        runs.append(processor.profile_report())
+    best = max(runs[1:], key=lambda report: report['fps'] or 0)
+    return {'frames': args.frames, 'batch_size': args.batch_size, 'cascade': args.cascade,
+            'fps': best['fps'], 'fps_runs': [report['fps'] for report in runs[1:]],
+            'wall_seconds': best['wall_seconds'], 'stages': best['stages']}
+
+
+def bench_endpoints(args, work_dir):
+    setup_backend_models(args)
+    cwd = os.getcwd()
+    os.chdir(work_dir)  # app.py creates static/ and data/ relative to the working directory
+    try:
+        import app as app_module
+        client = app_module.app.test_client()
+        jpeg = cv2.imencode('.jpg', make_frame())[1].tobytes()
+        crop = cv2.resize(make_frame()[240:540, 580:700], (640, 640))
+        app_module.cache_crop('bench_crop.png', crop)
+        counter = [0]
+
+        def upload():
+            counter[0] += 1
+            data = {'image': (io.BytesIO(jpeg), f'bench_{counter[0]}.jpg')}
+            response = client.post('/api/upload', data=data, content_type='multipart/form-data')
+            assert response.status_code in (200, 404), response.status_code
+
+        def analyze():
+            data = {'image': (io.BytesIO(jpeg), 'bench.jpg')}
+            assert client.post('/api/analyze', data=data, content_type='multipart/form-data').status_code == 200
+
+        def process_signal():
+            response = client.post('/api/process_signal', json={'crop_filename_for_signal': 'bench_crop.png'})
+            assert response.status_code == 200, response.status_code
+
+        def health():
+            assert client.get('/api/health').status_code == 200
+
+        return {name: measure(fn, args.iterations) for name, fn in
+                [('health', health), ('upload', upload), ('analyze', analyze), ('process_signal', process_signal)]}
+    finally:
+        os.chdir(cwd)
+
+
+def bench_hash_registry(args, work_dir):
+    from hash_registry import HashRegistry
+    results = {}
+    for size in args.registry_sizes:
+        db_path = os.path.join(work_dir, f'hashes_{size}.sqlite3')
+        registry = HashRegistry(db_path)
+        conn = registry._connection()
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO image_hashes (hash) VALUES (?)',
+                             ((hashlib.md5(str(i).encode()).hexdigest(),) for i in range(size)))
+        registry = HashRegistry(db_path)  # Fresh instance: nothing cached in memory yet
+        known = [hashlib.md5(str(i).encode()).hexdigest() for i in range(0, size, max(1, size // 1000))]
+        unknown = [hashlib.md5(f'new-{i}'.encode()).hexdigest() for i in range(1000)]
+        lookups, misses, inserts = iter(known * 10), iter(unknown * 10), iter(unknown)
+        results[str(size)] = {
+            'lookup_known': measure(lambda: next(lookups) in registry, min(args.iterations * 10, len(known)), 0),
+            'lookup_unknown': measure(lambda: next(misses) in registry, args.iterations * 10, 0),
+            'add': measure(lambda: registry.add(next(inserts)), min(args.iterations * 2, len(unknown)), 0),
+        }
+    return results
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b_ms': 1}} -> {'a.b_ms': 1}, numeric leaves only"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(current, baseline, tolerance):
+    """Prints mean/p95 latency and throughput (fps, *per_second) changes; returns the regressions"""
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    regressions = []
+    print(f"\nCompared with {baseline['meta'].get('commit') or '?'} ({baseline['meta']['timestamp']}):")
+    if baseline['meta'].get('models') != current['meta'].get('models'):
+        print("[WARNING] The runs used different models, the numbers aren't comparable")
+    for key in sorted(set(old) & set(new)):
+        lower_is_better = key.endswith('mean_ms') or key.endswith('p95_ms')
+        higher_is_better = key.endswith('fps') or key.endswith('per_second')
+        if not (lower_is_better or higher_is_better) or not old[key]:
+            continue
+        change = (new[key] - old[key]) / old[key]
+        worse = change > tolerance if lower_is_better else change < -tolerance
+        if worse:
+            regressions.append(key)
+        print(f"  {key:<60} {old[key]:>10.3f} -> {new[key]:>10.3f} {100 * change:>+7.1f}%{'  REGRESSION' if worse else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sections', nargs='+', choices=SECTIONS, default=list(SECTIONS))
+    parser.add_argument('--stub-models', action='store_true', help='Model-free stub detectors')
+    parser.add_argument('--referee-model', default=os.path.join(ROOT, 'models', 'bestRefereeDetection.pt'))
+    parser.add_argument('--signal-model', default=os.path.join(ROOT, 'models', 'bestSignalsDetection.pt'))
+    parser.add_argument('--iterations', type=int, default=30, help='Measured calls per latency benchmark')
+    parser.add_argument('--batch-size', type=int, default=4)
+    parser.add_argument('--frames', type=int, default=120, help='Frames of the synthetic pipeline video')
+    parser.add_argument('--pipeline-runs', type=int, default=2, help='Measured pipeline runs (best one is kept)')
+    parser.add_argument('--cascade', action='store_true', help='Run the signal model in the pipeline too')
+    parser.add_argument('--registry-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--threads', type=int, default=1, help='torch/OpenCV threads (fixed for comparable runs)')
+    parser.add_argument('--output', default='benchmark_results.json')
+    parser.add_argument('--compare', help='Earlier results JSON to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10, help='Relative change counted as a regression')
+    args = parser.parse_args()
+
+    torch.set_num_threads(args.threads)
+    cv2.setNumThreads(args.threads)
+    np.random.seed(0)
+    torch.manual_seed(0)
+
+    report = {
+        'meta': {
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'torch': torch.__version__,
+            'opencv': cv2.__version__,
+            'models': 'stub' if args.stub_models else [args.referee_model, args.signal_model],
+            'args': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')},
+        },
+        'results': {},
+    }
+    with tempfile.TemporaryDirectory(prefix='bench_suite_') as work_dir:
+        for section in args.sections:
+            print(f"[INFO] Running {section} benchmarks...")
+            start = time.perf_counter()
+            section_dir = os.path.join(work_dir, section)
+            os.makedirs(section_dir)
+            if section == 'inference':
+                result = bench_inference(args)
+            elif section == 'pipeline':
+                result = bench_pipeline(args, section_dir)
+            elif section == 'endpoints':
+                result = bench_endpoints(args, section_dir)
+            else:
+                result = bench_hash_registry(args, section_dir)
+            report['results'][section] = result
+            print(f"[INFO] {section} done in {time.perf_counter() - start:.1f}s")
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    for key, value in sorted(flatten(report['results']).items()):
+        if (key.endswith('mean_ms') or key.endswith('fps') or key.endswith('per_second')) and '.stages.' not in key:
+            print(f"  {key:<60} {value:>10.3f}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {100 * args.tolerance:.0f}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
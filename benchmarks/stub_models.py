@@ -0,0 +1,67 @@
+"""
+Model-free stand-ins for the ultralytics YOLO models, so benchmarks can measure decode, crop,
+encode, hashing and request handling without the cost (or the weights) of a real forward pass.
+
+A StubDetector answers __call__/predict/track like a YOLO model with one fixed box per image:
+numpy images (the backend) get it in their own pixel coordinates, BCHW tensors (the video
+pipeline) in model input coordinates. `latency_ms` adds a fixed sleep per image to simulate a
+model of a given speed.
+"""
+import time
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+REFEREE_NAMES = {0: 'referee'}
+SIGNAL_NAMES = {i: name for i, name in enumerate(
+    ['armLeft', 'armRight', 'hits', 'leftServe', 'net', 'outside', 'rightServe', 'touched'])}
+
+
+class StubBoxes:
+    def __init__(self, xyxy, xywhn, cls, conf):
+        self.xyxy = torch.tensor([xyxy], dtype=torch.float32)
+        self.xywhn = torch.tensor([xywhn], dtype=torch.float32)
+        self.cls = torch.tensor([cls], dtype=torch.float32)
+        self.conf = torch.tensor([conf], dtype=torch.float32)
+
+
+class StubResults:
+    def __init__(self, boxes, speed):
+        self.boxes = boxes
+        self.speed = speed
+
+
+class StubDetector:
+    """Returns the normalized box `box` (x1, y1, x2, y2) of class `class_id` for every image"""
+
+    def __init__(self, names=REFEREE_NAMES, box=(0.45, 0.3, 0.55, 0.75), class_id=0, confidence=0.9, latency_ms=0.0):
+        self.names = dict(names)
+        self.box = box
+        self.class_id = class_id
+        self.confidence = confidence
+        self.latency_ms = latency_ms
+        self.predictor = SimpleNamespace(trackers=[])  # track(persist=True) state the pipeline checkpoints
+        self.calls = 0
+
+    def __call__(self, source, conf=None, verbose=False, **kwargs):
+        if isinstance(source, torch.Tensor):
+            sizes = [tuple(source.shape[2:])] * source.shape[0]
+        else:
+            images = source if isinstance(source, list) else [source]
+            sizes = [np.asarray(image).shape[:2] for image in images]
+        start = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms * len(sizes) / 1000)
+        self.calls += 1
+        x1, y1, x2, y2 = self.box
+        xywhn = [(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+        results = [StubResults(StubBoxes([x1 * w, y1 * h, x2 * w, y2 * h], xywhn, self.class_id, self.confidence), {})
+                   for h, w in sizes]
+        ms = (time.perf_counter() - start) * 1000 / max(1, len(sizes))
+        for results_item in results:
+            results_item.speed = {'preprocess': 0.0, 'inference': ms, 'postprocess': 0.0}
+        return results
+
+    predict = __call__
+    track = __call__
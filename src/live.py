@@ -0,0 +1,42 @@
+"""
+Live referee and signal detection on a stream (see RefereeProcessor.process_stream).
+
+Usage (from src/):
+    python live.py rtsp://camera.local:554/court1
+    python live.py https://example.com/match/playlist.m3u8 --name court1
+    ffmpeg -i capture_device ... -f mpegts - | python live.py -
+    python live.py ../data/recording.ts --follow                  # File still being recorded
+    python live.py ../data/input_videos/match.mp4 --replay        # Test: replay a file at its native fps
+
+Signal starts and finished signal events are printed as they happen; every event (referee boxes
+too) goes to {output}/{name}_live.jsonl with its end-to-end latency.
+"""
+import argparse
+import json
+
+import main
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('source', help="Stream URL, '-' for stdin or a file path")
+    parser.add_argument('--replay', action='store_true', help='Read a file at its native frame rate')
+    parser.add_argument('--follow', action='store_true', help='Keep reading a file that is still being written')
+    parser.add_argument('--fps', type=float, help='Stream frame rate (probed when not given, 30 for stdin)')
+    parser.add_argument('--name', help='Name of the output logs (default: from the source)')
+    parser.add_argument('--output', default=main.LIVE_OUTPUT_DIR)
+    parser.add_argument('--write-video', action='store_true', help='Also write the cropped referee video')
+    parser.add_argument('--verbose', action='store_true', help='Print referee boxes too')
+    args = parser.parse_args()
+
+    def on_event(event):
+        if args.verbose or event['type'] != 'referee':
+            print(json.dumps(event))
+
+    processor = main.RefereeProcessor(cascade=True, write_video=args.write_video)
+    processor.process_stream(args.source, args.output, name=args.name, fps=args.fps, realtime=args.replay,
+                             follow=args.follow, on_event=on_event)
+
+
+if __name__ == '__main__':
+    main_cli()
@@ -1,29 +1,208 @@
 import os
+import glob
+import itertools
+import multiprocessing
+import sys
+import threading
+import time
 import cv2
 import torch
 from datetime import datetime
-from ultralytics import YOLO
+
+# Modules shared with the backend are imported from backend/ rather than kept in two copies
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'backend'))
+if BACKEND_DIR not in sys.path:
+    sys.path.append(BACKEND_DIR)
+
+from dataset_store import calibration_folder
+from metrics import StageMetrics
+from models.onnx_backend import CALIBRATION_MAX_IMAGES, export_onnx, load_onnx_model, quantize_onnx, set_onnx_threads
+from utils.checkpoint import VideoCheckpoint
+from utils.decoder import open_decoder, probe_video
+from utils.encoder import ENCODERS, open_encoder
+from utils.motion import MotionGate
+from utils.pipeline import run_pipeline
+from utils.preprocess import FramePreprocessor
+from utils.signals import SignalAggregator, SignalEventLog
+from utils.stream import LiveEventLog, LiveStream
 
 # Configuration
-DEVICE = 'cuda' if torch.cuda.is_available() else 'cpu'
+# 'torch' = .pt with PyTorch, 'onnx' = cached ONNX export with onnxruntime (CPU),
+# 'onnx_int8' = INT8 variant of that export, calibrated on INT8_CALIBRATION_DIR
+INFERENCE_BACKEND = 'torch'
+ONNX_THREADS = 0  # onnxruntime intra-op threads (0 = onnxruntime default)
+ONNX_BACKENDS = ('onnx', 'onnx_int8')
+DEVICE = 'cuda' if torch.cuda.is_available() and INFERENCE_BACKEND not in ONNX_BACKENDS else 'cpu'
 MODEL_SIZE = 640  # Model input size
 SEGMENT_DURATION = 3600  # 1 hour in seconds
 CONFIDENCE_THRESHOLD = 0.7
+BATCH_SIZE = 1  # Frames per forward pass (1 = original frame-by-frame behaviour)
+PIPELINED = True  # Run decode, inference and encode in separate stages
+PIPELINE_QUEUE_SIZE = 16  # Max frames buffered between stages (bounds memory, applies backpressure)
+NUM_WORKERS = 1  # Worker processes for process_videos (1 = process videos in this process)
+PROFILE_REPORT = True  # Print per-stage timings (decode, preprocess, inference, ...) after process_videos
+# Save progress (frame, segment, tracker and smoothing state) after every finished segment so an
+# interrupted run resumes from there; kept in CHECKPOINT_DIR inside the output directory (see utils/checkpoint.py)
+CHECKPOINTS = True
+CHECKPOINT_DIR = '.checkpoints'
+
+# Adaptive inference: None runs the model on every frame, 'stride' every ADAPTIVE_STRIDE frames,
+# 'diff'/'histogram' when the scene changes by more than ADAPTIVE_THRESHOLD (see utils/motion.py)
+ADAPTIVE_MODE = None
+ADAPTIVE_STRIDE = 5  # Max frames between detections
+ADAPTIVE_THRESHOLD = 0.02  # Mean abs thumbnail difference ('diff') or histogram distance ('histogram'), 0-1
+
+# Video decoding: 'opencv' (cv2.VideoCapture) or 'ffmpeg' (ffmpeg subprocess pipe, see utils/decoder.py)
+DECODER = 'opencv'
+DECODE_THREADS = 0  # Decoder threads (0 = decoder default)
+DECODE_SIZE = None  # (width, height) to scale frames to while decoding, e.g. (MODEL_SIZE, MODEL_SIZE); crops get smaller
+DECODE_STRIDE = 1  # Process every Nth frame only; output videos are written at fps / DECODE_STRIDE
+FFMPEG_HWACCEL = None  # ffmpeg hardware decoder, e.g. 'auto', 'cuda', 'qsv', 'd3d11va' (ffmpeg decoder only)
+
+# Output encoding (see utils/encoder.py): 'opencv' (cv2.VideoWriter, mp4v), 'ffmpeg' (ffmpeg subprocess fed
+# from its own thread, ENCODER_CODEC/PRESET/CRF) or 'frames' (a folder of JPEG/PNG crops with YOLO label stubs)
+ENCODER = 'opencv'
+ENCODER_CODEC = 'libx264'  # e.g. 'libx265', 'h264_nvenc'
+ENCODER_PRESET = 'veryfast'
+ENCODER_CRF = 23  # Lower = better quality and bigger files
+FRAMES_FORMAT = 'jpg'  # 'jpg' or 'png' ('frames' encoder)
+FRAMES_JPEG_QUALITY = 95
+FRAMES_LABEL_STUBS = True  # Label each crop as a referee box covering it (False writes empty .txt stubs)
+
+FAST_PREPROCESS = True  # Fill a reusable (pinned on CUDA) batch buffer instead of allocating tensors per frame
+LETTERBOX = False  # Keep the frame aspect ratio when resizing to MODEL_SIZE (pads instead of stretching)
+
+# Cascade mode: run the signal model on every referee crop as it is produced and write a
+# {video}_signals.jsonl event log (signal, confidence, frame range) next to the output videos
+CASCADE_MODE = False
+WRITE_CROPPED_VIDEO = True  # False skips the cropped video entirely (cascade mode only needs the event log)
+
+# Temporal smoothing of the cascade predictions (see utils/signals.py): 'ema' or 'vote' per signal class,
+# None groups raw per-frame predictions. Events need SIGNAL_MIN_FRAMES smoothed frames to start or end.
+SIGNAL_SMOOTHING = 'ema'
+SIGNAL_EMA_ALPHA = 0.5  # Weight of the newest frame in the moving average
+SIGNAL_VOTE_WINDOW = 5  # Frames in the sliding vote window
+SIGNAL_SCORE_THRESHOLD = 0.5  # Min smoothed score (EMA confidence or vote share) for a signal
+SIGNAL_MIN_FRAMES = 3  # Debounce
+SIGNAL_MAX_GAP = 15  # Frames without a crop that end an event
+SIGNAL_RECHECK_STRIDE = 5  # Once a signal is confirmed, run the signal model only every N frames until it ends
+
+# Live mode (process_stream, see utils/stream.py): frames are taken from an RTSP/HLS URL, a pipe or a
+# growing file as they arrive, and dropped when inference falls behind so latency stays bounded
+LIVE_FRAME_SIZE = (1280, 720)  # Frames are scaled to this size while decoding (bboxes are in these coordinates)
+LIVE_MAX_QUEUE = 2  # Frames waiting for inference; the oldest is dropped when another one arrives
+LIVE_MAX_LATENCY = 0.5  # Seconds a frame may wait for inference before it's dropped (the newest is always kept)
+LIVE_OUTPUT_DIR = '../data/live'  # {name}_live.jsonl (bboxes + signals with latencies) and {name}_signals.jsonl
+
+REFEREE_MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'bestRefereeDetection.pt')
+SIGNAL_MODEL_PATH = os.path.join(os.path.dirname(__file__), '..', 'models', 'bestSignalsDetection.pt')
+INT8_CALIBRATION_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend', 'data', 'referee_training_data')
+SIGNAL_INT8_CALIBRATION_DIR = os.path.join(os.path.dirname(__file__), '..', 'backend', 'data', 'signal_training_data')
+# Backend training samples stored in shards (TRAINING_DATA_STORE=shards) instead of the folders above;
+# exported for calibration when the folders are empty (see calibration_folder in backend/dataset_store.py)
+DATASET_STORE_DIR = os.path.join(BACKEND_DIR, 'data', 'dataset')
+
+# Signal classes (same order as the signal model, see backend/models/inference.py)
+SIGNAL_CLASSES = ['armLeft', 'armRight', 'hits', 'leftServe', 'net', 'outside', 'rightServe', 'touched']
 
 
 class RefereeProcessor:
-    def __init__(self):
-        # Load trained model from the models directory
-        self.model = YOLO('../models/bestRefereeDetection.pt').to(DEVICE)
-        self.model.fuse()
+    def __init__(self, batch_size=BATCH_SIZE, model_path=REFEREE_MODEL_PATH, pipelined=PIPELINED,
+                 queue_size=PIPELINE_QUEUE_SIZE, adaptive_mode=ADAPTIVE_MODE, adaptive_stride=ADAPTIVE_STRIDE,
+                 adaptive_threshold=ADAPTIVE_THRESHOLD, fast_preprocess=FAST_PREPROCESS, letterbox=LETTERBOX,
+                 cascade=CASCADE_MODE, write_video=WRITE_CROPPED_VIDEO, signal_model_path=SIGNAL_MODEL_PATH,
+                 preload_model=True):
+        # Kept so worker processes can build an identical processor
+        self.init_kwargs = {'batch_size': batch_size, 'model_path': model_path, 'pipelined': pipelined,
+                            'queue_size': queue_size, 'adaptive_mode': adaptive_mode,
+                            'adaptive_stride': adaptive_stride, 'adaptive_threshold': adaptive_threshold,
+                            'fast_preprocess': fast_preprocess, 'letterbox': letterbox, 'cascade': cascade,
+                            'write_video': write_video, 'signal_model_path': signal_model_path}
+
+        # The model is loaded on first use; preload_model starts loading (and warming up) in the
+        # background so it overlaps with listing and opening the input videos
+        self.model_path = model_path
+        self.signal_model_path = signal_model_path
+        self.cascade = cascade
+        self.write_video = write_video or not cascade  # Without cascade mode the video is the only output
+        self._model = None
+        self._signal_model = None
+        self.signal_model_frames = [0, 0]
+        self._model_lock = threading.Lock()
+        if preload_model:
+            threading.Thread(target=self._preload_models, name='model-loader', daemon=True).start()
+        self.batch_size = max(1, int(batch_size))
+        self.pipelined = pipelined
+        self.queue_size = queue_size
+        self.motion_gate = MotionGate(adaptive_mode, adaptive_stride, adaptive_threshold) if adaptive_mode else None
+        # Letterboxing is only implemented by the buffered path
+        self.fast_preprocess = fast_preprocess or letterbox
+        self.preprocessor = FramePreprocessor(MODEL_SIZE, DEVICE, half=DEVICE == 'cuda', letterbox=letterbox,
+                                              max_batch=self.batch_size)
+        # Per-stage latencies and frame counts, see profile_report()
+        self.metrics = StageMetrics()
+        self.wall_seconds = None
+
+    @property
+    def model(self):
+        """The YOLO model, blocking until the background load finishes"""
+        return self._ensure_model()
+
+    @property
+    def class_id(self):
+        """Referee class ID from model metadata"""
+        return self._get_referee_class_id()
+
+    @property
+    def signal_model(self):
+        """The signal model used in cascade mode, loaded on first use like the referee model"""
+        with self._model_lock:
+            if self._signal_model is None:
+                self._signal_model = self._load_model(self.signal_model_path, SIGNAL_INT8_CALIBRATION_DIR, 'signal',
+                                                      track=False)
+        return self._signal_model
+
+    def _ensure_model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = self._load_model(self.model_path, INT8_CALIBRATION_DIR, 'referee')
+        return self._model
+
+    def _preload_models(self):
+        self._ensure_model()
+        if self.cascade:
+            self.signal_model  # Property access loads it
+
+    @staticmethod
+    def _load_model(model_path, calibration_dir, dataset, track=True):
+        """Loads a trained model and runs one warmup pass at MODEL_SIZE"""
+        if INFERENCE_BACKEND in ONNX_BACKENDS:
+            int8 = INFERENCE_BACKEND == 'onnx_int8'
+            if int8:
+                calibration_dir = calibration_folder(calibration_dir, DATASET_STORE_DIR, dataset, CALIBRATION_MAX_IMAGES)
+            model = load_onnx_model(model_path, MODEL_SIZE, int8, calibration_dir)
+        else:
+            from ultralytics import YOLO  # Takes seconds to import; deferred so it can run in the loader thread
+            model = YOLO(model_path).to(DEVICE)
+            model.fuse()
 
         # CUDA optimizations
         if DEVICE == 'cuda':
-            self.model.half()  # Use FP16 precision
+            model.half()  # Use FP16 precision
             torch.backends.cudnn.benchmark = True
 
-        # Get referee class ID from model metadata
-        self.class_id = self._get_referee_class_id()
+        # Sets up the predictor, tracker and kernels before the first real frame
+        blank = torch.zeros((1, 3, MODEL_SIZE, MODEL_SIZE), device=DEVICE,
+                            dtype=torch.float16 if DEVICE == 'cuda' else torch.float32)
+        if track:
+            model.track(blank, conf=CONFIDENCE_THRESHOLD, verbose=False, persist=True)
+            for tracker in getattr(model.predictor, 'trackers', []):
+                tracker.reset()
+        else:
+            model.predict(blank, conf=CONFIDENCE_THRESHOLD, verbose=False)
+        if INFERENCE_BACKEND in ONNX_BACKENDS:
+            set_onnx_threads(model, ONNX_THREADS)
+        return model
 
     def _get_referee_class_id(self):
         """Retrieves the class ID for 'referee' from model names"""
@@ -32,95 +211,465 @@ class RefereeProcessor:
         return 0  # Default to first class if not found
 
     # Use corrected relative paths for data directories
-    def process_videos(self, input_dir='../data/input_videos', output_dir='../data/processed_videos', used_dir='../data/used_videos'):
+    def process_videos(self, input_dir='../data/input_videos', output_dir='../data/processed_videos', used_dir='../data/used_videos',
+                       workers=NUM_WORKERS):
         """Main processing pipeline for video files"""
         os.makedirs(output_dir, exist_ok=True)
         os.makedirs(used_dir, exist_ok=True)
 
-        for video_file in self._get_video_files(input_dir):
-            video_path = os.path.join(input_dir, video_file)
-            self._process_single_video(video_path, output_dir, used_dir)
+        video_paths = [os.path.join(input_dir, video_file) for video_file in self._get_video_files(input_dir)]
+        self.metrics.reset()
+        start = time.perf_counter()
+        if workers > 1:
+            self._process_videos_parallel(video_paths, output_dir, used_dir, workers)
+        else:
+            for video_path in video_paths:
+                self._process_single_video(video_path, output_dir, used_dir)
+        self.wall_seconds = time.perf_counter() - start
+        if PROFILE_REPORT and video_paths:
+            # Stages overlap (pipeline threads, worker processes), so busy % is relative to wall time x workers
+            print(self.metrics.report(self.wall_seconds * max(1, workers)))
+
+    def profile_report(self):
+        """Per-stage summary of the last process_videos run (busy seconds are summed over worker processes)"""
+        stages = self.metrics.summary()
+        frames = stages.get('decode', {}).get('items', 0)
+        wall_seconds = self.wall_seconds
+        return {'wall_seconds': round(wall_seconds, 3) if wall_seconds else None, 'frames': frames,
+                'fps': round(frames / wall_seconds, 2) if wall_seconds else None, 'stages': stages}
+
+    def _process_videos_parallel(self, video_paths, output_dir, used_dir, workers):
+        """Distributes whole videos and segment-sized time ranges over a pool of worker processes"""
+        work_items = self._plan_work_items(video_paths, output_dir)
+        pending, failed = {}, set()
+        for video_path, _, _, _ in work_items:
+            pending[video_path] = pending.get(video_path, 0) + 1
+
+        # Once here, instead of every worker racing to write the cached files
+        models = [(self.model_path, INT8_CALIBRATION_DIR, 'referee')]
+        if self.cascade:
+            models.append((self.signal_model_path, SIGNAL_INT8_CALIBRATION_DIR, 'signal'))
+        for model_path, calibration_dir, dataset in models:
+            if INFERENCE_BACKEND == 'onnx':
+                export_onnx(model_path, MODEL_SIZE)
+            elif INFERENCE_BACKEND == 'onnx_int8':
+                calibration_dir = calibration_folder(calibration_dir, DATASET_STORE_DIR, dataset, CALIBRATION_MAX_IMAGES)
+                quantize_onnx(model_path, MODEL_SIZE, calibration_dir)
+
+        # 'spawn' keeps CUDA and the ultralytics predictor state out of the children
+        context = multiprocessing.get_context('spawn')
+        with context.Pool(workers, initializer=_init_worker, initargs=(self.init_kwargs, workers)) as pool:
+            # chunksize=1 turns the pool's task queue into a shared work queue
+            for video_path, error, metrics in pool.imap_unordered(_run_work_item, work_items, chunksize=1):
+                self.metrics.merge(metrics)
+                if error:
+                    print(f"Error processing {os.path.basename(video_path)}: {error}")
+                    failed.add(video_path)
+                pending[video_path] -= 1
+                # Move the source only once every range of it has been processed successfully
+                if pending[video_path] == 0:
+                    self._finish_video(video_path, output_dir, used_dir, video_path not in failed)
+
+    def _plan_work_items(self, video_paths, output_dir):
+        """Splits videos longer than one segment into per-segment (start_frame, end_frame) ranges"""
+        work_items = []
+        for video_path in video_paths:
+            fps, total_frames, _, _ = probe_video(video_path)
+
+            frames_per_segment = int(SEGMENT_DURATION * fps) if SEGMENT_DURATION > 0 else 0
+            if frames_per_segment <= 0 or total_frames <= frames_per_segment:
+                work_items.append((video_path, output_dir, 0, None))
+                continue
+            for start_frame in range(0, total_frames, frames_per_segment):
+                end_frame = start_frame + frames_per_segment
+                # The container frame count is approximate, so the last range reads to the end
+                work_items.append((video_path, output_dir, start_frame, end_frame if end_frame < total_frames else None))
+        return work_items
 
     def _get_video_files(self, directory):
         """Get list of .mp4 files in target directory"""
         return [f for f in os.listdir(directory) if f.endswith('.mp4')]
 
     def _process_single_video(self, video_path, output_dir, used_dir):
-        """Process individual video file"""
-        cap = cv2.VideoCapture(video_path)
-        fps = cap.get(cv2.CAP_PROP_FPS) # Keep original FPS retrieval
-        if fps <= 0: fps = 30 # Handle potential invalid FPS
-
-        # Video segmentation setup
-        frames_per_segment = int(SEGMENT_DURATION * fps) if SEGMENT_DURATION > 0 else 0
-        segment_counter = 1
-        current_frame = 0
-        video_writer = None
-        last_valid_frame = None
-        target_size = (MODEL_SIZE, MODEL_SIZE) # Define target size
-
+        """Process individual video file, moving it to used_dir only once it was processed completely"""
         try:
-            while cap.isOpened():
-                ret, frame = cap.read()
-                if not ret:
-                    break
-
-                # Process frame through detection pipeline
-                processed_frame = self._process_frame(frame, last_valid_frame)
-
-                if processed_frame is not None:
-                    # --- Ensure frame matches target size before writing ---
-                    if processed_frame.shape[0] != target_size[1] or processed_frame.shape[1] != target_size[0]:
-                       processed_frame = cv2.resize(processed_frame, target_size)
-                    last_valid_frame = processed_frame
-                    current_frame += 1
-
-                    # Manage video segmentation
-                    # Check frames_per_segment only if it's positive
-                    if frames_per_segment > 0 and current_frame % frames_per_segment == 0:
-                        self._close_writer(video_writer)
-                        # Pass target_size to writer creation
-                        video_writer = self._create_new_writer(video_path, output_dir, segment_counter, fps, target_size)
-                        segment_counter += 1
-
-                    # Initialize writer if needed
-                    if video_writer is None:
-                         # Pass target_size to writer creation
-                        video_writer = self._create_new_writer(video_path, output_dir, segment_counter, fps, target_size)
-
-                    # Write processed frame only if writer is valid
-                    if video_writer:
-                       video_writer.write(processed_frame)
-                # --- Keep original behavior: if no detection, nothing is written unless last_valid used ---
-                # --- Consider if writing last_valid_frame on non-detection is desired from original ---
-                # elif last_valid_frame is not None and video_writer is not None:
-                #    video_writer.write(last_valid_frame) # Optional: write last valid frame if needed
+            self._process_video_range(video_path, output_dir)
+        except Exception as e:
+            # The source stays in the input directory; with CHECKPOINTS the next run resumes it
+            print(f"Error processing {os.path.basename(video_path)}: {e}")
+            return
+        self._finish_video(video_path, output_dir, used_dir, True)
+
+    def _finish_video(self, video_path, output_dir, used_dir, success):
+        """Moves a fully processed source to used_dir and drops its checkpoints"""
+        if not success:
+            print(f"{os.path.basename(video_path)} was not processed completely, leaving it in place")
+            return
+        if self._move_processed_file(video_path, used_dir):
+            base_name = os.path.splitext(os.path.basename(video_path))[0]
+            checkpoint_dir = os.path.join(output_dir, CHECKPOINT_DIR)
+            for pattern in (f"{base_name}.checkpoint.json*", f"{base_name}_part*.checkpoint.json*"):
+                for path in glob.glob(os.path.join(glob.escape(checkpoint_dir), pattern)):
+                    os.remove(path)
+
+    def _process_video_range(self, video_path, output_dir, start_frame=0, end_frame=None):
+        """Process frames [start_frame, end_frame) of a video file (the whole video by default)"""
+        name = os.path.basename(video_path)
+        fps = probe_video(video_path)[0]
+        checkpoint, resume_frame = None, start_frame
+        if CHECKPOINTS:
+            checkpoint = VideoCheckpoint(self._checkpoint_path(video_path, output_dir, start_frame, end_frame, fps),
+                                         video_path, start_frame, end_frame)
+            if checkpoint.done:
+                print(f"{name}: already processed (see {checkpoint.path}), skipping")
+                return
+            if checkpoint.resumable:
+                checkpoint.discard_partial_output()
+                resume_frame = checkpoint.get('next_frame', start_frame)
+                if resume_frame > start_frame:
+                    print(f"{name}: resuming from frame {resume_frame} (segment {checkpoint.get('segment_counter') + 1})")
+
+        decoder = open_decoder(DECODER, video_path, resume_frame, end_frame, DECODE_STRIDE, DECODE_SIZE,
+                               DECODE_THREADS, FFMPEG_HWACCEL)
+
+        # Video segmentation setup (strided output plays back at the source speed)
+        segment_writer = SegmentedVideoWriter(self, video_path, output_dir, fps, output_fps=fps / decoder.stride,
+                                              checkpoint=checkpoint)
+        # Every video or range starts with fresh tracks, independent of what was processed before
+        self._reset_tracker()
+        if self.motion_gate is not None:
+            self.motion_gate.reset()
+
+        # Last crop and signal prediction, carried from one segment chunk to the next (and checkpointed)
+        carry = {}
+        transform = lambda frames: self._processed_frames(frames, carry)
+        event_log, aggregator = None, None
+        self.signal_model_frames = [0, 0]  # Frames the signal model ran on, frames seen
+        if self.cascade:
+            aggregator = SignalAggregator(fps, SIGNAL_CLASSES, SIGNAL_SMOOTHING, SIGNAL_VOTE_WINDOW, SIGNAL_EMA_ALPHA,
+                                          SIGNAL_SCORE_THRESHOLD, SIGNAL_MIN_FRAMES, SIGNAL_MAX_GAP)
+            resume_offset = checkpoint.get('event_log_offset') if resume_frame > start_frame else None
+            event_log = SignalEventLog(self._event_log_path(video_path, output_dir, start_frame, end_frame, fps),
+                                       fps, video=name, aggregator=aggregator, resume_offset=resume_offset)
+            transform = lambda frames: self._detect_signals(self._processed_frames(frames, carry), event_log, carry)
+        sink = segment_writer.write if self.write_video else _discard
+        if resume_frame > start_frame:
+            self._restore_state(checkpoint.load_state(), event_log, carry)
 
+        try:
+            frames = self.metrics.timed('decode', decoder.frames())
+            frames_per_segment = segment_writer.frames_per_segment
+            if checkpoint is not None and frames_per_segment > 0:
+                # One pipeline run per output segment, so each finished segment can be checkpointed
+                chunks = itertools.groupby(frames, key=lambda indexed_frame: indexed_frame[0] // frames_per_segment)
+            else:
+                chunks = [(None, frames)]
+            for segment_index, chunk in chunks:
+                if self.pipelined:
+                    # Decode, inference and encode overlap; frames keep their order end to end
+                    run_pipeline(chunk, transform, sink, queue_size=self.queue_size)
+                else:
+                    for indexed_frame in transform(chunk):
+                        sink(indexed_frame)
+                if checkpoint is not None and segment_index is not None:
+                    segment_writer.close()
+                    next_frame = (segment_index + 1) * frames_per_segment
+                    with self.metrics.time('checkpoint'):
+                        checkpoint.save(self._checkpoint_state(event_log, carry), next_frame=next_frame,
+                                        last_frame=next_frame - 1, segment_counter=segment_index + 1,
+                                        partial_output=None, event_log_offset=event_log.offset if event_log else None)
+            segment_writer.close()
+            if event_log is not None:
+                event_log.close()
+            if checkpoint is not None:
+                checkpoint.save(done=True, partial_output=None)
         finally:
-            # Cleanup resources
-            self._close_writer(video_writer)
-            cap.release()
-            # Use the original move function (or adapt slightly if needed)
-            self._move_processed_file(video_path, used_dir)
+            # Cleanup resources; the rest still runs if the encoder fails to finish
+            try:
+                segment_writer.close()
+            finally:
+                decoder.close()
+                if event_log is not None:
+                    event_log.close()
+                    model_frames, total_frames = self.signal_model_frames
+                    print(f"{os.path.basename(video_path)}: {len(event_log.events)} signal events -> {event_log.path} "
+                          f"(signal model ran on {model_frames}/{total_frames} frames)")
+                if self.motion_gate is not None:
+                    print(f"{os.path.basename(video_path)}: {self.motion_gate.report()}")
+
+    def process_stream(self, source, output_dir=LIVE_OUTPUT_DIR, name=None, fps=None, realtime=False, follow=False,
+                       on_event=None):
+        """
+        Live mode: processes a stream source (see LiveStream) as it arrives, dropping frames when
+        inference falls behind. Referee boxes and signal events are emitted as soon as they are
+        known to {name}_live.jsonl (and `on_event`), each with its end-to-end latency; finished
+        signal events also go to {name}_signals.jsonl like in cascade mode. The cropped video is
+        written when write_video is set (dropped frames are missing from it). Runs until the stream
+        ends or Ctrl+C, then returns the profile report with the drop counts.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        stream = LiveStream(source, LIVE_FRAME_SIZE, fps, realtime=realtime, follow=follow,
+                            max_queue=LIVE_MAX_QUEUE, max_latency=LIVE_MAX_LATENCY)
+        name = name or stream.name
+        fps = stream.fps
+        live_log = LiveEventLog(os.path.join(output_dir, f"{name}_live.jsonl"), on_event)
+        aggregator = SignalAggregator(fps, SIGNAL_CLASSES, SIGNAL_SMOOTHING, SIGNAL_VOTE_WINDOW, SIGNAL_EMA_ALPHA,
+                                      SIGNAL_SCORE_THRESHOLD, SIGNAL_MIN_FRAMES, SIGNAL_MAX_GAP)
+        event_log = SignalEventLog(os.path.join(output_dir, f"{name}_signals.jsonl"), fps, video=name,
+                                   aggregator=aggregator)
+        segment_writer = SegmentedVideoWriter(self, name + '.mp4', output_dir, fps) if self.write_video else None
+        self.metrics.reset()
+        self._reset_tracker()
+        self.signal_model_frames = [0, 0]
+        captured = {}  # frame_index -> time the frame was read, for frames between detection and emission
+        confirmed, events_seen = None, 0
+
+        print(f"[INFO] Live: reading {source} ({LIVE_FRAME_SIZE[0]}x{LIVE_FRAME_SIZE[1]} @ {fps:.2f} fps) -> {live_log.path}")
+        start = time.perf_counter()
+        try:
+            frames = self.metrics.timed('frame_wait', stream.frames())
+            for frame_index, crop in self._detect_signals(self._live_crops(frames, live_log, captured, fps), event_log):
+                if segment_writer is not None:
+                    segment_writer.write((frame_index, crop))
+                capture_time = captured.pop(frame_index)
+                if event_log.confirmed != confirmed:
+                    confirmed = event_log.confirmed
+                    if confirmed is not None:
+                        self.metrics.observe('latency_signal_start', live_log.emit(
+                            {'type': 'signal_start', 'signal': confirmed, 'frame': frame_index,
+                             'time': round(frame_index / fps, 3)}, capture_time))
+                for event in event_log.events[events_seen:]:
+                    self.metrics.observe('latency_signal_event', live_log.emit({'type': 'signal', **event}, capture_time))
+                events_seen = len(event_log.events)
+                self.metrics.observe('latency_frame', time.time() - capture_time)
+        except KeyboardInterrupt:
+            print("[INFO] Live: stopped")
+        finally:
+            stream.close()
+            event_log.close()  # Ends an open signal event
+            for event in event_log.events[events_seen:]:
+                live_log.emit({'type': 'signal', **event}, time.time())
+            live_log.close()
+            if segment_writer is not None:
+                segment_writer.close()
+        self.wall_seconds = time.perf_counter() - start
+
+        report = {**stream.stats(), **self.profile_report(), 'events': dict(live_log.counts)}
+        report['frames'] = report['stages'].get('inference', {}).get('items', 0)  # Frames the referee model ran on
+        report['fps'] = round(report['frames'] / self.wall_seconds, 2) if self.wall_seconds else None
+        if PROFILE_REPORT:
+            print(self.metrics.report(self.wall_seconds))
+        print(f"[INFO] Live: {report['frames_read']} frames read, {report['frames_dropped']} dropped, "
+              f"{report['frames']} processed ({report['fps']} fps), events: {report['events']}")
+        return report
+
+    def _live_crops(self, indexed_frames, live_log, captured, fps):
+        """
+        Live variant of _processed_frames for (frame_index, frame, capture_time) items: emits each
+        referee detection and yields (frame_index, crop) pairs, reusing the last crop when the
+        referee isn't found, with their capture times left in `captured`.
+        """
+        last_valid = None
+        for indexed_batch in self._batched(indexed_frames):
+            results_batch = self._track_frames([frame for _, frame, _ in indexed_batch])
+            for (frame_index, frame, capture_time), results in zip(indexed_batch, results_batch):
+                bbox = self._detection_bbox(frame, results)
+                cropped = self._crop_to_bbox(frame, bbox)
+                if cropped is not None:
+                    last_valid = cropped
+                    self.metrics.observe('latency_referee', live_log.emit(
+                        {'type': 'referee', 'frame': frame_index, 'time': round(frame_index / fps, 3),
+                         'bbox': [int(v) for v in bbox], 'confidence': round(float(results.boxes.conf[0]), 4)},
+                        capture_time))
+                if last_valid is None:
+                    continue  # Nothing to crop before the first detection
+                captured[frame_index] = capture_time
+                yield frame_index, last_valid
+
+    def _processed_frames(self, indexed_frames, carry=None):
+        """
+        Yields (frame_index, crop) pairs to write, in decode order (frames without any crop yet are
+        skipped). `carry` holds the last crop between calls for consecutive chunks of one video.
+        """
+        carry = {} if carry is None else carry
+        last_valid_frame = carry.get('last_valid_frame')
+        target_size = (MODEL_SIZE, MODEL_SIZE) # Define target size
+        # Frames are grouped into batches of batch_size (1 processes every frame immediately)
+        for indexed_batch in self._batched(indexed_frames):
+            frame_indices = [frame_index for frame_index, _ in indexed_batch]
+            frame_batch = [frame for _, frame in indexed_batch]
+            # Process frames through detection pipeline, in decode order
+            for frame_index, processed_frame in zip(frame_indices, self._process_frames(frame_batch, last_valid_frame)):
+                # --- Keep original behavior: if no detection, nothing is written unless last_valid used ---
+                if processed_frame is None:
+                    continue
+                # --- Ensure frame matches target size before writing ---
+                if processed_frame.shape[0] != target_size[1] or processed_frame.shape[1] != target_size[0]:
+                   processed_frame = cv2.resize(processed_frame, target_size)
+                last_valid_frame = carry['last_valid_frame'] = processed_frame
+                yield frame_index, processed_frame
+
+    def _detect_signals(self, indexed_crops, event_log, carry=None):
+        """
+        Cascade stage: runs the signal model on each referee crop in memory, logs the prediction and
+        passes the (frame_index, crop) pairs through unchanged. Frames that reuse the previous crop
+        (no new referee detection) reuse its prediction instead of running the model again, and while
+        a signal is confirmed the model only rechecks every SIGNAL_RECHECK_STRIDE frames for its end.
+        `carry` keeps that state between calls, like in _processed_frames.
+        """
+        carry = {} if carry is None else carry
+        last_crop, last_action, last_prediction, last_checked = carry.get('signals', (None, None, (None, 0.0), None))
+        for indexed_batch in self._batched(indexed_crops):
+            confirmed = event_log.confirmed is not None
+            actions, fresh_crops = [], []
+            for frame_index, crop in indexed_batch:
+                if crop is last_crop:
+                    action = 'skip' if last_action == 'skip' else 'reuse'
+                elif confirmed and last_checked is not None and frame_index - last_checked < SIGNAL_RECHECK_STRIDE:
+                    action = 'skip'
+                else:
+                    action = 'predict'
+                    fresh_crops.append(crop)
+                    last_checked = frame_index
+                actions.append(action)
+                last_crop, last_action = crop, action
+            predictions = []
+            if fresh_crops:
+                with self.metrics.time('signal_inference', len(fresh_crops)):
+                    predictions = self._predict_signals(fresh_crops)
+            predictions = iter(predictions)
+            self.signal_model_frames[0] += len(fresh_crops)
+            self.signal_model_frames[1] += len(indexed_batch)
+
+            for (frame_index, crop), action in zip(indexed_batch, actions):
+                if action == 'predict':
+                    last_prediction = next(predictions)
+                if action != 'skip':  # Skipped frames stay inside the confirmed event without adding evidence
+                    event_log.add(frame_index, *last_prediction)
+                yield frame_index, crop
+            carry['signals'] = (last_crop, last_action, last_prediction, last_checked)
+
+    def _predict_signals(self, crops):
+        """Returns one (signal class, confidence) pair per crop, (None, 0.0) when nothing is detected"""
+        predictions = []
+        for results in self.signal_model.predict(crops, conf=CONFIDENCE_THRESHOLD, verbose=False):
+            if results.boxes is not None and results.boxes.cls.shape[0] > 0:
+                # Highest-confidence detection, like detect_signal in the backend
+                idx = int(results.boxes.cls[0])
+                signal = SIGNAL_CLASSES[idx] if idx < len(SIGNAL_CLASSES) else str(idx)
+                predictions.append((signal, float(results.boxes.conf[0])))
+            else:
+                predictions.append((None, 0.0))
+        return predictions
+
+    @staticmethod
+    def _range_name(video_path, start_frame, end_frame, fps):
+        """{video}, or {video}_partNNN for one segment-sized range of a video"""
+        base_name = os.path.splitext(os.path.basename(video_path))[0]
+        if start_frame == 0 and end_frame is None:
+            return base_name
+        frames_per_segment = int(SEGMENT_DURATION * fps) if SEGMENT_DURATION > 0 else 0
+        part = start_frame // frames_per_segment + 1 if frames_per_segment > 0 else 1
+        return f"{base_name}_part{part:03d}"
+
+    def _event_log_path(self, video_path, output_dir, start_frame, end_frame, fps):
+        """{video}_signals.jsonl, or {video}_partNNN_signals.jsonl for one segment-sized range of a video"""
+        return os.path.join(output_dir, f"{self._range_name(video_path, start_frame, end_frame, fps)}_signals.jsonl")
+
+    def _checkpoint_path(self, video_path, output_dir, start_frame, end_frame, fps):
+        range_name = self._range_name(video_path, start_frame, end_frame, fps)
+        return os.path.join(output_dir, CHECKPOINT_DIR, f"{range_name}.checkpoint.json")
+
+    def _checkpoint_state(self, event_log, carry):
+        """Objects whose state carries over between segments (pickled with the checkpoint)"""
+        return {'trackers': list(getattr(self.model.predictor, 'trackers', None) or []),
+                'motion_gate': self.motion_gate,
+                'aggregator': event_log.aggregator if event_log else None,
+                'carry': dict(carry)}  # One pickle, so last crop and signals' last_crop stay the same object
+
+    def _restore_state(self, state, event_log, carry):
+        if state is None:
+            return
+        trackers = getattr(self.model.predictor, 'trackers', None)
+        if trackers is not None and state['trackers']:
+            trackers[:] = state['trackers']
+        if self.motion_gate is not None and state['motion_gate'] is not None:
+            self.motion_gate = state['motion_gate']
+        if event_log is not None and state['aggregator'] is not None:
+            event_log.aggregator = state['aggregator']
+        carry.update(state.get('carry') or {})
+
+    def _batched(self, frames):
+        """Groups an iterable into lists of at most batch_size items"""
+        iterator = iter(frames)
+        while True:
+            frame_batch = list(itertools.islice(iterator, self.batch_size))
+            if not frame_batch:
+                return
+            yield frame_batch
 
     def _process_frame(self, frame, last_valid):
         """Full frame processing pipeline"""
-        # Prepare tensor for model input (resizes frame)
-        frame_tensor = self._prepare_frame_tensor(frame)
-
-        # Run model inference
+        return next(self._process_frames([frame], last_valid))
+
+    def _process_frames(self, frames, last_valid):
+        """Batched processing pipeline, yields one processed frame per input frame in order"""
+        if self.motion_gate is not None:
+            yield from self._process_frames_gated(frames, last_valid)
+            return
+        for frame, results in zip(frames, self._track_frames(frames)):
+            # Each crop falls back to the previous one, so cropping stays sequential
+            last_valid = self._handle_frame_cropping(frame, results, last_valid)
+            yield last_valid
+
+    def _process_frames_gated(self, frames, last_valid):
+        """Adaptive variant of _process_frames: only frames picked by the motion gate run the model"""
+        detect_mask = [self.motion_gate.should_detect(frame) for frame in frames]
+        detected_frames = [frame for frame, detect in zip(frames, detect_mask) if detect]
+        results_iter = iter(self._track_frames(detected_frames) if detected_frames else [])
+
+        for frame, detect in zip(frames, detect_mask):
+            if detect:
+                self.motion_gate.update(self._detection_bbox(frame, next(results_iter)))
+            # Skipped frames reuse the last detected bbox on the new frame
+            cropped = self._crop_to_bbox(frame, self.motion_gate.last_bbox)
+            if cropped is not None:
+                last_valid = cropped
+            yield last_valid
+
+    def _track_frames(self, frames):
+        """Runs the tracker on a list of frames in a single forward pass"""
+        # Prepare tensors for model input (resizes frames) and stack them into one BCHW batch
+        with self.metrics.time('preprocess', len(frames)):
+            if self.fast_preprocess:
+                batch_tensor = self.preprocessor(frames)
+            else:
+                batch_tensor = torch.cat([self._prepare_frame_tensor(frame) for frame in frames])
+
+        # Run model inference. Non-stream sources share one tracker that is updated
+        # frame by frame in batch order, so track state matches the single-frame path.
+        start = time.perf_counter()
         results = self.model.track(
-            frame_tensor,
+            batch_tensor,
             conf=CONFIDENCE_THRESHOLD,
             classes=[self.class_id],
             verbose=False,
             persist=True # Keep persist=True for tracking
-        )[0]
-
-        # Handle detection and cropping
-        return self._handle_frame_cropping(frame, results, last_valid)
-
-    def _prepare_frame_tensor(self, frame):
+        )
+        # The forward pass as timed by ultralytics; the rest of the call (NMS, tracker update) counts as postprocess
+        total = time.perf_counter() - start
+        inference = min(total, (results[0].speed.get('inference') or 0) * len(frames) / 1000) if results else 0.0
+        self.metrics.observe('inference', inference, len(frames))
+        self.metrics.observe('postprocess', total - inference, len(frames))
+        return results
+
+    def _reset_tracker(self):
+        """Clears track history kept by model.track(persist=True)"""
+        for tracker in getattr(self.model.predictor, 'trackers', []):
+            tracker.reset()
+
+    @staticmethod
+    def _prepare_frame_tensor(frame):
         """Convert frame to optimized tensor format"""
         # Resize to model input size
         resized_frame = cv2.resize(frame, (MODEL_SIZE, MODEL_SIZE))
@@ -137,50 +686,67 @@ class RefereeProcessor:
 
     def _handle_frame_cropping(self, frame, results, last_valid):
         """Handle referee detection and image cropping"""
+        cropped = self._crop_to_bbox(frame, self._detection_bbox(frame, results))
+        if cropped is not None:
+            return cropped
+        return last_valid  # Return previous valid frame if no detection or invalid crop
+
+    def _detection_bbox(self, frame, results):
+        """Returns the first referee bbox in frame pixel coordinates, or None"""
         if results.boxes is not None and results.boxes.xyxy.shape[0] > 0:
             # Extract bounding box coordinates (relative to MODEL_SIZE)
-            x1_rel, y1_rel, x2_rel, y2_rel = results.boxes.xyxy[0].cpu().numpy()
+            xyxy_rel = results.boxes.xyxy[0].cpu().numpy()
 
-             # Scale coordinates back to original frame dimensions
+             # Scale coordinates back to original frame dimensions (undoing the letterbox padding if used)
             h, w = frame.shape[:2]
-            x1 = int(x1_rel * w / MODEL_SIZE)
-            y1 = int(y1_rel * h / MODEL_SIZE)
-            x2 = int(x2_rel * w / MODEL_SIZE)
-            y2 = int(y2_rel * h / MODEL_SIZE)
+            x1, y1, x2, y2 = (int(v) for v in self.preprocessor.to_frame_coords(xyxy_rel, frame.shape))
 
             # Clamp coordinates
             x1, y1 = max(0, x1), max(0, y1)
             x2, y2 = min(w, x2), min(h, y2)
-
-            # Crop and resize if dimensions are valid
-            if x1 < x2 and y1 < y2:
+            return x1, y1, x2, y2
+        return None
+
+    def _crop_to_bbox(self, frame, bbox):
+        """Crops bbox out of the frame and resizes it to MODEL_SIZE, or returns None for an invalid bbox"""
+        if bbox is None:
+            return None
+        x1, y1, x2, y2 = bbox
+        # Crop and resize if dimensions are valid
+        if x1 < x2 and y1 < y2:
+            with self.metrics.time('crop_resize'):
                 cropped = frame[y1:y2, x1:x2]
                 # Resize cropped image to the standard MODEL_SIZE
                 return cv2.resize(cropped, (MODEL_SIZE, MODEL_SIZE))
+        return None
 
-        return last_valid  # Return previous valid frame if no detection or invalid crop
-
-    # Added target_size parameter consistency
     def _create_new_writer(self, video_path, output_dir, segment_num, fps, target_size):
-        """Initialize new video writer for segment"""
+        """Initialize new encoder (video file or frames folder) for segment"""
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         base_name = os.path.splitext(os.path.basename(video_path))[0]
-        output_filename = f"{base_name}_{timestamp}_part{segment_num:03d}.mp4" # Use 3 digits for part number
+        # Use 3 digits for part number; the 'frames' encoder writes into a folder of that name
+        output_filename = f"{base_name}_{timestamp}_part{segment_num:03d}{ENCODERS[ENCODER].extension}"
         output_path = os.path.join(output_dir, output_filename)
 
-        # Define codec and create writer object
-        fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-        writer = cv2.VideoWriter(output_path, fourcc, fps, target_size) # Use target_size
-        if not writer.isOpened():
-             print(f"Error: Could not open video writer for {output_path}")
-             return None
-        return writer
+        options = {}
+        if ENCODER == 'ffmpeg':
+            options = {'codec': ENCODER_CODEC, 'preset': ENCODER_PRESET, 'crf': ENCODER_CRF}
+        elif ENCODER == 'frames':
+            # The crop is the referee bbox, so the stub box covers the whole image
+            label_line = f"{self.class_id} 0.500000 0.500000 1.000000 1.000000" if FRAMES_LABEL_STUBS else None
+            options = {'image_format': FRAMES_FORMAT, 'jpeg_quality': FRAMES_JPEG_QUALITY, 'label_line': label_line}
 
+        try:
+            return open_encoder(ENCODER, output_path, fps, target_size, **options)
+        except (OSError, RuntimeError) as e:
+            # Raised instead of skipping the segment, so the video isn't moved to used_dir
+            # and its checkpoint is kept for a retry
+            raise RuntimeError(f"Could not open video writer for {output_path}: {e}") from e
 
     def _close_writer(self, writer):
-        """Safely close video writer"""
+        """Safely close video writer (waits for threaded encoders to finish)"""
         if writer is not None:
-            writer.release()
+            writer.close()
 
     # Reverted to simpler os.rename, assuming no cross-filesystem moves needed
     def _move_processed_file(self, src_path, dest_dir):
@@ -192,11 +758,90 @@ class RefereeProcessor:
                   os.remove(dest_path) # Remove if exists
               os.rename(src_path, dest_path) # Use simple rename
               print(f"Moved {os.path.basename(src_path)} to {dest_dir}")
+              return True
          except OSError as e:
               print(f"Error moving file {src_path} to {dest_path}: {e}")
+              return False
               # Consider adding shutil.move as fallback or retry logic here if needed
 
+class SegmentedVideoWriter:
+    """Writes processed frames into output videos covering SEGMENT_DURATION of the source each"""
+
+    def __init__(self, processor, video_path, output_dir, fps, output_fps=None, checkpoint=None):
+        self.processor = processor
+        self.video_path = video_path
+        self.output_dir = output_dir
+        self.fps = fps
+        self.output_fps = output_fps or fps
+        self.target_size = (MODEL_SIZE, MODEL_SIZE)
+        self.frames_per_segment = int(SEGMENT_DURATION * fps) if SEGMENT_DURATION > 0 else 0
+        self.segment_counter = None
+        self.video_writer = None
+        self.checkpoint = checkpoint  # Records the output being written, so a resumed run can discard it
+
+    def write(self, indexed_frame):
+        """Writes one (frame_index, frame) pair, rolling over to a new segment when needed"""
+        frame_index, processed_frame = indexed_frame
+
+        # Manage video segmentation: the segment number follows the source frame index, so
+        # workers processing separate time ranges of one video produce the same part numbers
+        segment_num = frame_index // self.frames_per_segment + 1 if self.frames_per_segment > 0 else 1
+        if segment_num != self.segment_counter:
+            self.close()
+            # Pass target_size to writer creation
+            self.video_writer = self.processor._create_new_writer(
+                self.video_path, self.output_dir, segment_num, self.output_fps, self.target_size)
+            self.segment_counter = segment_num
+            if self.checkpoint is not None:
+                self.checkpoint.save(partial_output=self.video_writer.output_path)
+
+        # Threaded encoders only queue the frame here
+        with self.processor.metrics.time('encode'):
+            self.video_writer.write(processed_frame, frame_index)
+
+    def close(self):
+        writer, self.video_writer = self.video_writer, None  # Not closed twice if closing raises
+        if writer is not None:
+            # Waits for threaded encoders to drain their queue and finish the file
+            with self.processor.metrics.time('encode_flush'):
+                self.processor._close_writer(writer)
+
+
+def _discard(indexed_frame):
+    """Sink used when the cropped video isn't written"""
+
+
+# Worker-process state for process_videos(workers > 1): one processor (and fused model) per process
+_worker_processor = None
+
+
+def _init_worker(processor_kwargs, workers):
+    """Pool initializer: loads the model once per worker process"""
+    global _worker_processor, ONNX_THREADS
+    # Split the cores between workers instead of letting every process use all of them
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    torch.set_num_threads(threads)
+    if INFERENCE_BACKEND in ONNX_BACKENDS and not ONNX_THREADS:
+        ONNX_THREADS = threads
+    _worker_processor = RefereeProcessor(**processor_kwargs)
+
+
+def _run_work_item(work_item):
+    """
+    Processes one (video_path, output_dir, start_frame, end_frame) item, returning
+    (video_path, error, stage metrics of this item) so the parent can aggregate the profile
+    """
+    video_path, output_dir, start_frame, end_frame = work_item
+    _worker_processor.metrics.reset()
+    try:
+        _worker_processor._process_video_range(video_path, output_dir, start_frame, end_frame)
+    except Exception as e:
+        return video_path, str(e), _worker_processor.metrics.snapshot()
+    return video_path, None, _worker_processor.metrics.snapshot()
+
+
 if __name__ == "__main__":
-    processor = RefereeProcessor()
-    processor.process_videos()
+    # With worker processes the parent never runs the model, so it doesn't load it
+    processor = RefereeProcessor(preload_model=NUM_WORKERS == 1)
+    processor.process_videos(workers=NUM_WORKERS)
     print("Processing finished.") # Keep final print
\ No newline at end of file
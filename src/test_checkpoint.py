@@ -0,0 +1,53 @@
+import os
+import pickle
+
+from utils.checkpoint import VideoCheckpoint
+
+
+def _video(tmp_path, data=b'video'):
+    path = tmp_path / 'match.mp4'
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_save_and_resume(tmp_path):
+    video = _video(tmp_path)
+    path = str(tmp_path / 'checkpoints' / 'match.checkpoint.json')
+    checkpoint = VideoCheckpoint(path, video, 0, 300)
+    assert not checkpoint.resumable and checkpoint.load_state() is None
+    checkpoint.save({'aggregator': [1, 2]}, next_frame=100, segment_counter=1)
+    checkpoint.save(partial_output=str(tmp_path / 'part002.mp4'))  # Keeps the state saved with it
+
+    resumed = VideoCheckpoint(path, video, 0, 300)
+    assert resumed.resumable and not resumed.done
+    assert resumed.get('next_frame') == 100 and resumed.load_state() == {'aggregator': [1, 2]}
+    # Another range of the same video doesn't resume from it
+    assert not VideoCheckpoint(path, video, 300, 600).resumable
+
+    (tmp_path / 'part002.mp4').write_bytes(b'partial')
+    resumed.discard_partial_output()
+    assert not os.path.exists(tmp_path / 'part002.mp4')
+    resumed.remove()
+    assert not os.path.exists(path) and not os.path.exists(resumed.state_path)
+
+
+def test_stale_checkpoints_are_ignored(tmp_path):
+    video = _video(tmp_path)
+    path = str(tmp_path / 'match.checkpoint.json')
+    checkpoint = VideoCheckpoint(path, video)
+    checkpoint.save({'step': 1}, next_frame=10)
+
+    # A state written after its record (crash between the two writes) doesn't match the record
+    with open(checkpoint.state_path, 'wb') as f:
+        pickle.dump({'id': 2, 'state': {'step': 2}}, f)
+    assert VideoCheckpoint(path, video).load_state() is None
+    checkpoint.save({'step': 2})
+    assert VideoCheckpoint(path, video).load_state() == {'step': 2}
+
+    # A replaced source video (different size) starts over
+    _video(tmp_path, b'another video')
+    assert not VideoCheckpoint(path, video).resumable
+    # So does an unreadable record
+    with open(path, 'w') as f:
+        f.write('{not json')
+    assert not VideoCheckpoint(path, _video(tmp_path)).resumable
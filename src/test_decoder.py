@@ -0,0 +1,118 @@
+import shutil
+import subprocess
+import sys
+
+import cv2
+import numpy as np
+import pytest
+
+from utils.decoder import FFmpegDecoder, StderrTail, find_ffmpeg, open_decoder
+
+NUM_FRAMES = 40
+needs_ffmpeg = pytest.mark.skipif(shutil.which(find_ffmpeg()) is None, reason='ffmpeg not found (set FFMPEG_BINARY)')
+
+
+WIDTH, HEIGHT = 8 * NUM_FRAMES, 48
+
+
+def _frame(frame_index):
+    """Black frame with a white bar at a column range unique to the frame"""
+    frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+    frame[:, 8 * frame_index:8 * frame_index + 8] = 255
+    return frame
+
+
+def _source_index(frame):
+    """Which source frame a decoded frame is, from the position of its bar"""
+    return int(np.argmax(frame.mean(axis=(0, 2)).reshape(NUM_FRAMES, -1).mean(axis=1)))
+
+
+@pytest.fixture(scope='module')
+def video(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp('decoder') / 'match.mp4')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), 10, (WIDTH, HEIGHT))
+    for i in range(NUM_FRAMES):
+        writer.write(_frame(i))
+    writer.release()
+    return path
+
+
+def _decode(backend, video_path, **kwargs):
+    decoder = open_decoder(backend, video_path, **kwargs)
+    try:
+        return [(index, frame.copy()) for index, frame in decoder.frames()]
+    finally:
+        decoder.close()
+
+
+@needs_ffmpeg
+@pytest.mark.parametrize('start_frame, end_frame, stride', [(0, None, 1), (10, None, 1), (0, None, 3), (7, 30, 4),
+                                                            (12, 25, 2)])
+def test_backends_yield_the_same_frames(video, start_frame, end_frame, stride):
+    kwargs = {'start_frame': start_frame, 'end_frame': end_frame, 'stride': stride}
+    opencv, ffmpeg = _decode('opencv', video, **kwargs), _decode('ffmpeg', video, **kwargs)
+    expected = list(range(start_frame, end_frame or NUM_FRAMES, stride))
+    assert [i for i, _ in opencv] == [i for i, _ in ffmpeg] == expected
+    # The right source frames too (the ffmpeg seek lands on the exact frame, not the keyframe before it)
+    assert [_source_index(frame) for _, frame in opencv] == [_source_index(frame) for _, frame in ffmpeg] == expected
+    assert all(frame.shape == (HEIGHT, WIDTH, 3) for _, frame in opencv + ffmpeg)
+
+
+@needs_ffmpeg
+def test_ffmpeg_scales_while_decoding(video):
+    frames = _decode('ffmpeg', video, stride=10, size=(WIDTH // 2, HEIGHT // 2))
+    assert [i for i, _ in frames] == [0, 10, 20, 30]
+    assert all(frame.shape == (HEIGHT // 2, WIDTH // 2, 3) for _, frame in frames)
+    assert [_source_index(frame) for _, frame in frames] == [0, 10, 20, 30]
+
+
+@needs_ffmpeg
+def test_ffmpeg_error_is_reported(tmp_path):
+    path = tmp_path / 'broken.mp4'
+    path.write_bytes(b'not a video')
+    decoder = FFmpegDecoder(str(path), size=(WIDTH, HEIGHT))
+    with pytest.raises(RuntimeError, match='ffmpeg failed decoding .*broken.mp4'):
+        list(decoder.frames())
+    decoder.close()
+
+
+def test_unreadable_video_without_size(tmp_path):
+    path = tmp_path / 'broken.mp4'
+    path.write_bytes(b'not a video')
+    decoder = FFmpegDecoder(str(path))
+    with pytest.raises(RuntimeError, match='Could not read the frame size'):
+        list(decoder.frames())
+    decoder.close()
+
+
+def _script(tmp_path, code):
+    """Executable that runs `code`, standing in for the ffmpeg binary"""
+    path = tmp_path / 'fake_ffmpeg'
+    path.write_text(f"#!{sys.executable}\nimport sys\n{code}\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_error_reports_the_end_of_stderr(video, tmp_path):
+    # Far more than the pipe buffer: without draining, the process would block before exiting
+    ffmpeg = _script(tmp_path, "sys.stderr.write('warning\\n' * 50000 + 'decoder exploded')\nsys.exit(3)")
+    decoder = FFmpegDecoder(video, ffmpeg=ffmpeg)
+    with pytest.raises(RuntimeError, match=r'(?s)\(3\): .*decoder exploded$') as error:
+        list(decoder.frames())
+    decoder.close()
+    assert len(str(error.value)) < 20 * 1024  # Only the tail is kept
+
+
+def test_stderr_tail_keeps_the_last_bytes():
+    process = subprocess.Popen([sys.executable, '-c', "import sys; sys.stderr.write('x' * 200000 + 'END')"],
+                               stderr=subprocess.PIPE)
+    tail = StderrTail(process.stderr, max_bytes=1024)
+    assert process.wait(timeout=10) == 0
+    text = tail.text()
+    tail.close()
+    assert text.endswith('END') and len(text) == 1024
+
+
+def test_unknown_backend(video):
+    with pytest.raises(ValueError, match='Unknown decoder backend'):
+        open_decoder('gstreamer', video)
@@ -0,0 +1,132 @@
+import os
+import shutil
+import sys
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+from utils.decoder import find_ffmpeg, probe_video
+from utils.encoder import FFmpegEncoder, FrameDumpEncoder, ThreadedEncoder, open_encoder
+
+SIZE = (64, 48)
+needs_ffmpeg = pytest.mark.skipif(shutil.which(find_ffmpeg()) is None, reason='ffmpeg not found (set FFMPEG_BINARY)')
+
+
+def _frames(count, size=SIZE):
+    return [np.full((size[1], size[0], 3), 10 * i, dtype=np.uint8) for i in range(count)]
+
+
+class FailingEncoder(ThreadedEncoder):
+    """Encodes into a list, failing on frame `fail_at`"""
+
+    def __init__(self, fail_at, queue_size=2):
+        self.fail_at = fail_at
+        self.encoded = []
+        self.finished = False
+        super().__init__(queue_size, name='failing-encoder')
+
+    def _encode(self, frame_index, frame):
+        if frame_index == self.fail_at:
+            raise IOError(f"disk full at frame {frame_index}")
+        self.encoded.append(frame_index)
+
+    def _finish(self):
+        self.finished = True
+
+
+def test_frame_dump_writes_every_frame(tmp_path):
+    output_path = str(tmp_path / 'match_part001')
+    encoder = open_encoder('frames', output_path, 10, SIZE, image_format='png', label_line='0 0.5 0.5 1.0 1.0')
+    for i, frame in enumerate(_frames(5)):
+        encoder.write(frame, 100 + i)  # Named after the source frame index
+    encoder.close()
+    assert sorted(os.listdir(output_path)) == [f"{100 + i:07d}.{ext}" for i in range(5) for ext in ('png', 'txt')]
+    assert encoder.frames_written == 5
+    assert np.array_equal(cv2.imread(os.path.join(output_path, '0000103.png')), _frames(5)[3])
+    with open(os.path.join(output_path, '0000103.txt')) as f:
+        assert f.read() == '0 0.5 0.5 1.0 1.0\n'
+
+
+def test_frame_dump_numbers_frames_without_index(tmp_path):
+    encoder = FrameDumpEncoder(str(tmp_path / 'frames'))
+    for frame in _frames(3):
+        encoder.write(frame)
+    encoder.close()
+    assert sorted(os.listdir(tmp_path / 'frames')) == ['0000000.jpg', '0000000.txt', '0000001.jpg', '0000001.txt',
+                                                       '0000002.jpg', '0000002.txt']
+    assert (tmp_path / 'frames' / '0000001.txt').read_text() == ''  # Empty label stub
+
+
+def test_thread_error_is_raised_by_write_and_close():
+    encoder = FailingEncoder(fail_at=3)
+    with pytest.raises(IOError, match='disk full at frame 3'):
+        # The queue holds 2 frames, so writes keep going (never blocking on the dead thread) until one sees the error
+        for i in range(100):
+            encoder.write(_frames(1)[0], i)
+    assert encoder.encoded == [0, 1, 2]
+    # close() still stops the thread and finishes the output, then raises the same error
+    with pytest.raises(IOError, match='disk full at frame 3'):
+        encoder.close()
+    assert encoder.finished and not encoder._thread.is_alive()
+
+
+def test_close_flushes_queued_frames():
+    encoder = FailingEncoder(fail_at=None, queue_size=50)
+    release = threading.Event()
+    encode = encoder._encode
+    encoder._encode = lambda *item: (release.wait(5), encode(*item))
+    for i in range(20):
+        encoder.write(None, i)
+    release.set()
+    encoder.close()  # Waits for every queued frame
+    assert encoder.encoded == list(range(20)) and encoder.finished
+
+
+def test_frame_dump_write_error(tmp_path):
+    output_path = tmp_path / 'frames'
+    encoder = FrameDumpEncoder(str(output_path))
+    shutil.rmtree(output_path)  # The folder disappears mid-segment
+    encoder.write(_frames(1)[0], 0)
+    with pytest.raises(RuntimeError, match='Could not write'):
+        encoder.close()
+
+
+@needs_ffmpeg
+def test_ffmpeg_encodes_every_frame(tmp_path):
+    output_path = str(tmp_path / 'match_part001.mp4')
+    encoder = open_encoder('ffmpeg', output_path, 10, SIZE, preset='ultrafast')
+    frames = _frames(24)
+    frames[5] = cv2.resize(frames[5], (128, 96))  # Other sizes are scaled to the output size
+    for i, frame in enumerate(frames):
+        encoder.write(frame, i)
+    encoder.close()
+    fps, total_frames, width, height = probe_video(output_path)
+    assert (round(fps), total_frames, width, height) == (10, 24, *SIZE)
+
+
+def _script(tmp_path, code):
+    """Executable that runs `code`, standing in for the ffmpeg binary"""
+    path = tmp_path / 'fake_ffmpeg'
+    path.write_text(f"#!{sys.executable}\nimport sys\n{code}\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def test_ffmpeg_failure_is_reported(tmp_path):
+    # ffmpeg exits at once: frames hit a broken pipe, and close() reports ffmpeg's own error
+    ffmpeg = _script(tmp_path, "sys.stderr.write('Unknown encoder no_such_codec')\nsys.exit(8)")
+    encoder = FFmpegEncoder(str(tmp_path / 'out.mp4'), 10, SIZE, codec='no_such_codec', ffmpeg=ffmpeg, queue_size=2)
+    with pytest.raises(RuntimeError, match=r'ffmpeg failed encoding .*out.mp4 \(8\): Unknown encoder no_such_codec'):
+        try:
+            for i, frame in enumerate(_frames(50)):
+                encoder.write(frame, i)
+        finally:
+            encoder.close()
+    assert encoder._process.returncode == 8 and not encoder._thread.is_alive()
+
+
+def test_unknown_backend(tmp_path):
+    with pytest.raises(ValueError, match='Unknown encoder backend'):
+        open_encoder('gif', str(tmp_path / 'out.gif'), 10, SIZE)
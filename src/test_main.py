@@ -0,0 +1,228 @@
+import glob
+import os
+import re
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+import torch
+
+import main
+from utils.encoder import FrameDumpEncoder
+
+FPS = 10
+NUM_FRAMES = 30
+MISSES = {10, 11, 20}  # Frames without a referee; 10 and 11 start the second segment
+
+
+class StubResults:
+    def __init__(self, detected):
+        box = [[160.0, 160.0, 480.0, 480.0]] if detected else []
+        self.boxes = SimpleNamespace(xyxy=torch.tensor(box).reshape(-1, 4), conf=torch.tensor([0.9] * len(box)),
+                                     cls=torch.tensor([0.0] * len(box)))
+        self.speed = {'inference': 0.0}
+
+
+class StubReferee:
+    """Finds the referee in bright frames only; raises once `fail_after` frames were processed"""
+
+    names = {0: 'referee'}
+
+    def __init__(self, fail_after=None):
+        self.predictor = SimpleNamespace(trackers=[])
+        self.fail_after = fail_after
+        self.frames = 0
+        self.batch_sizes = []
+        self.order = []  # Brightness of every frame in the order the tracker saw it
+
+    def track(self, batch, **kwargs):
+        self.frames += batch.shape[0]
+        self.batch_sizes.append(batch.shape[0])
+        self.order.extend(round(float(image.mean()), 3) for image in batch)
+        if self.fail_after is not None and self.frames > self.fail_after:
+            raise RuntimeError('interrupted')
+        return [StubResults(float(image.mean()) > 0.2) for image in batch]
+
+
+class StubSignal:
+    def predict(self, crops, **kwargs):
+        return [StubResults(True) for _ in crops]
+
+
+@pytest.fixture
+def video(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'SEGMENT_DURATION', 1)  # 10 frames per segment
+    monkeypatch.setattr(main, 'ENCODER', 'frames')
+    monkeypatch.setattr(main, 'DECODER', 'opencv')
+    path = str(tmp_path / 'match.mp4')
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), FPS, (64, 48))
+    for i in range(NUM_FRAMES):
+        # Every detected frame has its own brightness, so each crop shows which frame it came from
+        writer.write(np.full((48, 64, 3), 10 if i in MISSES else 60 + 6 * i, dtype=np.uint8))
+    writer.release()
+    return path
+
+
+def _process(video_path, output_dir, checkpoints, monkeypatch, referee=None, **kwargs):
+    monkeypatch.setattr(main, 'CHECKPOINTS', checkpoints)
+    os.makedirs(output_dir, exist_ok=True)  # Created by process_videos
+    processor = main.RefereeProcessor(cascade=True, write_video=True, preload_model=False, **kwargs)
+    processor._model = referee or StubReferee()
+    processor._signal_model = StubSignal()
+    processor._process_video_range(video_path, output_dir)
+    return processor
+
+
+def _written(output_dir):
+    """{frame_index: mean brightness of its crop} over every segment folder"""
+    written = {}
+    for path in glob.glob(os.path.join(output_dir, '*_part*', '*.jpg')):
+        written[int(os.path.splitext(os.path.basename(path))[0])] = round(float(cv2.imread(path).mean()))
+    return written
+
+
+def _assert_same(written, expected):
+    assert sorted(written) == sorted(expected)
+    assert all(abs(written[i] - expected[i]) <= 3 for i in expected), (written, expected)
+
+
+def test_checkpoints_dont_change_output(video, tmp_path, monkeypatch):
+    plain = str(tmp_path / 'plain')
+    checkpointed = str(tmp_path / 'checkpointed')
+    plain_processor = _process(video, plain, False, monkeypatch)
+    checkpointed_processor = _process(video, checkpointed, True, monkeypatch)
+
+    expected = _written(plain)
+    assert sorted(expected) == list(range(NUM_FRAMES))
+    assert abs(expected[10] - expected[9]) <= 3  # The segment starts with a miss: frame 9's crop is reused
+    _assert_same(_written(checkpointed), expected)
+    # The signal model reuses the last prediction across the segment boundary too
+    assert checkpointed_processor.signal_model_frames == plain_processor.signal_model_frames
+    with open(os.path.join(plain, 'match_signals.jsonl')) as a, open(os.path.join(checkpointed, 'match_signals.jsonl')) as b:
+        assert a.read() == b.read()
+
+
+def _signals(output_dir):
+    with open(os.path.join(output_dir, 'match_signals.jsonl')) as f:
+        return f.read()
+
+
+@pytest.mark.parametrize('checkpoints', [False, True])
+def test_pipelined_matches_sequential(video, tmp_path, monkeypatch, checkpoints):
+    sequential, pipelined = str(tmp_path / 'sequential'), str(tmp_path / 'pipelined')
+    sequential_referee, pipelined_referee = StubReferee(), StubReferee()
+    sequential_processor = _process(video, sequential, checkpoints, monkeypatch, referee=sequential_referee,
+                                    pipelined=False)
+    pipelined_processor = _process(video, pipelined, checkpoints, monkeypatch, referee=pipelined_referee,
+                                   pipelined=True)
+
+    # Same frames, in the same order, through the tracker, and the same crops and signal events out
+    assert pipelined_referee.order == sequential_referee.order and len(sequential_referee.order) == NUM_FRAMES
+    expected = _written(sequential)
+    assert sorted(expected) == list(range(NUM_FRAMES))
+    _assert_same(_written(pipelined), expected)
+    assert pipelined_processor.signal_model_frames == sequential_processor.signal_model_frames
+    assert _signals(sequential) and _signals(pipelined) == _signals(sequential)
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+@pytest.mark.parametrize('checkpoints', [False, True])
+def test_batches_match_single_frames(video, tmp_path, monkeypatch, pipelined, checkpoints):
+    single, batched = str(tmp_path / 'single'), str(tmp_path / 'batched')
+    single_referee, batched_referee = StubReferee(), StubReferee()
+    single_processor = _process(video, single, checkpoints, monkeypatch, referee=single_referee, batch_size=1,
+                                pipelined=pipelined)
+    batched_processor = _process(video, batched, checkpoints, monkeypatch, referee=batched_referee, batch_size=4,
+                                 pipelined=pipelined)
+
+    assert single_referee.batch_sizes == [1] * NUM_FRAMES
+    # 30 frames make a partial last batch; with checkpoints every 10-frame segment is batched on its own
+    assert batched_referee.batch_sizes == ([4, 4, 2] * 3 if checkpoints else [4] * 7 + [2])
+    # The tracker sees the frames in the same order, so its state matches the single-frame path
+    assert batched_referee.order == single_referee.order
+    expected = _written(single)
+    assert sorted(expected) == list(range(NUM_FRAMES))
+    _assert_same(_written(batched), expected)
+    assert batched_processor.signal_model_frames == single_processor.signal_model_frames
+    assert _signals(batched) == _signals(single)
+
+
+def test_resume_from_checkpoint(video, tmp_path, monkeypatch):
+    plain = str(tmp_path / 'plain')
+    _process(video, plain, False, monkeypatch)
+    expected = _written(plain)
+
+    output_dir = str(tmp_path / 'resumed')
+    with pytest.raises(RuntimeError, match='interrupted'):
+        _process(video, output_dir, True, monkeypatch, referee=StubReferee(fail_after=15))
+    checkpoint = main.VideoCheckpoint(os.path.join(output_dir, main.CHECKPOINT_DIR, 'match.checkpoint.json'), video)
+    assert checkpoint.get('next_frame') == 10 and not checkpoint.done
+
+    referee = StubReferee()
+    _process(video, output_dir, True, monkeypatch, referee=referee)
+    assert referee.frames == NUM_FRAMES - 10  # Only the unfinished segments were processed again
+    # The partial second segment was replaced, and its first frames reuse the checkpointed crop of frame 9
+    parts = [re.search(r'_part(\d+)$', path).group(1) for path in glob.glob(os.path.join(output_dir, '*_part*'))]
+    assert sorted(parts) == ['001', '002', '003']
+    _assert_same(_written(output_dir), expected)
+    assert main.VideoCheckpoint(checkpoint.path, video).done
+
+
+def test_writer_failure_keeps_video_for_retry(video, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, 'CHECKPOINTS', True)
+    output_dir, used_dir = str(tmp_path / 'out'), str(tmp_path / 'used')
+    os.makedirs(output_dir)
+    open_encoder = main.open_encoder
+
+    def failing_open_encoder(backend, output_path, *args, **kwargs):
+        if '_part002' in output_path:
+            raise OSError('encoder not available')
+        return open_encoder(backend, output_path, *args, **kwargs)
+
+    monkeypatch.setattr(main, 'open_encoder', failing_open_encoder)
+    processor = main.RefereeProcessor(cascade=True, write_video=True, preload_model=False)
+    processor._model, processor._signal_model = StubReferee(), StubSignal()
+    processor._process_single_video(video, output_dir, used_dir)
+
+    # Not skipped: the source stays in place and the checkpoint is kept at the failed segment
+    assert os.path.exists(video) and not os.path.exists(os.path.join(used_dir, 'match.mp4'))
+    checkpoint = main.VideoCheckpoint(os.path.join(output_dir, main.CHECKPOINT_DIR, 'match.checkpoint.json'), video)
+    assert checkpoint.get('next_frame') == 10 and not checkpoint.done
+
+    monkeypatch.setattr(main, 'open_encoder', open_encoder)
+    processor._process_single_video(video, output_dir, used_dir)
+    assert os.path.exists(os.path.join(used_dir, 'match.mp4'))
+    assert sorted(_written(output_dir)) == list(range(NUM_FRAMES))
+
+
+@pytest.mark.parametrize('pipelined', [False, True])
+def test_encoder_error_closes_encoder_and_decoder(video, tmp_path, monkeypatch, pipelined):
+    closed = []
+
+    class FailingFrameDump(FrameDumpEncoder):
+        def _encode(self, frame_index, frame):
+            if frame_index == 15:
+                raise IOError('disk full')
+            super()._encode(frame_index, frame)
+
+        def close(self):
+            closed.append(os.path.basename(self.output_path))
+            super().close()
+
+    open_decoder = main.open_decoder
+
+    def tracked_open_decoder(*args, **kwargs):
+        decoder = open_decoder(*args, **kwargs)
+        close = decoder.close
+        decoder.close = lambda: (closed.append('decoder'), close())
+        return decoder
+
+    monkeypatch.setattr(main, 'open_encoder', lambda backend, output_path, *args, **kwargs:
+                        FailingFrameDump(output_path, *args, **kwargs))
+    monkeypatch.setattr(main, 'open_decoder', tracked_open_decoder)
+    with pytest.raises(IOError, match='disk full'):
+        _process(video, str(tmp_path / 'out'), False, monkeypatch, pipelined=pipelined)
+    # Every segment writer was closed exactly once, the failing one too, and so was the decoder
+    assert [name.rsplit('_', 1)[1] for name in closed if name != 'decoder'] == ['part001', 'part002']
+    assert closed[-1] == 'decoder'
@@ -0,0 +1,93 @@
+import numpy as np
+import pytest
+
+from utils.motion import MotionGate
+
+BBOX = (10, 10, 50, 90)
+
+
+def _gray(value, shape=(360, 640)):
+    return np.full((*shape, 3), value, dtype=np.uint8)
+
+
+def _halves(dark_left=True):
+    """Half black, half white: flipping it changes every pixel but not the histogram"""
+    frame = _gray(0)
+    frame[:, 320:] = 255
+    return frame if dark_left else frame[:, ::-1].copy()
+
+
+def _run(gate, frames, bbox=BBOX):
+    """Feeds the frames through the gate like RefereeProcessor does; returns the indices that were detected"""
+    detected = []
+    for i, frame in enumerate(frames):
+        if gate.should_detect(frame):
+            gate.update(bbox)
+            detected.append(i)
+    return detected
+
+
+def test_stride_mode():
+    gate = MotionGate('stride', stride=3)
+    # Changing frames don't matter, only the frame count
+    assert _run(gate, [_gray(i * 40) for i in range(7)]) == [0, 3, 6]
+    assert gate.skip_ratio == pytest.approx(4 / 7)
+    assert gate.last_bbox == BBOX
+
+
+def test_detects_every_frame_until_a_bbox_is_found():
+    gate = MotionGate('diff', stride=10)
+    assert _run(gate, [_gray(100)] * 4, bbox=None) == [0, 1, 2, 3]
+    assert gate.skip_ratio == 0.0
+    # The first detection with a referee starts skipping
+    assert _run(gate, [_gray(100)] * 4) == [0]
+
+
+@pytest.mark.parametrize('mode', ['diff', 'histogram'])
+def test_static_frames_are_skipped(mode):
+    gate = MotionGate(mode, stride=100, threshold=0.02)
+    assert _run(gate, [_gray(100)] * 10) == [0]
+    assert gate.frames_seen == 10 and gate.frames_detected == 1
+    assert gate.skip_ratio == pytest.approx(0.9)
+
+
+@pytest.mark.parametrize('mode', ['diff', 'histogram'])
+def test_changing_frames_are_detected(mode):
+    gate = MotionGate(mode, stride=100, threshold=0.02)
+    assert _run(gate, [_gray(40 if i % 2 else 200) for i in range(6)]) == list(range(6))
+    assert gate.skip_ratio == 0.0
+
+
+def test_diff_compares_against_the_last_detected_frame():
+    # +2 per frame is below the threshold from one frame to the next, but drift adds up
+    gate = MotionGate('diff', stride=100, threshold=0.02)
+    assert _run(gate, [_gray(100 + 2 * i) for i in range(10)]) == [0, 3, 6, 9]
+
+
+def test_histogram_ignores_rearranged_pixels():
+    frames = [_halves(i % 2 == 0) for i in range(4)]
+    assert _run(MotionGate('diff', stride=100, threshold=0.02), frames) == [0, 1, 2, 3]
+    assert _run(MotionGate('histogram', stride=100, threshold=0.02), frames) == [0]
+
+
+@pytest.mark.parametrize('mode', ['diff', 'histogram'])
+def test_forced_recheck_stride(mode):
+    # A perfectly static camera still refreshes the bbox every `stride` frames
+    gate = MotionGate(mode, stride=4, threshold=0.02)
+    assert _run(gate, [_gray(100)] * 10) == [0, 4, 8]
+    assert gate.skip_ratio == pytest.approx(0.7)
+
+
+def test_reset_and_report():
+    gate = MotionGate('diff', stride=100)
+    _run(gate, [_gray(100)] * 4)
+    assert gate.report() == "Adaptive inference (diff): detected 1/4 frames, skip ratio 75.0%"
+    gate.reset()
+    assert (gate.frames_seen, gate.frames_detected, gate.last_bbox, gate.skip_ratio) == (0, 0, None, 0.0)
+    # The next video starts with a detection again
+    assert _run(gate, [_gray(100)] * 2) == [0]
+
+
+def test_unknown_mode():
+    with pytest.raises(ValueError, match='Unknown adaptive mode'):
+        MotionGate('optical_flow')
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import torch
+
+import main
+from utils.preprocess import LETTERBOX_COLOR, FramePreprocessor
+
+SIZE = main.MODEL_SIZE
+# Wide frames are padded above and below, tall ones left and right; odd sizes leave uneven padding
+SHAPES = [(360, 640), (480, 270), (301, 517)]
+
+
+def _frame(shape, seed=0):
+    return np.random.default_rng(seed).integers(0, 256, (*shape, 3), dtype=np.uint8)
+
+
+def _frame_with_box(shape, box):
+    """Black frame with a white (x1, y1, x2, y2) rectangle"""
+    frame = np.zeros((*shape, 3), dtype=np.uint8)
+    x1, y1, x2, y2 = box
+    frame[y1:y2, x1:x2] = 255
+    return frame
+
+
+def _white_box(image):
+    """(x1, y1, x2, y2) of the white pixels in a CHW model image"""
+    ys, xs = np.nonzero(image[0].numpy() > 0.5)
+    return xs.min(), ys.min(), xs.max() + 1, ys.max() + 1
+
+
+def test_matches_prepare_frame_tensor():
+    frames = [_frame(shape, seed) for seed, shape in enumerate(SHAPES)]
+    # max_batch=1 also covers growing the buffer for a bigger batch
+    batch = FramePreprocessor(SIZE, 'cpu', max_batch=1)(frames)
+    expected = torch.cat([main.RefereeProcessor._prepare_frame_tensor(frame) for frame in frames])
+    assert batch.shape == expected.shape == (len(frames), 3, SIZE, SIZE)
+    assert batch.dtype == expected.dtype
+    assert torch.allclose(batch, expected, atol=1e-6)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_stretch_coords_map_back_to_frame(shape):
+    box = (shape[1] // 5, shape[0] // 4, shape[1] // 2, shape[0] * 3 // 4)
+    preprocessor = FramePreprocessor(SIZE, 'cpu')
+    image = preprocessor([_frame_with_box(shape, box)])[0]
+    mapped = preprocessor.to_frame_coords(_white_box(image), shape)
+    assert np.allclose(mapped, box, atol=2)
+
+
+@pytest.mark.parametrize('shape', SHAPES)
+def test_letterbox_coords_map_back_to_frame(shape):
+    h, w = shape
+    box = (w // 5, h // 4, w // 2, h * 3 // 4)
+    preprocessor = FramePreprocessor(SIZE, 'cpu', letterbox=True)
+    image = preprocessor([_frame_with_box(shape, box)])[0]
+
+    # The aspect ratio is kept: the resized frame fills one axis and is centred on the other
+    scale, pad_x, pad_y = preprocessor._letterbox_params(h, w)
+    assert pad_x == 0 or pad_y == 0
+    assert (pad_x > 0) == (w < h) and (pad_y > 0) == (w > h)
+    padding = torch.tensor(LETTERBOX_COLOR[::-1], dtype=torch.float32).view(3, 1) / 255
+    if pad_y:
+        assert torch.allclose(image[:, :pad_y].reshape(3, -1), padding)
+        assert torch.allclose(image[:, pad_y + round(h * scale):].reshape(3, -1), padding)
+    if pad_x:
+        assert torch.allclose(image[:, :, :pad_x].reshape(3, -1), padding)
+        assert torch.allclose(image[:, :, pad_x + round(w * scale):].reshape(3, -1), padding)
+
+    mapped = preprocessor.to_frame_coords(_white_box(image), shape)
+    assert np.allclose(mapped, box, atol=2)
+    # The corners of the model input land outside the frame by the padding
+    x1, y1, x2, y2 = preprocessor.to_frame_coords((0, 0, SIZE, SIZE), shape)
+    assert np.allclose((x1, y1), (-pad_x / scale, -pad_y / scale))
+    assert np.allclose((x2 - x1, y2 - y1), (SIZE / scale, SIZE / scale))
+
+
+def test_letterbox_padding_follows_frame_shape():
+    # Wide then tall frame in one batch: the reused buffer must be repainted for the new padding
+    wide, tall = _frame(SHAPES[0], 1), _frame(SHAPES[1], 2)
+    preprocessor = FramePreprocessor(SIZE, 'cpu', letterbox=True)
+    batch = preprocessor([wide, tall])
+    assert torch.equal(batch[0], FramePreprocessor(SIZE, 'cpu', letterbox=True)([wide])[0])
+    assert torch.equal(batch[1], FramePreprocessor(SIZE, 'cpu', letterbox=True)([tall])[0])
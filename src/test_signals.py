@@ -0,0 +1,105 @@
+import json
+import pickle
+
+from utils.signals import SignalAggregator, SignalEventLog
+
+CLASSES = ['armLeft', 'armRight', 'net']
+
+
+def _run(aggregator, predictions):
+    """Feeds (signal, confidence) per frame; returns every event, including the one flushed at the end"""
+    events = []
+    for i, (signal, confidence) in enumerate(predictions):
+        events.extend(aggregator.update(i, signal, confidence))
+    return events + aggregator.flush()
+
+
+def test_event_opens_and_closes_after_min_frames():
+    aggregator = SignalAggregator(10, CLASSES, min_frames=3, max_gap=5)
+    predictions = [('net', 0.9)] * 2 + [(None, 0.0)] * 3 + [('net', 0.8)] * 4 + [(None, 0.0)] * 2 + [('net', 0.6)] \
+        + [(None, 0.0)] * 3
+    events = []
+    for i, (signal, confidence) in enumerate(predictions):
+        events.extend(aggregator.update(i, signal, confidence))
+        if i == 6:
+            assert aggregator.confirmed is None  # 2 frames of 'net' don't make an event
+        if i == 7:
+            assert aggregator.confirmed == 'net'
+    events += aggregator.flush()
+
+    # The 2-frame blip before and the 2-frame dropout inside don't count; the event ends at the last 'net'
+    assert len(events) == 1
+    event = events[0]
+    assert (event['signal'], event['start_frame'], event['end_frame'], event['frames']) == ('net', 5, 11, 5)
+    assert (event['start_time'], event['end_time']) == (0.5, 1.2)
+    assert event['confidence'] == 0.8 and event['mean_confidence'] == round((0.8 * 4 + 0.6) / 5, 4)
+
+
+def test_ema_smoothing_bridges_flicker():
+    predictions = [('armLeft', 0.9), ('armLeft', 0.9), ('armRight', 0.9), ('armLeft', 0.9), ('armLeft', 0.9),
+                   (None, 0.0), ('armLeft', 0.9), ('armLeft', 0.9)]
+    # Without debouncing, every flicker splits the event
+    raw = _run(SignalAggregator(10, CLASSES, min_frames=1, max_gap=5), predictions)
+    assert [e['signal'] for e in raw] == ['armLeft', 'armRight', 'armLeft', 'armLeft']
+
+    events = _run(SignalAggregator(10, CLASSES, mode='ema', alpha=0.3, threshold=0.3, min_frames=1, max_gap=5),
+                  predictions)
+    assert len(events) == 1
+    assert (events[0]['signal'], events[0]['start_frame'], events[0]['end_frame']) == ('armLeft', 0, 7)
+    assert events[0]['frames'] == 6  # Only frames that predicted armLeft
+
+
+def test_vote_smoothing_needs_a_majority():
+    aggregator = SignalAggregator(10, CLASSES, mode='vote', window=5, threshold=0.6, min_frames=1, max_gap=5)
+    # armRight never holds 3 of the last 5 votes, net does from its third frame on
+    predictions = [('armRight', 0.9), (None, 0.0), ('armRight', 0.9), (None, 0.0), ('net', 0.7), ('net', 0.7),
+                   ('net', 0.7), ('net', 0.7)]
+    events = _run(aggregator, predictions)
+    assert [(e['signal'], e['start_frame'], e['end_frame']) for e in events] == [('net', 4, 7)]
+
+
+def test_gap_longer_than_max_gap_ends_the_event():
+    def events_with_gap(gap):
+        aggregator = SignalAggregator(10, CLASSES, min_frames=2, max_gap=5)
+        events = []
+        for frame_index in [0, 1, 2, 2 + gap, 3 + gap, 4 + gap]:
+            events.extend(aggregator.update(frame_index, 'net', 0.9))
+        return events + aggregator.flush()
+
+    bridged = events_with_gap(5)  # Frames 3-6 without a crop: still the same event
+    assert [(e['start_frame'], e['end_frame'], e['frames']) for e in bridged] == [(0, 9, 6)]
+    split = events_with_gap(6)
+    assert [(e['start_frame'], e['end_frame']) for e in split] == [(0, 2), (8, 10)]
+
+
+def test_resume_continues_the_log(tmp_path):
+    predictions = ([('net', 0.9)] * 4 + [(None, 0.0)] * 3 + [('armLeft', 0.8)] * 4 + [(None, 0.0)] * 3) * 2
+
+    def aggregator():
+        return SignalAggregator(10, CLASSES, mode='ema', alpha=0.5, threshold=0.5, min_frames=2, max_gap=5)
+
+    expected_path = str(tmp_path / 'expected.jsonl')
+    log = SignalEventLog(expected_path, 10, video='match', aggregator=aggregator())
+    for i, prediction in enumerate(predictions):
+        log.add(i, *prediction)
+    log.close()
+
+    # Checkpoint after frame 13, keep going to frame 20, then "crash" and resume from the checkpoint
+    path = str(tmp_path / 'signals.jsonl')
+    log = SignalEventLog(path, 10, video='match', aggregator=aggregator())
+    for i, prediction in enumerate(predictions[:14]):
+        log.add(i, *prediction)
+    offset, state = log.offset, pickle.dumps(log.aggregator)
+    for i, prediction in enumerate(predictions[14:21], 14):
+        log.add(i, *prediction)
+    log._file.close()  # Killed: the event written after the checkpoint must not stay in the log
+
+    resumed = SignalEventLog(path, 10, video='match', aggregator=pickle.loads(state), resume_offset=offset)
+    for i, prediction in enumerate(predictions[14:], 14):
+        resumed.add(i, *prediction)
+    resumed.close()
+
+    with open(path) as f, open(expected_path) as g:
+        lines = f.read()
+        assert lines == g.read()
+    assert [json.loads(line)['signal'] for line in lines.splitlines()] == ['net', 'armLeft', 'net', 'armLeft']
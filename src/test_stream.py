@@ -0,0 +1,71 @@
+import sys
+import time
+
+import numpy as np
+import pytest
+
+from utils.stream import LiveStream
+
+SIZE = (8, 6)
+NUM_FRAMES = 300
+
+
+def _fake_ffmpeg(tmp_path, num_frames=NUM_FRAMES, interval=0.001):
+    """Stand-in for ffmpeg: writes raw frames as fast as a live source, each filled with its index % 256"""
+    path = tmp_path / 'fake_ffmpeg'
+    path.write_text(f"#!{sys.executable}\n"
+                    "import sys, time\n"
+                    f"for i in range({num_frames}):\n"
+                    f"    sys.stdout.buffer.write(bytes([i % 256]) * {SIZE[0] * SIZE[1] * 3})\n"
+                    "    sys.stdout.buffer.flush()\n"
+                    f"    time.sleep({interval})\n")
+    path.chmod(0o755)
+    return str(path)
+
+
+def _consume_slowly(stream, delay=0.02):
+    received = []
+    for frame_index, frame, capture_time in stream.frames():
+        assert frame.shape == (SIZE[1], SIZE[0], 3) and np.all(frame == frame_index % 256)
+        received.append(frame_index)
+        time.sleep(delay)  # Inference slower than the stream
+    return received
+
+
+@pytest.mark.parametrize('max_queue, max_latency', [(2, 60.0), (1000, 0.05)])
+def test_slow_consumer_drops_frames(tmp_path, max_queue, max_latency):
+    # Dropped because the queue is full, or because the frames waited too long
+    stream = LiveStream('match.ts', SIZE, fps=25, max_queue=max_queue, max_latency=max_latency,
+                        ffmpeg=_fake_ffmpeg(tmp_path))
+    try:
+        received = _consume_slowly(stream)
+    finally:
+        stream.close()
+
+    stats = stream.stats()
+    assert stats['frames_read'] == NUM_FRAMES
+    # Frames were dropped instead of queued: the consumer only got a fraction of them
+    assert stats['frames_dropped'] == NUM_FRAMES - len(received) > NUM_FRAMES // 2
+    assert received == sorted(set(received))  # In order, no repeats
+    # The newest frame is always delivered, so the consumer ends on the last frame of the stream
+    assert received[-1] == NUM_FRAMES - 1
+
+
+def test_fast_consumer_gets_every_frame(tmp_path):
+    stream = LiveStream('match.ts', SIZE, fps=25, max_queue=50,
+                        ffmpeg=_fake_ffmpeg(tmp_path, num_frames=50, interval=0.005))
+    try:
+        received = _consume_slowly(stream, delay=0)
+    finally:
+        stream.close()
+    assert received == list(range(50)) and stream.stats()['frames_dropped'] == 0
+
+
+def test_ffmpeg_error_is_raised(tmp_path):
+    path = tmp_path / 'fake_ffmpeg'
+    path.write_text(f"#!{sys.executable}\nimport sys\nsys.stderr.write('Connection refused')\nsys.exit(1)\n")
+    path.chmod(0o755)
+    stream = LiveStream('rtsp://camera/live', SIZE, fps=25, ffmpeg=str(path))
+    with pytest.raises(RuntimeError, match=r'ffmpeg failed reading rtsp://camera/live \(1\): Connection refused'):
+        list(stream.frames())
+    stream.close()
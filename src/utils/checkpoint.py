@@ -0,0 +1,89 @@
+import json
+import os
+import pickle
+import shutil
+
+
+class VideoCheckpoint:
+    """
+    Progress of one video (or one frame range of it) kept next to its outputs so an interrupted
+    run can resume. `path` holds a JSON record (next frame to process, completed segments, the
+    output being written when the checkpoint was taken, ...) and `path`.state.pkl a pickle of the
+    stateful objects (tracker, smoothing) at that point. Both are replaced atomically.
+
+    A checkpoint only applies to the exact source file and range it was written for: if the
+    video's size or modification time changed, it is ignored and processing starts over.
+    """
+
+    def __init__(self, path, video_path, start_frame=0, end_frame=None):
+        self.path = path
+        self.state_path = path + '.state.pkl'
+        stat = os.stat(video_path)
+        self.source = {'video': os.path.basename(video_path), 'size': stat.st_size, 'mtime': stat.st_mtime,
+                       'start_frame': start_frame, 'end_frame': end_frame}
+        self.record = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Ignoring unreadable checkpoint {path}: {e}")
+                record = {}
+            if record.get('source') == self.source:
+                self.record = record
+
+    @property
+    def resumable(self):
+        """True when an earlier run of this exact video and range left progress behind"""
+        return bool(self.record)
+
+    @property
+    def done(self):
+        return self.record.get('done', False)
+
+    def get(self, key, default=None):
+        return self.record.get(key, default)
+
+    def save(self, state=None, **fields):
+        """Merges `fields` into the record and writes it, together with `state` when given"""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        if state is not None:
+            # The id ties the state to this record: after a crash between the two writes the
+            # record still points at the previous id and the newer state is ignored
+            fields['state_id'] = self.record.get('state_id', 0) + 1
+            self._replace(self.state_path, pickle.dumps({'id': fields['state_id'], 'state': state}))
+        self.record.update(fields, source=self.source)
+        self._replace(self.path, json.dumps(self.record, indent=2).encode())
+
+    def load_state(self):
+        """The state saved with the current record, or None"""
+        if 'state_id' not in self.record or not os.path.exists(self.state_path):
+            return None
+        with open(self.state_path, 'rb') as f:
+            saved = pickle.load(f)
+        return saved['state'] if saved['id'] == self.record['state_id'] else None
+
+    def discard_partial_output(self):
+        """Deletes the output that was still being written when the previous run stopped"""
+        partial = self.record.get('partial_output')
+        if partial and os.path.isdir(partial):
+            shutil.rmtree(partial, ignore_errors=True)
+        elif partial and os.path.exists(partial):
+            os.remove(partial)
+        if partial:
+            print(f"Removed incomplete output {partial}")
+
+    def remove(self):
+        for path in (self.path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.record = {}
+
+    @staticmethod
+    def _replace(path, data):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)  # A crash while saving leaves the previous checkpoint intact
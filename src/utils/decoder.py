@@ -0,0 +1,201 @@
+import collections
+import os
+import shutil
+import subprocess
+import threading
+
+import cv2
+import numpy as np
+
+REPO_FFMPEG = os.path.join(os.path.dirname(__file__), '..', '..', 'ffmpeg.exe')
+STDERR_TAIL_BYTES = 16 * 1024
+
+
+def find_ffmpeg():
+    """FFMPEG_BINARY environment variable, then ffmpeg on the PATH, then the binary shipped in the repo"""
+    return os.environ.get('FFMPEG_BINARY') or shutil.which('ffmpeg') or REPO_FFMPEG
+
+
+def probe_video(video_path):
+    """Returns (fps, total_frames, width, height) from the container metadata"""
+    cap = cv2.VideoCapture(video_path)
+    try:
+        fps = cap.get(cv2.CAP_PROP_FPS)
+        if fps <= 0: fps = 30  # Handle potential invalid FPS
+        return (fps, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+                int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    finally:
+        cap.release()
+
+
+class StderrTail:
+    """
+    Drains a subprocess' stderr pipe in a daemon thread, keeping only its last `max_bytes` for
+    error messages. Left undrained, a long run logging warnings fills the pipe buffer and blocks
+    the process.
+    """
+
+    def __init__(self, stream, max_bytes=STDERR_TAIL_BYTES):
+        self._stream = stream
+        self._chunks = collections.deque()
+        self._size = 0
+        self._max_bytes = max_bytes
+        self._thread = threading.Thread(target=self._drain, name='ffmpeg-stderr', daemon=True)
+        self._thread.start()
+
+    def _drain(self):
+        try:
+            for chunk in iter(lambda: self._stream.read1(4096), b''):
+                self._chunks.append(chunk)
+                self._size += len(chunk)
+                while self._size - len(self._chunks[0]) >= self._max_bytes:
+                    self._size -= len(self._chunks.popleft())
+        except (OSError, ValueError):  # Pipe closed
+            pass
+
+    def text(self, timeout=5):
+        """The tail of stderr, once the process has exited (or after `timeout` seconds)"""
+        self._thread.join(timeout)
+        return b''.join(self._chunks)[-self._max_bytes:].decode(errors='replace').strip()
+
+    def close(self):
+        self._thread.join(1)
+        self._stream.close()
+
+
+class OpenCVDecoder:
+    """
+    Decodes frames [start_frame, end_frame) with cv2.VideoCapture, yielding every `stride`-th one.
+    Skipped frames are grabbed but not converted; `size` resizes after decoding and `threads`
+    (0 = OpenCV's choice) is passed to its FFmpeg backend where supported.
+    """
+
+    def __init__(self, video_path, start_frame=0, end_frame=None, stride=1, size=None, threads=0):
+        self.video_path = video_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.stride = max(1, stride)
+        self.size = size
+        self.fps, self.total_frames, _, _ = probe_video(video_path)
+        if threads and hasattr(cv2, 'CAP_PROP_N_THREADS'):
+            self._cap = cv2.VideoCapture(video_path, cv2.CAP_ANY, [cv2.CAP_PROP_N_THREADS, threads])
+        else:
+            self._cap = cv2.VideoCapture(video_path)
+        if start_frame > 0:
+            self._cap.set(cv2.CAP_PROP_POS_FRAMES, start_frame)
+
+    def frames(self):
+        """Yields (frame_index, frame) pairs until end_frame or the end of the video"""
+        frame_index = self.start_frame
+        while self._cap.isOpened() and (self.end_frame is None or frame_index < self.end_frame):
+            if (frame_index - self.start_frame) % self.stride:
+                if not self._cap.grab():  # Demux and decode, but skip the colour conversion
+                    break
+                frame_index += 1
+                continue
+            ret, frame = self._cap.read()
+            if not ret:
+                break
+            if self.size is not None:
+                frame = cv2.resize(frame, self.size)
+            yield frame_index, frame
+            frame_index += 1
+
+    def close(self):
+        self._cap.release()
+
+
+class FFmpegDecoder:
+    """
+    Decodes frames [start_frame, end_frame) through an ffmpeg subprocess piping raw BGR frames.
+
+    Compared to cv2.VideoCapture it seeks with ffmpeg's input seeking (jump to the keyframe before
+    the start time, then decode up to it) instead of reading from the start, scales in the decoder
+    (`size`, so full-resolution frames never reach Python), drops all but every `stride`-th frame
+    before conversion, decodes with `threads` threads (0 = ffmpeg's choice) and can use a hardware
+    decoder (`hwaccel`, e.g. 'auto', 'cuda', 'qsv', 'd3d11va').
+    """
+
+    def __init__(self, video_path, start_frame=0, end_frame=None, stride=1, size=None, threads=0,
+                 hwaccel=None, ffmpeg=None):
+        self.video_path = video_path
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.stride = max(1, stride)
+        self.fps, self.total_frames, width, height = probe_video(video_path)
+        self.scale = size
+        self.size = size or (width, height)
+        self._process = None
+        self._stderr = None
+        self._command = self._build_command(ffmpeg or find_ffmpeg(), threads, hwaccel)
+
+    def _build_command(self, ffmpeg, threads, hwaccel):
+        command = [ffmpeg, '-hide_banner', '-loglevel', 'error', '-nostdin', '-threads', str(threads)]
+        if hwaccel:
+            command += ['-hwaccel', hwaccel]
+        if self.start_frame > 0:
+            command += ['-ss', f"{self.start_frame / self.fps:.6f}"]  # Before -i: keyframe seek
+        command += ['-i', self.video_path]
+
+        filters = []
+        if self.stride > 1:
+            filters.append(f"select=not(mod(n\\,{self.stride}))")
+        if self.scale:
+            filters.append(f"scale={self.scale[0]}:{self.scale[1]}")
+        if filters:
+            command += ['-vf', ','.join(filters)]
+        if self.end_frame is not None:
+            command += ['-frames:v', str(-(-(self.end_frame - self.start_frame) // self.stride))]
+        # passthrough keeps one output frame per selected input frame (no duplicates or drops)
+        command += ['-an', '-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+        return command
+
+    def frames(self):
+        """Yields (frame_index, frame) pairs until end_frame or the end of the video"""
+        width, height = self.size
+        if width <= 0 or height <= 0:  # Unreadable container: no frame size to split the stream by
+            raise RuntimeError(f"Could not read the frame size of {self.video_path}")
+        frame_bytes = width * height * 3
+        self._process = subprocess.Popen(self._command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                         bufsize=frame_bytes)
+        self._stderr = StderrTail(self._process.stderr)
+        frame_index = self.start_frame
+        while True:
+            buffer = bytearray(frame_bytes)  # A new buffer per frame, frames are used after the next read
+            if not self._read_exact(buffer):
+                break
+            yield frame_index, np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+            frame_index += self.stride
+        self._check_exit()
+
+    def _read_exact(self, buffer):
+        view = memoryview(buffer)
+        while view:
+            read = self._process.stdout.readinto(view)
+            if not read:
+                return False  # End of stream (a truncated last frame is dropped)
+            view = view[read:]
+        return True
+
+    def _check_exit(self):
+        returncode = self._process.wait()
+        if returncode != 0:
+            error = self._stderr.text()
+            raise RuntimeError(f"ffmpeg failed decoding {self.video_path} ({returncode}): {error}")
+
+    def close(self):
+        if self._process is not None and self._process.poll() is None:
+            self._process.kill()  # Stopped early (error or end_frame reached by the consumer)
+            self._process.wait()
+        if self._process is not None:
+            self._process.stdout.close()
+            self._stderr.close()
+
+
+def open_decoder(backend, video_path, start_frame=0, end_frame=None, stride=1, size=None, threads=0, hwaccel=None):
+    """Returns an 'opencv' or 'ffmpeg' decoder for frames [start_frame, end_frame) of a video"""
+    if backend == 'ffmpeg':
+        return FFmpegDecoder(video_path, start_frame, end_frame, stride, size, threads, hwaccel)
+    if backend == 'opencv':
+        return OpenCVDecoder(video_path, start_frame, end_frame, stride, size, threads)
+    raise ValueError(f"Unknown decoder backend: {backend}")
@@ -0,0 +1,157 @@
+import os
+import queue
+import subprocess
+import threading
+
+import cv2
+
+from utils.decoder import StderrTail, find_ffmpeg
+
+# Marks the end of the stream in an encoder queue
+_END = object()
+
+
+class OpenCVEncoder:
+    """cv2.VideoWriter with the mp4v codec (the original output format)"""
+
+    extension = '.mp4'
+
+    def __init__(self, output_path, fps, size):
+        self.output_path = output_path
+        self._writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+        if not self._writer.isOpened():
+            raise RuntimeError(f"Could not open video writer for {output_path}")
+
+    def write(self, frame, frame_index=None):
+        self._writer.write(frame)
+
+    def close(self):
+        self._writer.release()
+
+
+class ThreadedEncoder:
+    """
+    Base for encoders that do their work in a background thread: write() only queues the frame
+    (blocking once `queue_size` frames are waiting) and close() waits for the queue to drain.
+    An error in the thread is raised by the next write() or by close().
+    """
+
+    def __init__(self, queue_size=32, name='encoder'):
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def write(self, frame, frame_index=None):
+        if self._error is not None:
+            raise self._error
+        self._queue.put((frame_index, frame))
+
+    def _run(self):
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _END:
+                    break
+                self._encode(*item)
+        except BaseException as e:
+            self._error = e
+            # Keep draining so write() never blocks on a dead thread
+            while self._queue.get() is not _END:
+                pass
+
+    def _encode(self, frame_index, frame):
+        raise NotImplementedError
+
+    def _finish(self):
+        """Called from close() once the thread has encoded every queued frame"""
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_END)
+            self._thread.join()
+        self._finish()
+        if self._error is not None:
+            raise self._error
+
+
+class FFmpegEncoder(ThreadedEncoder):
+    """
+    Pipes raw BGR frames to an ffmpeg subprocess encoding with `codec` (e.g. 'libx264', 'libx265',
+    'h264_nvenc'), `preset` and `crf` (None leaves either to ffmpeg). Frames are written to the
+    pipe from the encoder thread, so encoding overlaps with inference.
+    """
+
+    extension = '.mp4'
+
+    def __init__(self, output_path, fps, size, codec='libx264', preset='veryfast', crf=23, threads=0,
+                 ffmpeg=None, queue_size=32):
+        self.output_path = output_path
+        self.size = size
+        command = [ffmpeg or find_ffmpeg(), '-hide_banner', '-loglevel', 'error', '-nostdin', '-y',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24', '-s', f"{size[0]}x{size[1]}", '-r', f"{fps:.6f}",
+                   '-i', 'pipe:0', '-an', '-c:v', codec, '-threads', str(threads)]
+        if preset:
+            command += ['-preset', preset]
+        if crf is not None:
+            command += ['-crf', str(crf)]
+        command += ['-pix_fmt', 'yuv420p', output_path]
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+        self._stderr = StderrTail(self._process.stderr)
+        super().__init__(queue_size, name='ffmpeg-encoder')
+
+    def _encode(self, frame_index, frame):
+        if frame.shape[1] != self.size[0] or frame.shape[0] != self.size[1]:
+            frame = cv2.resize(frame, self.size)
+        self._process.stdin.write(frame.tobytes())
+
+    def _finish(self):
+        try:
+            self._process.stdin.close()
+        except OSError:  # ffmpeg already exited; its error is reported below
+            pass
+        returncode = self._process.wait()
+        error = self._stderr.text()
+        self._stderr.close()
+        if returncode != 0:  # More useful than the BrokenPipeError the thread may have hit
+            self._error = RuntimeError(f"ffmpeg failed encoding {self.output_path} ({returncode}): {error}")
+
+
+class FrameDumpEncoder(ThreadedEncoder):
+    """
+    Writes every frame as an image into the `output_path` directory instead of a video
+    ({frame_index:07d}.jpg or .png), each with a YOLO label file next to it holding `label_line`
+    (an empty stub when None), ready to be reviewed and used as training data.
+    """
+
+    extension = ''
+
+    def __init__(self, output_path, fps=None, size=None, image_format='jpg', jpeg_quality=95, label_line=None,
+                 queue_size=32):
+        self.output_path = output_path
+        self.image_format = image_format
+        self.params = [cv2.IMWRITE_JPEG_QUALITY, jpeg_quality] if image_format == 'jpg' else []
+        self.label_line = label_line
+        self.frames_written = 0
+        os.makedirs(output_path, exist_ok=True)
+        super().__init__(queue_size, name='frame-dump-encoder')
+
+    def _encode(self, frame_index, frame):
+        if frame_index is None:
+            frame_index = self.frames_written
+        stem = os.path.join(self.output_path, f"{frame_index:07d}")
+        if not cv2.imwrite(f"{stem}.{self.image_format}", frame, self.params):
+            raise RuntimeError(f"Could not write {stem}.{self.image_format}")
+        with open(f"{stem}.txt", 'w') as f:
+            f.write(f"{self.label_line}\n" if self.label_line else '')
+        self.frames_written += 1
+
+
+ENCODERS = {'opencv': OpenCVEncoder, 'ffmpeg': FFmpegEncoder, 'frames': FrameDumpEncoder}
+
+
+def open_encoder(backend, output_path, fps, size, **options):
+    """Returns an 'opencv', 'ffmpeg' or 'frames' encoder; `options` go to the encoder class"""
+    if backend not in ENCODERS:
+        raise ValueError(f"Unknown encoder backend: {backend}")
+    return ENCODERS[backend](output_path, fps, size, **options)
@@ -0,0 +1,88 @@
+import cv2
+
+# Size of the grayscale thumbnail used for the cheap change checks
+THUMBNAIL_SIZE = (64, 36)
+HISTOGRAM_BINS = 32
+
+
+class MotionGate:
+    """
+    Decides which frames need a full referee detection.
+
+    Modes:
+        'stride'    -> detect every `stride` frames.
+        'diff'      -> detect when the mean absolute difference of a downscaled grayscale
+                       thumbnail against the last detected frame exceeds `threshold` (0-1).
+        'histogram' -> detect when the Bhattacharyya distance between thumbnail histograms
+                       exceeds `threshold` (0-1).
+    In the change-based modes `stride` is the maximum number of frames between two
+    detections, so the bbox is refreshed even on a perfectly static camera. Frames are
+    always detected while no bbox is known.
+    """
+
+    MODES = ('stride', 'diff', 'histogram')
+
+    def __init__(self, mode='stride', stride=5, threshold=0.02):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown adaptive mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        self.stride = max(1, int(stride))
+        self.threshold = threshold
+        self.reset()
+
+    def reset(self):
+        """Forgets the reference frame, bbox and skip counters (call at the start of each video)"""
+        self.frames_seen = 0
+        self.frames_detected = 0
+        self.last_bbox = None
+        self._reference = None
+        self._frames_since_detection = 0
+
+    def should_detect(self, frame):
+        """Returns True if the model has to run on this frame"""
+        self.frames_seen += 1
+        self._frames_since_detection += 1
+
+        signature = None
+        detect = self.last_bbox is None or self._frames_since_detection >= self.stride
+        if self.mode != 'stride':
+            if not detect and self._reference is not None:
+                signature = self._signature(frame)
+                detect = self._change(signature) > self.threshold
+            detect = detect or self._reference is None
+
+        if detect:
+            self.frames_detected += 1
+            self._frames_since_detection = 0
+            if self.mode != 'stride':
+                # Changes are measured against the last detected frame, so slow drift still triggers
+                self._reference = signature if signature is not None else self._signature(frame)
+        return detect
+
+    def update(self, bbox):
+        """Stores the bbox found on the last detected frame (None if there was no detection)"""
+        self.last_bbox = bbox
+
+    def _signature(self, frame):
+        thumbnail = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), THUMBNAIL_SIZE,
+                               interpolation=cv2.INTER_AREA)
+        if self.mode == 'histogram':
+            histogram = cv2.calcHist([thumbnail], [0], None, [HISTOGRAM_BINS], [0, 256])
+            return cv2.normalize(histogram, histogram)
+        return thumbnail
+
+    def _change(self, signature):
+        if self.mode == 'histogram':
+            return cv2.compareHist(self._reference, signature, cv2.HISTCMP_BHATTACHARYYA)
+        return float(cv2.absdiff(self._reference, signature).mean()) / 255.0
+
+    @property
+    def skip_ratio(self):
+        """Fraction of frames that reused the previous bbox instead of running the model"""
+        if self.frames_seen == 0:
+            return 0.0
+        return 1.0 - self.frames_detected / self.frames_seen
+
+    def report(self):
+        return (f"Adaptive inference ({self.mode}): detected {self.frames_detected}/{self.frames_seen} frames, "
+                f"skip ratio {self.skip_ratio:.1%}")
@@ -0,0 +1,93 @@
+import queue
+import threading
+
+# Marks the end of a stream inside a stage queue
+_END = object()
+
+
+class PipelineStage(threading.Thread):
+    """Daemon thread that runs one pipeline stage and records any exception it raises"""
+
+    def __init__(self, target, name, stop_event):
+        super().__init__(name=name, daemon=True)
+        self._stage_fn = target
+        self.stop_event = stop_event
+        self.error = None
+
+    def run(self):
+        try:
+            self._stage_fn()
+        except BaseException as e:  # Surfaced to the caller by run_pipeline
+            self.error = e
+            self.stop_event.set()
+
+
+def put_item(q, item, stop_event, poll_interval=0.1):
+    """Blocking put that gives up once the pipeline is stopping (backpressure without deadlocks)"""
+    while not stop_event.is_set():
+        try:
+            q.put(item, timeout=poll_interval)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def iter_queue(q, stop_event, poll_interval=0.1):
+    """Yields items from a stage queue until the end marker arrives or the pipeline stops"""
+    while True:
+        try:
+            item = q.get(timeout=poll_interval)
+        except queue.Empty:
+            if stop_event.is_set():
+                return
+            continue
+        if item is _END:
+            return
+        yield item
+
+
+def run_pipeline(source, transform, sink, queue_size=16):
+    """
+    Runs source -> transform -> sink as three concurrent stages connected by bounded queues.
+
+    `source` is iterated in a producer thread, `transform(iterable)` runs in the calling
+    thread (so models stay on the thread that loaded them) and `sink(item)` is called in a
+    consumer thread. Items keep their order end to end. The first exception raised by any
+    stage stops the others and is re-raised here once every thread has exited.
+    """
+    stop_event = threading.Event()
+    input_queue = queue.Queue(maxsize=queue_size)
+    output_queue = queue.Queue(maxsize=queue_size)
+
+    def produce():
+        for item in source:
+            if not put_item(input_queue, item, stop_event):
+                return
+        put_item(input_queue, _END, stop_event)
+
+    def consume():
+        for item in iter_queue(output_queue, stop_event):
+            sink(item)
+
+    producer = PipelineStage(produce, 'pipeline-decode', stop_event)
+    consumer = PipelineStage(consume, 'pipeline-encode', stop_event)
+    producer.start()
+    consumer.start()
+    try:
+        for item in transform(iter_queue(input_queue, stop_event)):
+            if not put_item(output_queue, item, stop_event):
+                break
+        put_item(output_queue, _END, stop_event)
+    except BaseException:
+        stop_event.set()
+        raise
+    finally:
+        consumer.join()
+        # Releases a producer still blocked on a full input queue (transform stopped early)
+        stop_event.set()
+        producer.join()
+
+    for stage in (producer, consumer):
+        if stage.error is not None:
+            raise stage.error
@@ -0,0 +1,76 @@
+import cv2
+import numpy as np
+import torch
+
+LETTERBOX_COLOR = (114, 114, 114)  # Same padding value ultralytics uses
+
+
+class FramePreprocessor:
+    """
+    Turns BGR frames into a normalised BCHW model batch without per-frame allocations.
+
+    Frames are resized straight into a reusable uint8 buffer, colour-swapped in place and
+    copied once into a preallocated float batch (pinned when running on CUDA so the host to
+    device copy can be asynchronous). With letterbox=True the aspect ratio is kept and the
+    frame is padded; to_frame_coords() maps model boxes back to frame pixels in both modes.
+    """
+
+    def __init__(self, size, device='cpu', half=False, letterbox=False, max_batch=1):
+        self.size = size
+        self.device = device
+        self.dtype = torch.float16 if half else torch.float32
+        self.letterbox = letterbox
+        self._bgr = np.empty((size, size, 3), dtype=np.uint8)
+        self._rgb = np.empty((size, size, 3), dtype=np.uint8)
+        self._rgb_chw = torch.from_numpy(self._rgb).permute(2, 0, 1)  # View, no copy
+        self._padded_shape = None  # Frame shape the letterbox padding was last painted for
+        self._batch = None
+        self._allocate(max_batch)
+
+    def _allocate(self, batch_size):
+        pin = self.device != 'cpu' and torch.cuda.is_available()
+        self._batch = torch.empty((batch_size, 3, self.size, self.size), dtype=torch.float32, pin_memory=pin)
+
+    def __call__(self, frames):
+        """Returns a (len(frames), 3, size, size) tensor on the target device"""
+        if len(frames) > self._batch.shape[0]:
+            self._allocate(len(frames))
+        batch = self._batch[:len(frames)]
+        for i, frame in enumerate(frames):
+            self._fill(batch[i], frame)
+        batch.mul_(1.0 / 255.0)
+        if self.device == 'cpu':
+            return batch if self.dtype == torch.float32 else batch.to(self.dtype)
+        # Pinned source memory makes this copy asynchronous; the model call that follows syncs
+        return batch.to(self.device, dtype=self.dtype, non_blocking=True)
+
+    def _fill(self, out, frame):
+        h, w = frame.shape[:2]
+        if self.letterbox:
+            scale, pad_x, pad_y = self._letterbox_params(h, w)
+            new_w, new_h = round(w * scale), round(h * scale)
+            # Resizing only writes the inner region, so the padding is painted once per frame shape
+            if self._padded_shape != (h, w):
+                self._bgr[:] = LETTERBOX_COLOR
+                self._padded_shape = (h, w)
+            cv2.resize(frame, (new_w, new_h), dst=self._bgr[pad_y:pad_y + new_h, pad_x:pad_x + new_w],
+                       interpolation=cv2.INTER_LINEAR)
+        else:
+            cv2.resize(frame, (self.size, self.size), dst=self._bgr)
+        cv2.cvtColor(self._bgr, cv2.COLOR_BGR2RGB, dst=self._rgb)
+        out.copy_(self._rgb_chw)  # HWC uint8 -> CHW float in a single copy
+
+    def _letterbox_params(self, h, w):
+        scale = min(self.size / h, self.size / w)
+        new_w, new_h = round(w * scale), round(h * scale)
+        return scale, (self.size - new_w) // 2, (self.size - new_h) // 2
+
+    def to_frame_coords(self, xyxy, frame_shape):
+        """Maps an (x1, y1, x2, y2) box in model input pixels back to frame pixels"""
+        h, w = frame_shape[:2]
+        x1, y1, x2, y2 = xyxy
+        if self.letterbox:
+            scale, pad_x, pad_y = self._letterbox_params(h, w)
+            return ((x1 - pad_x) / scale, (y1 - pad_y) / scale,
+                    (x2 - pad_x) / scale, (y2 - pad_y) / scale)
+        return x1 * w / self.size, y1 * h / self.size, x2 * w / self.size, y2 * h / self.size
@@ -0,0 +1,179 @@
+import json
+import os
+from collections import deque
+
+
+class SignalAggregator:
+    """
+    Streaming temporal smoothing of per-frame signal predictions into debounced events.
+
+    Every class keeps a score: an exponential moving average of its per-frame confidence
+    (mode='ema') or its share of the last `window` predictions (mode='vote'); mode=None scores
+    each frame on its own prediction only. The best class scoring at least `threshold` is the
+    frame's smoothed signal. An event opens once the same smoothed signal holds for `min_frames`
+    updates and closes once a different one (or none) has held for `min_frames` updates, or when
+    more than `max_gap` frames pass without an update. Its frame range and confidences come from
+    the frames where the model actually predicted the signal, so smoothing doesn't stretch events.
+    """
+
+    def __init__(self, fps, classes=(), mode=None, window=5, alpha=0.5, threshold=0.0, min_frames=1, max_gap=1):
+        self.fps = fps
+        self.classes = list(classes)
+        self.mode = mode
+        self.window = window
+        self.alpha = alpha
+        self.threshold = threshold
+        self.min_frames = max(1, min_frames)
+        self.max_gap = max_gap
+        self.reset()
+
+    def reset(self):
+        self._scores = {c: 0.0 for c in self.classes}
+        self._votes = deque(maxlen=self.window)
+        self._history = deque(maxlen=self.min_frames + self.window)  # Recent (frame, signal, confidence)
+        self._streak_signal, self._streak, self._streak_start = None, 0, None
+        self._run_signal, self._run_start = None, None  # Current run of identical raw predictions
+        self._active = None
+        self._last_frame = None
+
+    @property
+    def confirmed(self):
+        """The signal of the open event, or None"""
+        return self._active['signal'] if self._active else None
+
+    def update(self, frame_index, signal, confidence):
+        """Adds the prediction for one frame (signal=None for no detection); returns the events it closed"""
+        finished = []
+        if self._last_frame is not None and frame_index - self._last_frame > self.max_gap:
+            finished.extend(self.flush())
+        self._last_frame = frame_index
+        self._history.append((frame_index, signal, confidence))
+        if signal != self._run_signal:
+            self._run_signal, self._run_start = signal, frame_index
+
+        smoothed = self._smoothed_signal(signal, confidence)
+        if smoothed == self._streak_signal:
+            self._streak += 1
+        else:
+            self._streak_signal, self._streak, self._streak_start = smoothed, 1, frame_index
+
+        active = self._active
+        if active is not None:
+            if signal == active['signal']:
+                self._add_support(active, frame_index, confidence)
+            if smoothed != active['signal'] and self._streak >= self.min_frames:
+                finished.append(self._close())
+        if self._active is None and smoothed is not None and self._streak >= self.min_frames:
+            self._open(smoothed)
+        return finished
+
+    def flush(self):
+        """Closes the open event (end of video or of a gap) and forgets the smoothing state"""
+        finished = [self._close()] if self._active else []
+        self.reset()
+        return finished
+
+    def _smoothed_signal(self, signal, confidence):
+        if self.mode == 'ema':
+            for c in set(self._scores) | {signal}:
+                if c is not None:
+                    observed = confidence if c == signal else 0.0
+                    self._scores[c] = (1 - self.alpha) * self._scores.get(c, 0.0) + self.alpha * observed
+            scores = self._scores
+        elif self.mode == 'vote':
+            self._votes.append(signal)
+            scores = {c: self._votes.count(c) / self.window for c in set(self._votes) if c is not None}
+        else:
+            scores = {signal: confidence} if signal is not None else {}
+        if not scores:
+            return None
+        best = max(scores, key=scores.get)
+        return best if scores[best] >= self.threshold and scores[best] > 0 else None
+
+    def _open(self, signal):
+        # Start at the first raw prediction of the signal, which the smoothed score lags behind
+        start = self._streak_start
+        if self._run_signal == signal:
+            start = min(start, self._run_start)
+        event = {'signal': signal, 'start_frame': None, 'end_frame': None,
+                 'peak': 0.0, 'confidence_sum': 0.0, 'frames': 0}
+        for frame_index, predicted, confidence in self._history:
+            if predicted == signal and frame_index >= start:
+                self._add_support(event, frame_index, confidence)
+        if event['frames'] == 0:  # Smoothing can confirm a signal on a frame that didn't predict it
+            event['start_frame'] = event['end_frame'] = self._streak_start
+        self._active = event
+
+    @staticmethod
+    def _add_support(event, frame_index, confidence):
+        if event['start_frame'] is None:
+            event['start_frame'] = frame_index
+        event['end_frame'] = frame_index
+        event['peak'] = max(event['peak'], confidence)
+        event['confidence_sum'] += confidence
+        event['frames'] += 1
+
+    def _close(self):
+        event, self._active = self._active, None
+        return {
+            'signal': event['signal'],
+            'start_frame': event['start_frame'],
+            'end_frame': event['end_frame'],
+            'start_time': round(event['start_frame'] / self.fps, 3),
+            'end_time': round((event['end_frame'] + 1) / self.fps, 3),
+            'confidence': round(event['peak'], 4),
+            'mean_confidence': round(event['confidence_sum'] / event['frames'], 4) if event['frames'] else 0.0,
+            'frames': event['frames'],
+        }
+
+
+class SignalEventLog:
+    """
+    Feeds per-frame signal predictions to a SignalAggregator and appends the events it produces
+    to a JSON Lines file. Each event is written (and flushed) as soon as it ends, so the log can
+    be followed while a video is still being processed. Without an aggregator, consecutive frames
+    with the same prediction form one event. `resume_offset` continues an existing log, dropping
+    anything written after that byte offset (events logged after the last checkpoint).
+    """
+
+    def __init__(self, path, fps, video=None, aggregator=None, resume_offset=None):
+        self.path = path
+        self.video = video
+        self.aggregator = aggregator or SignalAggregator(fps)
+        self.events = []
+        self._file = None
+        if path and resume_offset is not None and os.path.exists(path):
+            self._file = open(path, 'r+')
+            self._file.truncate(resume_offset)
+            self._file.seek(resume_offset)
+        elif path:
+            self._file = open(path, 'w')
+
+    @property
+    def offset(self):
+        """Bytes written to the log so far"""
+        return self._file.tell() if self._file else 0
+
+    @property
+    def confirmed(self):
+        return self.aggregator.confirmed
+
+    def add(self, frame_index, signal, confidence):
+        """Records the prediction for one frame (signal=None when nothing was detected)"""
+        for event in self.aggregator.update(frame_index, signal, confidence):
+            self._write(event)
+
+    def _write(self, event):
+        event = {'video': self.video, **event}
+        self.events.append(event)
+        if self._file:
+            self._file.write(json.dumps(event) + '\n')
+            self._file.flush()
+
+    def close(self):
+        """Ends the open event (if any) and closes the file"""
+        for event in self.aggregator.flush():
+            self._write(event)
+        if self._file:
+            self._file.close()
+            self._file = None
@@ -0,0 +1,182 @@
+import collections
+import json
+import os
+import subprocess
+import threading
+import time
+
+import numpy as np
+
+from utils.decoder import StderrTail, find_ffmpeg, probe_video
+
+STREAM_PROTOCOLS = ('rtsp://', 'rtsps://', 'rtmp://', 'http://', 'https://', 'udp://', 'tcp://', 'srt://')
+
+
+def is_pipe(source):
+    return source in ('-', 'pipe:', 'pipe:0')
+
+
+class LiveStream:
+    """
+    Decodes a live source with an ffmpeg subprocess in a background thread and hands the consumer
+    the newest frames, so a slow consumer never makes the stream fall behind.
+
+    `source` is a stream URL (RTSP, HLS .m3u8, RTMP, UDP, SRT...), '-' for frames piped to stdin
+    or a file: `follow` keeps reading a file that is still being written (a streamable container
+    such as .ts or fragmented .mp4) until nothing is appended for `follow_timeout` seconds, and
+    `realtime` replays it at its native frame rate instead of as fast as it decodes (to test the
+    live path on a recorded match). Frames are scaled to `size` by the decoder.
+
+    At most `max_queue` frames wait for the consumer; when another one arrives the oldest is
+    dropped, and frames that waited longer than `max_latency` seconds are dropped when read
+    (the newest one is always kept). Frame indices count every decoded frame, dropped or not,
+    so frame_index / fps stays the stream time.
+    """
+
+    def __init__(self, source, size=(1280, 720), fps=None, realtime=False, follow=False, follow_timeout=10.0,
+                 max_queue=2, max_latency=0.5, ffmpeg=None):
+        self.source = source
+        self.size = tuple(size)
+        self.fps = fps or (probe_video(source)[0] if not is_pipe(source) else 30)
+        self.name = 'stdin' if is_pipe(source) else os.path.splitext(os.path.basename(source.rstrip('/')))[0] or 'stream'
+        self.max_latency = max_latency
+        self.frames_read = 0
+        self.frames_dropped = 0
+        self.error = None
+        self._frames = collections.deque(maxlen=max(1, max_queue))
+        self._condition = threading.Condition()
+        self._finished = False
+        self._command = self._build_command(ffmpeg or find_ffmpeg(), realtime, follow, follow_timeout)
+        self._process = None
+        self._stderr = None
+        self._thread = None
+
+    def _build_command(self, ffmpeg, realtime, follow, follow_timeout):
+        command = [ffmpeg, '-hide_banner', '-loglevel', 'error']
+        if not is_pipe(self.source):
+            command.append('-nostdin')
+        if self.source.startswith(STREAM_PROTOCOLS):
+            # Don't buffer network input ahead of decoding (with files and pipes it loses the first packets)
+            command += ['-fflags', 'nobuffer']
+        if self.source.startswith(('rtsp://', 'rtsps://')):
+            command += ['-rtsp_transport', 'tcp']
+        if realtime:
+            command.append('-re')
+        source = self.source
+        if is_pipe(source):
+            source = 'pipe:0'
+        elif follow and not source.startswith(STREAM_PROTOCOLS):
+            command += ['-follow', '1', '-rw_timeout', str(int(follow_timeout * 1e6))]
+            source = f"file:{source}"
+        command += ['-i', source, '-vf', f"scale={self.size[0]}:{self.size[1]}",
+                    '-an', '-fps_mode', 'passthrough', '-f', 'rawvideo', '-pix_fmt', 'bgr24', 'pipe:1']
+        return command
+
+    def start(self):
+        width, height = self.size
+        self._process = subprocess.Popen(self._command, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                         stdin=None if is_pipe(self.source) else subprocess.DEVNULL,
+                                         bufsize=width * height * 3)
+        self._stderr = StderrTail(self._process.stderr)  # Drained, so decode warnings can't stall the stream
+        self._thread = threading.Thread(target=self._read, name='stream-reader', daemon=True)
+        self._thread.start()
+        return self
+
+    def _read(self):
+        width, height = self.size
+        frame_bytes = width * height * 3
+        try:
+            while True:
+                buffer = bytearray(frame_bytes)
+                view = memoryview(buffer)
+                while view:
+                    read = self._process.stdout.readinto(view)
+                    if not read:
+                        return
+                    view = view[read:]
+                frame = np.frombuffer(buffer, dtype=np.uint8).reshape(height, width, 3)
+                with self._condition:
+                    if len(self._frames) == self._frames.maxlen:
+                        self.frames_dropped += 1  # Consumer fell behind: the deque drops the oldest
+                    self._frames.append((self.frames_read, frame, time.time()))
+                    self.frames_read += 1
+                    self._condition.notify()
+        except (OSError, ValueError) as e:  # Pipe closed by close()
+            self.error = e
+        finally:
+            returncode = self._process.wait()
+            if returncode not in (0, None) and self.error is None and not self._finished:
+                message = self._stderr.text()
+                self.error = RuntimeError(f"ffmpeg failed reading {self.source} ({returncode}): {message}")
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def frames(self):
+        """Yields (frame_index, frame, capture_time) with the newest frames until the stream ends"""
+        if self._process is None:
+            self.start()
+        while True:
+            with self._condition:
+                while not self._frames and not self._finished:
+                    self._condition.wait()
+                if not self._frames:
+                    break
+                now = time.time()
+                while len(self._frames) > 1 and now - self._frames[0][2] > self.max_latency:
+                    self._frames.popleft()
+                    self.frames_dropped += 1
+                item = self._frames.popleft()
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    def stats(self):
+        with self._condition:
+            return {'frames_read': self.frames_read, 'frames_dropped': self.frames_dropped,
+                    'drop_ratio': round(self.frames_dropped / self.frames_read, 4) if self.frames_read else 0.0}
+
+    def close(self):
+        with self._condition:
+            self._finished = True
+            self._condition.notify_all()
+        if self._process is not None:
+            if self._process.poll() is None:
+                self._process.kill()
+            if self._thread is not None:
+                self._thread.join()
+            self._process.stdout.close()
+            self._stderr.close()
+
+
+class LiveEventLog:
+    """
+    Appends live detections (referee boxes, signal starts and finished signal events) to a JSON
+    Lines file as they happen, each with its end-to-end latency: from the moment the frame it
+    comes from was read from the stream to the moment the event is emitted. `on_event` is called
+    with every event as well, e.g. to push it to a scoreboard or a websocket.
+    """
+
+    def __init__(self, path, on_event=None):
+        self.path = path
+        self.on_event = on_event
+        self.counts = collections.Counter()
+        self._file = open(path, 'a') if path else None
+
+    def emit(self, event, capture_time):
+        """Writes one event; returns its latency in seconds"""
+        now = time.time()
+        latency = now - capture_time
+        event = {**event, 'latency_ms': round(latency * 1000, 1), 'emitted_at': round(now, 3)}
+        self.counts[event['type']] += 1
+        if self._file:
+            self._file.write(json.dumps(event) + '\n')
+            self._file.flush()
+        if self.on_event is not None:
+            self.on_event(event)
+        return latency
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None